@@ -5,9 +5,113 @@ class Settings(BaseSettings):
     SQLDB_URL: str
     SECRET_KEY: str = "secret"
 
-    ACCESS_TOKEN_EXPIRE_MINUTES: int = 5 * 60  # 5 minutes
+    DB_ECHO: bool = False
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30
+    DB_POOL_RECYCLE: int = 30 * 60  # 30 minutes
+    DB_POOL_PRE_PING: bool = True
+    # asyncpg prepared statement cache, set 0 behind pgbouncer transaction pooling
+    DB_STATEMENT_CACHE_SIZE: int = 100
+
+    # Read-only replicas for the listing and detail routes, used round-robin
+    # while healthy; reads go to the primary when none is. Set as a JSON list.
+    SQLDB_REPLICA_URLS: list[str] = []
+    REPLICA_HEALTH_CHECK_SECONDS: float = 5
+    # How long a read waits for a replica connection before trying the next
+    REPLICA_CONNECT_TIMEOUT_SECONDS: float = 2
+    # PostgreSQL replicas replaying further behind than this are skipped
+    REPLICA_MAX_LAG_SECONDS: float = 10
+    # Reads of a client that wrote within this many seconds go to the
+    # primary, so it sees its own writes; 0 turns pinning off
+    READ_YOUR_WRITES_SECONDS: float = 5
+
+    # Wallets with their ledger, transactions with their sales rollups, and
+    # idempotency keys live on one of these databases, chosen by a jump hash
+    # of the owning user id; users, merchants and items stay on SQLDB_URL.
+    # Set as a JSON list; empty keeps everything on SQLDB_URL. Change it
+    # only with the app stopped, running scripts/rebalance-shards.py.
+    SQLDB_SHARD_URLS: list[str] = []
+    # Ids of sharded rows are reserved from SQLDB_URL this many at a time
+    SHARD_ID_BLOCK_SIZE: int = 1000
+    # Cross-shard merchant credits still pending after this long are retried
+    SHARD_TRANSFER_RETRY_SECONDS: float = 30
+
+    # Striped wallets, switched on per wallet with PUT /admin/wallets/{id}/stripes,
+    # take sales on one of up to this many sub-balance rows so concurrent
+    # purchases from a hot merchant do not queue on its wallet row
+    WALLET_MAX_STRIPES: int = 64
+    # How often the stripes are folded back into wallet balances and the
+    # ledger; set it before striping a wallet. 0, the default, runs no
+    # compactor and leaves it to scripts/compact-wallet-stripes.py
+    WALLET_STRIPE_COMPACT_SECONDS: float = 0
+
+    # Users allowed on the /admin routes; set as a JSON list of user ids
+    ADMIN_USER_IDS: set[int] = set()
+
+    ACCESS_TOKEN_EXPIRE_MINUTES: int = 5 * 60  # 5 hours
     REFRESH_TOKEN_EXPIRE_MINUTES: int = 7 * 24 * 60  # 7 days
 
+    # Write a balance snapshot every N ledger entries of a wallet
+    LEDGER_SNAPSHOT_INTERVAL: int = 1000
+
+    # Idempotency-Key responses are replayed for this long; a request still
+    # running after the lock timeout is presumed dead and may be retried
+    IDEMPOTENCY_TTL_SECONDS: int = 24 * 3600
+    IDEMPOTENCY_LOCK_SECONDS: int = 30
+    # How long a duplicate waits for a request running in another worker
+    IDEMPOTENCY_WAIT_SECONDS: float = 5
+
+    # Rows validated and inserted per transaction by POST /items/bulk
+    ITEM_IMPORT_BATCH_SIZE: int = 1000
+
+    # Rows fetched from the server-side cursor per chunk of /transections/export
+    EXPORT_BATCH_SIZE: int = 1000
+
+    # Per-route latency and status counts served on /metrics
+    METRICS_ENABLED: bool = True
+    # Also count queries and their time per route. Off by default: it puts
+    # a 7-query request such as /buy over the 50µs metrics budget. It shares
+    # the cursor event listeners of SLOW_QUERY_LOG, which make SQLAlchemy
+    # take a slower path of roughly 20µs per query, and pays that alone
+    # when the slow query log is off.
+    METRICS_QUERY_EVENTS: bool = False
+
+    # Statements at or over the threshold are logged and aggregated per
+    # fingerprint on /admin/slow-queries; faster ones are aggregated for a
+    # sample of executions
+    SLOW_QUERY_LOG: bool = True
+    SLOW_QUERY_THRESHOLD_MS: float = 100
+    SLOW_QUERY_SAMPLE_RATE: float = 0.01
+    SLOW_QUERY_MAX_FINGERPRINTS: int = 1000
+    # Keep the parameters of each fingerprint's slowest execution so it can
+    # be EXPLAINed; off by default because they may hold personal data
+    SLOW_QUERY_EXPLAIN: bool = False
+
+    # Routers whose list responses are validated once and serialized by
+    # pydantic-core instead of going through FastAPI's response model.
+    # Item lists are served from a cache that serializes them once, so
+    # the fast mode gains them nothing measurable.
+    FAST_JSON_ROUTERS: set[str] = {"transactions", "wallets"}
+
+    # Authenticated user snapshots kept per worker by deps.get_current_user
+    AUTH_CACHE_SIZE: int = 10_000
+    AUTH_CACHE_TTL_SECONDS: float = 60
+
+    # Serialized item and item list responses kept per worker
+    ITEM_CACHE_SIZE: int = 10_000
+    ITEM_LIST_CACHE_SIZE: int = 1_000
+    ITEM_CACHE_TTL_SECONDS: float = 30
+
+    # bcrypt work factor; stored hashes with another cost are upgraded on login
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 4
+
+    # Use PostgreSQL planner statistics instead of the item counter table
+    # once the catalog is larger than the threshold
+    ITEM_COUNT_APPROXIMATE: bool = False
+    ITEM_COUNT_APPROXIMATE_THRESHOLD: int = 1_000_000
+
     model_config = SettingsConfigDict(
         env_file=".env", validate_assignment=True, extra="allow"
     )
@@ -0,0 +1,79 @@
+from sqlalchemy import text
+from sqlmodel import delete, func, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from . import config
+from . import models
+
+
+settings = config.get_settings()
+
+
+async def adjust_item_count(session: AsyncSession, merchant_id: int, delta: int):
+    """Add ``delta`` to the global and the merchant item counters.
+
+    Runs inside the caller's transaction so the counters commit together with
+    the item rows they describe.
+    """
+    insert = models.dialect_insert(session)
+    statement = insert(models.DBItemCounter).values(
+        [
+            dict(merchant_id=models.GLOBAL_COUNTER_ID, count=delta),
+            dict(merchant_id=merchant_id, count=delta),
+        ]
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=[models.DBItemCounter.merchant_id],
+        set_=dict(count=models.DBItemCounter.count + statement.excluded.count),
+    )
+    await session.exec(statement)
+
+
+async def read_item_count(session: AsyncSession, merchant_id: int | None = None) -> int:
+    if (
+        merchant_id is None
+        and settings.ITEM_COUNT_APPROXIMATE
+        and session.bind.dialect.name == "postgresql"
+    ):
+        estimate = await _estimate_item_count(session)
+        if estimate >= settings.ITEM_COUNT_APPROXIMATE_THRESHOLD:
+            return estimate
+
+    counter_id = models.GLOBAL_COUNTER_ID if merchant_id is None else merchant_id
+    result = await session.exec(
+        select(models.DBItemCounter.count).where(
+            models.DBItemCounter.merchant_id == counter_id
+        )
+    )
+    return result.first() or 0
+
+
+async def _estimate_item_count(session: AsyncSession) -> int:
+    # reltuples is maintained by VACUUM/ANALYZE and is -1 until the first run
+    result = await session.exec(
+        text("SELECT reltuples::bigint FROM pg_class WHERE oid = CAST(:table AS regclass)"),
+        params=dict(table=models.DBItem.__tablename__),
+    )
+    return result.scalar() or -1
+
+
+async def rebuild_item_counters(session: AsyncSession):
+    """Recompute every item counter from the items table."""
+    result = await session.exec(
+        select(models.DBItem.merchant_id, func.count(models.DBItem.id)).group_by(
+            models.DBItem.merchant_id
+        )
+    )
+    counts = dict(result.all())
+
+    await session.exec(delete(models.DBItemCounter))
+    session.add(
+        models.DBItemCounter(
+            merchant_id=models.GLOBAL_COUNTER_ID, count=sum(counts.values())
+        )
+    )
+    for merchant_id, count in counts.items():
+        if merchant_id is None:
+            continue
+        session.add(models.DBItemCounter(merchant_id=merchant_id, count=count))
+    await session.commit()
@@ -1,50 +1,164 @@
-from fastapi import Depends, HTTPException, status, Path, Query
+from fastapi import Depends, HTTPException, Request, status, Path, Query
 from fastapi.security import OAuth2PasswordBearer
 
+import logging
 import typing
 import jwt
 
 from pydantic import ValidationError
+from sqlmodel import select
 
+from . import caching
 from . import models
+from . import replicas
 from . import security
 from . import config
 
 
+logger = logging.getLogger(__name__)
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/token")
 
 settings = config.get_settings()
 
+# user id -> models.User, invalidated by the handlers that change users
+user_cache = caching.TTLCache(
+    "users", settings.AUTH_CACHE_SIZE, settings.AUTH_CACHE_TTL_SECONDS
+)
 
-async def get_current_user(
-    token: typing.Annotated[str, Depends(oauth2_scheme)],
-    session: typing.Annotated[models.AsyncSession, Depends(models.get_session)],
-) -> models.User:
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+
+credentials_exception = HTTPException(
+    status_code=status.HTTP_401_UNAUTHORIZED,
+    detail="Could not validate credentials",
+    headers={"WWW-Authenticate": "Bearer"},
+)
+
+
+def decode_token(token: str) -> dict:
     try:
         payload = jwt.decode(
             token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
         )
-        user_id: int = payload.get("sub")
-
-        if user_id is None:
-            raise credentials_exception
+    except jwt.PyJWTError as e:
+        logger.debug("rejected token: %s", e)
+        raise credentials_exception
 
-    except jwt.JWTError as e:
-        print(e)
+    if payload.get("sub") is None:
         raise credentials_exception
 
-    user = await session.get(models.DBUser, user_id)
+    return payload
+
+
+async def resolve_token_claims(
+    session: models.AsyncSession, user_id: int, role: models.UserRole
+) -> models.TokenClaims:
+    customer_id = (
+        select(models.DBCustomer.id)
+        .where(models.DBCustomer.user_id == user_id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    merchant_id = (
+        select(models.DBMerchant.id)
+        .where(models.DBMerchant.user_id == user_id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    wallet_id = (
+        select(models.DBWallet.id)
+        .where(models.DBWallet.user_id == user_id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    if models.sharded():
+        result = await session.exec(select(customer_id, merchant_id))
+        customer_id, merchant_id = result.one()
+        async with models.shard_session(user_id) as shard:
+            wallet_id = (await shard.exec(select(wallet_id))).one()
+    else:
+        result = await session.exec(select(customer_id, merchant_id, wallet_id))
+        customer_id, merchant_id, wallet_id = result.one()
+
+    return models.TokenClaims(
+        user_id=user_id,
+        role=role,
+        customer_id=customer_id,
+        merchant_id=merchant_id,
+        wallet_id=wallet_id,
+    )
+
+
+async def load_user(session: models.AsyncSession, user_id: int) -> models.User:
+    """The user behind a token, from ``user_cache`` or the database."""
+    user = user_cache.get(user_id)
     if user is None:
-        raise credentials_exception
+        dbuser = await session.get(models.DBUser, user_id)
+        if dbuser is None:
+            raise credentials_exception
+
+        user = models.User.model_validate(dbuser)
+        user_cache.set(user_id, user)
 
     return user
 
 
+async def get_current_user(
+    token: typing.Annotated[str, Depends(oauth2_scheme)],
+    session: typing.Annotated[models.AsyncSession, Depends(models.get_session)],
+) -> models.User:
+    return await load_user(session, decode_token(token)["sub"])
+
+
+async def get_token_claims(
+    token: typing.Annotated[str, Depends(oauth2_scheme)],
+    session: typing.Annotated[models.AsyncSession, Depends(models.get_session)],
+) -> models.TokenClaims:
+    """Role and owning-entity ids signed into the access token.
+
+    The user is still looked up, through ``user_cache``, so the token of a
+    deleted user stops working; on other workers once their cached entry
+    expires. Tokens issued before these claims existed only carry ``sub``;
+    for those the claims are looked up once per request instead.
+    """
+    payload = decode_token(token)
+    user = await load_user(session, payload["sub"])
+    if "role" in payload:
+        return models.TokenClaims(user_id=payload["sub"], **payload)
+
+    return await resolve_token_claims(session, user.id, user.role)
+
+
+async def get_shard_session(
+    claims: typing.Annotated[models.TokenClaims, Depends(get_token_claims)],
+    session: typing.Annotated[models.AsyncSession, Depends(models.get_session)],
+) -> typing.AsyncIterator[models.AsyncSession]:
+    """Session for writing the caller's wallet and transactions.
+
+    The request session unless sharded, then one on the caller's shard.
+    """
+    async with models.shard_session(claims.user_id, session) as shard:
+        yield shard
+
+
+async def get_shard_read_session(
+    request: Request,
+    claims: typing.Annotated[models.TokenClaims, Depends(get_token_claims)],
+) -> typing.AsyncIterator[models.AsyncSession]:
+    """Session for reading the caller's wallet and transactions.
+
+    A read replica unless sharded; shards have no replicas, so then the
+    caller's shard.
+    """
+    if models.sharded():
+        async with models.shard_session(claims.user_id) as shard:
+            yield shard
+    else:
+        async with replicas.read_session(
+            primary=replicas.pinned_to_primary(request)
+        ) as session:
+            yield session
+
+
 async def get_current_active_user(
     current_user: typing.Annotated[models.User, Depends(get_current_user)]
 ) -> models.User:
@@ -56,9 +170,10 @@ async def get_current_active_user(
 async def get_current_active_superuser(
     current_user: typing.Annotated[models.User, Depends(get_current_user)],
 ) -> models.User:
-    if "admin" not in current_user.roles:
+    if current_user.id not in settings.ADMIN_USER_IDS:
         raise HTTPException(
-            status_code=400, detail="The user doesn't have enough privileges"
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="The user doesn't have enough privileges",
         )
     return current_user
 
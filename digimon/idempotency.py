@@ -0,0 +1,217 @@
+import asyncio
+import datetime
+import hashlib
+import json
+from typing import Awaitable, Callable
+
+from fastapi import HTTPException, Response, status
+from pydantic import BaseModel
+from sqlmodel import delete, select, update
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from . import config
+from . import models
+
+
+settings = config.get_settings()
+
+POLL_INTERVAL_SECONDS = 0.05
+
+
+class _InFlight:
+    def __init__(self, request_hash: str):
+        self.request_hash = request_hash
+        # Resolves to (status_code, body), or None when the owner gave up
+        self.done = asyncio.get_running_loop().create_future()
+
+
+# (user_id, key) -> request of this worker currently holding the key
+_in_flight: dict[tuple[int, str], _InFlight] = {}
+
+
+def request_hash(method: str, path: str, payload) -> str:
+    data = json.dumps([method, path, payload], sort_keys=True, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def _replay(stored: tuple[int, bytes]) -> Response:
+    status_code, body = stored
+    return Response(
+        body,
+        status_code=status_code,
+        media_type="application/json",
+        headers={"Idempotent-Replayed": "true"},
+    )
+
+
+def _check_hash(stored_hash: str, expected: str):
+    if stored_hash != expected:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Idempotency-Key was already used for a different request.",
+        )
+
+
+async def _claim(session: AsyncSession, user_id: int, key: str, hashed: str) -> bool:
+    """Insert the key as in flight, or take over an expired or abandoned one."""
+    now = datetime.datetime.now()
+    table = models.DBIdempotencyKey
+    insert = models.dialect_insert(session)
+    values = dict(
+        request_hash=hashed,
+        status_code=None,
+        response_body=None,
+        created_at=now,
+        locked_until=now + datetime.timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS),
+        expires_at=now + datetime.timedelta(seconds=settings.IDEMPOTENCY_TTL_SECONDS),
+    )
+    statement = insert(table).values(user_id=user_id, key=key, **values)
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.user_id, table.key],
+        set_=values,
+        where=(table.expires_at < now)
+        | ((table.status_code == None) & (table.locked_until < now)),
+    ).returning(table.key)
+    claimed = (await session.exec(statement)).first() is not None
+    await session.commit()
+    return claimed
+
+
+async def _complete(
+    session: AsyncSession, user_id: int, key: str, stored: tuple[int, bytes]
+):
+    status_code, body = stored
+    await session.exec(
+        update(models.DBIdempotencyKey)
+        .where(
+            models.DBIdempotencyKey.user_id == user_id,
+            models.DBIdempotencyKey.key == key,
+        )
+        .values(status_code=status_code, response_body=body)
+    )
+
+
+async def _release(session: AsyncSession, user_id: int, key: str):
+    await session.rollback()
+    await session.exec(
+        delete(models.DBIdempotencyKey).where(
+            models.DBIdempotencyKey.user_id == user_id,
+            models.DBIdempotencyKey.key == key,
+            models.DBIdempotencyKey.status_code == None,
+        )
+    )
+    await session.commit()
+
+
+async def _wait_for_other_worker(
+    session: AsyncSession, user_id: int, key: str, hashed: str
+) -> tuple[int, bytes] | None:
+    """Poll a key held elsewhere; None means it was released or taken over."""
+    deadline = asyncio.get_running_loop().time() + settings.IDEMPOTENCY_WAIT_SECONDS
+    while True:
+        # Columns rather than the entity, so every poll reads fresh values
+        # instead of the copy in the session's identity map
+        record = (
+            await session.exec(
+                select(
+                    models.DBIdempotencyKey.request_hash,
+                    models.DBIdempotencyKey.status_code,
+                    models.DBIdempotencyKey.response_body,
+                    models.DBIdempotencyKey.locked_until,
+                ).where(
+                    models.DBIdempotencyKey.user_id == user_id,
+                    models.DBIdempotencyKey.key == key,
+                )
+            )
+        ).first()
+        await session.commit()
+        if record is None:
+            return None
+        _check_hash(record.request_hash, hashed)
+        if record.status_code is not None:
+            return record.status_code, record.response_body
+        if record.locked_until < datetime.datetime.now():
+            return None
+        if asyncio.get_running_loop().time() > deadline:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="A request with this Idempotency-Key is still in progress.",
+                headers={"Retry-After": "1"},
+            )
+        await asyncio.sleep(POLL_INTERVAL_SECONDS)
+
+
+async def run(
+    session: AsyncSession,
+    user_id: int,
+    key: str | None,
+    hashed: str,
+    operation: Callable[[], Awaitable[BaseModel]],
+) -> BaseModel | Response:
+    """Run ``operation`` and commit, at most once per ``(user_id, key)``.
+
+    The key is claimed in its own committed transaction before the operation
+    runs. The operation's writes and its serialized response then commit
+    together, so a stored response always matches what happened. A replay,
+    or a duplicate that arrives while the first request is running, gets the
+    stored status and body back instead of running the operation again.
+    HTTP errors raised by the operation are stored and replayed too.
+    """
+    if key is None:
+        result = await operation()
+        await session.commit()
+        return result
+
+    slot = (user_id, key)
+    while True:
+        in_flight = _in_flight.get(slot)
+        if in_flight is not None:
+            # Coalesce onto the request this worker is already running
+            _check_hash(in_flight.request_hash, hashed)
+            stored = await asyncio.shield(in_flight.done)
+            if stored is not None:
+                return _replay(stored)
+            continue
+
+        in_flight = _in_flight[slot] = _InFlight(hashed)
+        stored = None
+        try:
+            if not await _claim(session, user_id, key, hashed):
+                stored = await _wait_for_other_worker(session, user_id, key, hashed)
+                if stored is None:
+                    continue
+                return _replay(stored)
+
+            try:
+                result = await operation()
+                stored = (status.HTTP_200_OK, result.model_dump_json().encode("utf-8"))
+                await _complete(session, user_id, key, stored)
+                await session.commit()
+                return result
+            except HTTPException as exc:
+                await session.rollback()
+                stored = (
+                    exc.status_code,
+                    json.dumps({"detail": exc.detail}, separators=(",", ":")).encode("utf-8"),
+                )
+                await _complete(session, user_id, key, stored)
+                await session.commit()
+                raise
+            except BaseException:
+                stored = None
+                # If this fails too, the claim is retried once its lock expires
+                await _release(session, user_id, key)
+                raise
+        finally:
+            in_flight.done.set_result(stored)
+            del _in_flight[slot]
+
+
+async def purge_expired(session: AsyncSession) -> int:
+    result = await session.exec(
+        delete(models.DBIdempotencyKey).where(
+            models.DBIdempotencyKey.expires_at < datetime.datetime.now()
+        )
+    )
+    await session.commit()
+    return result.rowcount
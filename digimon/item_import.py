@@ -0,0 +1,236 @@
+import codecs
+import collections
+import csv
+import enum
+import json
+from typing import AsyncIterator
+
+import pydantic
+from fastapi import HTTPException, status
+from sqlmodel import insert
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from . import config
+from . import counters
+from . import models
+
+
+settings = config.get_settings()
+
+# Errors beyond this many are counted but not listed in the report
+MAX_REPORTED_ERRORS = 1000
+
+CSV_COLUMNS = set(models.CreatedItem.model_fields)
+REQUIRED_CSV_COLUMNS = {
+    name for name, field in models.CreatedItem.model_fields.items() if field.is_required()
+}
+
+
+class ImportFormat(str, enum.Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+
+async def _lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line + "\n"
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+async def _ndjson_records(chunks):
+    row = 0
+    async for line in _lines(chunks):
+        if not line.strip():
+            continue
+        row += 1
+        try:
+            data = json.loads(line)
+        except ValueError as exc:
+            yield row, None, [f"invalid JSON: {exc}"]
+            continue
+        if not isinstance(data, dict):
+            yield row, None, ["expected a JSON object"]
+            continue
+        yield row, data, None
+
+
+class _NeedMoreLines(Exception):
+    pass
+
+
+class _LineFeed:
+    """Line iterator for one ``csv.reader`` over lines that arrive async.
+
+    A quoted field may span lines. When the reader asks for a line that
+    has not arrived yet, the lines of its unfinished record are put back
+    so the record is parsed again once more input is buffered.
+    """
+
+    def __init__(self):
+        self.pending = collections.deque()
+        self.record = []
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        if not self.pending:
+            if self.closed and not self.record:
+                raise StopIteration
+            raise _NeedMoreLines
+        line = self.pending.popleft()
+        self.record.append(line)
+        return line
+
+    def rewind(self):
+        self.pending.extendleft(reversed(self.record))
+        self.record.clear()
+
+
+async def _csv_records(chunks):
+    lines = aiter(_lines(chunks))
+    feed = _LineFeed()
+    reader = csv.reader(feed)
+    header = None
+    row = 0
+
+    async def read_line():
+        try:
+            feed.pending.append(await anext(lines))
+        except StopAsyncIteration:
+            feed.closed = True
+
+    while True:
+        if not feed.pending and not feed.closed:
+            await read_line()
+        try:
+            values = next(reader)
+        except StopIteration:
+            break
+        except _NeedMoreLines:
+            if feed.closed:
+                yield row + 1, None, ["unterminated quoted field"]
+                break
+            feed.rewind()
+            await read_line()
+            continue
+        feed.record.clear()
+        if not values or (len(values) == 1 and not values[0].strip()):
+            continue
+
+        if header is None:
+            header = [name.strip() for name in values]
+            missing = REQUIRED_CSV_COLUMNS - set(header)
+            if missing:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"CSV header is missing {', '.join(sorted(missing))}",
+                )
+            continue
+
+        row += 1
+        if len(values) != len(header):
+            yield row, None, [f"expected {len(header)} columns, got {len(values)}"]
+            continue
+        # Empty cells are missing values rather than empty strings
+        yield row, {
+            name: value
+            for name, value in zip(header, values)
+            if name in CSV_COLUMNS and value != ""
+        }, None
+
+
+def _validation_errors(exc: pydantic.ValidationError) -> list[str]:
+    return [
+        f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}"
+        for error in exc.errors()
+    ]
+
+
+async def _insert_batch(
+    session: AsyncSession,
+    claims: models.TokenClaims,
+    batch: list[dict],
+    returning: bool,
+):
+    statement = insert(models.DBItem)
+    if returning:
+        # Rows come back in no particular order, so they carry their own
+        # name and description; asking SQLAlchemy to sort them by parameter
+        # makes SQLite insert one row per statement.
+        statement = statement.returning(
+            models.DBItem.id, models.DBItem.name, models.DBItem.description
+        )
+    result = await session.exec(
+        statement,
+        params=[
+            dict(
+                **row,
+                merchant_id=claims.merchant_id,
+                user_id=claims.user_id,
+                role=claims.role,
+            )
+            for row in batch
+        ],
+    )
+    inserted = result.all() if returning else None
+    await counters.adjust_item_count(session, claims.merchant_id, len(batch))
+    await session.commit()
+    return inserted
+
+
+async def import_items(
+    session: AsyncSession,
+    claims: models.TokenClaims,
+    chunks: AsyncIterator[bytes],
+    import_format: ImportFormat,
+    on_inserted=None,
+) -> models.ItemImportReport:
+    """Validate and insert streamed rows, committing every batch.
+
+    Invalid rows are reported and skipped; batches committed before a
+    failure stay committed. ``on_inserted`` is called with the
+    ``(id, name, description)`` rows of every committed batch.
+    """
+    records = _csv_records if import_format == ImportFormat.csv else _ndjson_records
+    batch_size = settings.ITEM_IMPORT_BATCH_SIZE
+
+    report = models.ItemImportReport()
+    batch = []
+
+    async def flush():
+        inserted = await _insert_batch(
+            session, claims, batch, returning=on_inserted is not None
+        )
+        report.imported += len(batch)
+        if on_inserted is not None:
+            on_inserted(inserted)
+        batch.clear()
+
+    async for row, data, errors in records(chunks):
+        if errors is None:
+            try:
+                batch.append(models.CreatedItem.model_validate(data).model_dump())
+            except pydantic.ValidationError as exc:
+                errors = _validation_errors(exc)
+
+        if errors is not None:
+            report.failed += 1
+            if len(report.errors) < MAX_REPORTED_ERRORS:
+                report.errors.append(models.ItemImportError(row=row, errors=errors))
+            else:
+                report.errors_truncated = True
+        elif len(batch) >= batch_size:
+            await flush()
+
+    if batch:
+        await flush()
+    return report
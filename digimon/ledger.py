@@ -0,0 +1,200 @@
+import datetime
+
+from sqlmodel import func, insert, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from . import config
+from . import models
+from . import pagination
+
+
+settings = config.get_settings()
+
+
+class LedgerBatch:
+    """Ledger entries and snapshots written by one money-moving transaction.
+
+    Callers bump ``DBWallet.ledger_seq`` by the number of postings in the same
+    ``UPDATE`` that changes the balance and pass the returned ``ledger_seq``
+    and ``balance`` to :meth:`post`, so sequence numbers never need a read.
+    """
+
+    def __init__(self):
+        self.created_at = datetime.datetime.now()
+        self.entries = []
+        self.snapshots = []
+
+    def post(
+        self,
+        wallet_id: int,
+        last_seq: int,
+        balance: float,
+        postings: list[tuple[float, models.LedgerEntryKind, int | None]],
+    ):
+        first_seq = last_seq - len(postings) + 1
+        for offset, (amount, kind, transaction_id) in enumerate(postings):
+            self.entries.append(
+                dict(
+                    wallet_id=wallet_id,
+                    seq=first_seq + offset,
+                    amount=amount,
+                    kind=kind,
+                    transaction_id=transaction_id,
+                    created_at=self.created_at,
+                )
+            )
+
+        interval = settings.LEDGER_SNAPSHOT_INTERVAL
+        if last_seq // interval > (first_seq - 1) // interval:
+            self.snapshots.append(
+                dict(
+                    wallet_id=wallet_id,
+                    seq=last_seq,
+                    balance=balance,
+                    created_at=self.created_at,
+                )
+            )
+
+    async def write(self, session: AsyncSession):
+        if self.entries:
+            await session.exec(insert(models.DBLedgerEntry), params=self.entries)
+        if self.snapshots:
+            insert_snapshot = models.dialect_insert(session)(models.DBBalanceSnapshot)
+            await session.exec(
+                insert_snapshot.on_conflict_do_nothing(), params=self.snapshots
+            )
+
+
+async def balance_at(
+    session: AsyncSession, wallet_id: int, at: datetime.datetime | None = None
+) -> models.LedgerBalance:
+    """Latest snapshot at or before ``at`` plus the entries recorded after it."""
+    statement = select(models.DBBalanceSnapshot).where(
+        models.DBBalanceSnapshot.wallet_id == wallet_id
+    )
+    if at is not None:
+        statement = statement.where(models.DBBalanceSnapshot.created_at <= at)
+    statement = statement.order_by(
+        models.DBBalanceSnapshot.created_at.desc(), models.DBBalanceSnapshot.seq.desc()
+    )
+    snapshot = (await session.exec(statement.limit(1))).first()
+
+    balance, seq = (snapshot.balance, snapshot.seq) if snapshot else (0.0, 0)
+
+    statement = select(
+        func.coalesce(func.sum(models.DBLedgerEntry.amount), 0.0),
+        func.max(models.DBLedgerEntry.seq),
+    ).where(
+        models.DBLedgerEntry.wallet_id == wallet_id,
+        models.DBLedgerEntry.seq > seq,
+    )
+    if at is not None:
+        statement = statement.where(models.DBLedgerEntry.created_at <= at)
+    amount, last_seq = (await session.exec(statement)).one()
+
+    return models.LedgerBalance(
+        wallet_id=wallet_id,
+        balance=balance + amount,
+        seq=last_seq or seq,
+        at=at,
+    )
+
+
+async def statement(
+    session: AsyncSession,
+    wallet_id: int,
+    start: datetime.datetime | None = None,
+    end: datetime.datetime | None = None,
+    cursor: str | None = None,
+    limit: int = 100,
+) -> models.Statement:
+    query = select(models.DBLedgerEntry).where(
+        models.DBLedgerEntry.wallet_id == wallet_id
+    )
+    if start is not None:
+        query = query.where(models.DBLedgerEntry.created_at >= start)
+    if end is not None:
+        query = query.where(models.DBLedgerEntry.created_at < end)
+    if cursor:
+        position = pagination.decode_cursor(cursor, seq=int)
+        query = query.where(models.DBLedgerEntry.seq > position["seq"])
+
+    result = await session.exec(
+        query.order_by(models.DBLedgerEntry.seq).limit(limit + 1)
+    )
+    entries = result.all()
+
+    next_cursor = None
+    if len(entries) > limit:
+        entries = entries[:limit]
+        next_cursor = pagination.encode_cursor(seq=entries[-1].seq)
+
+    if entries:
+        opening = await balance_at_seq(session, wallet_id, entries[0].seq - 1)
+    else:
+        opening = (await balance_at(session, wallet_id, start)).balance
+
+    return models.Statement(
+        wallet_id=wallet_id,
+        opening_balance=opening,
+        entries=entries,
+        next_cursor=next_cursor,
+    )
+
+
+async def balance_at_seq(session: AsyncSession, wallet_id: int, seq: int) -> float:
+    snapshot = (
+        await session.exec(
+            select(models.DBBalanceSnapshot)
+            .where(
+                models.DBBalanceSnapshot.wallet_id == wallet_id,
+                models.DBBalanceSnapshot.seq <= seq,
+            )
+            .order_by(models.DBBalanceSnapshot.seq.desc())
+            .limit(1)
+        )
+    ).first()
+    balance, snapshot_seq = (snapshot.balance, snapshot.seq) if snapshot else (0.0, 0)
+
+    amount = (
+        await session.exec(
+            select(func.coalesce(func.sum(models.DBLedgerEntry.amount), 0.0)).where(
+                models.DBLedgerEntry.wallet_id == wallet_id,
+                models.DBLedgerEntry.seq > snapshot_seq,
+                models.DBLedgerEntry.seq <= seq,
+            )
+        )
+    ).one()
+    return balance + amount
+
+
+async def snapshot_wallets(session: AsyncSession):
+    """Snapshot every wallet with entries since its latest snapshot.
+
+    Also seeds the ledger of wallets that held a balance before it existed.
+    """
+    latest = (
+        select(
+            models.DBBalanceSnapshot.wallet_id,
+            func.max(models.DBBalanceSnapshot.seq).label("seq"),
+        )
+        .group_by(models.DBBalanceSnapshot.wallet_id)
+        .subquery()
+    )
+    result = await session.exec(
+        select(models.DBWallet.id, models.DBWallet.ledger_seq, models.DBWallet.balance)
+        .outerjoin(latest, latest.c.wallet_id == models.DBWallet.id)
+        .where(
+            (latest.c.seq == None) | (latest.c.seq < models.DBWallet.ledger_seq)
+        )
+    )
+    now = datetime.datetime.now()
+    snapshots = [
+        dict(wallet_id=wallet_id, seq=seq, balance=balance, created_at=now)
+        for wallet_id, seq, balance in result.all()
+    ]
+    if snapshots:
+        insert_snapshot = models.dialect_insert(session)(models.DBBalanceSnapshot)
+        await session.exec(insert_snapshot.on_conflict_do_nothing(), params=snapshots)
+    await session.commit()
+    return len(snapshots)
@@ -1,23 +1,46 @@
-from gevent import monkey
-
-monkey.patch_all()
+import asyncio
 
 from fastapi import FastAPI
 
 from contextlib import asynccontextmanager
 
 from . import config
+from . import metrics
+from . import purchases
+from . import query_events
+from . import replicas
 from .routers import init_router
 from . import models
+from . import slow_queries
+from . import stripes
 
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    settings = app.state.settings
+    health_checks = None
+    if replicas.replica_set.replicas:
+        health_checks = asyncio.create_task(replicas.replica_set.run_health_checks())
+    transfer_retries = None
+    if models.sharded():
+        transfer_retries = asyncio.create_task(purchases.run_transfer_retries())
+    compactor = None
+    if settings.WALLET_STRIPE_COMPACT_SECONDS > 0:
+        compactor = asyncio.create_task(
+            stripes.run_compactor(settings.WALLET_STRIPE_COMPACT_SECONDS)
+        )
     yield
+    if compactor is not None:
+        compactor.cancel()
+    if health_checks is not None:
+        health_checks.cancel()
+    if transfer_retries is not None:
+        transfer_retries.cancel()
+    await replicas.replica_set.dispose()
     if models.engine is not None:
         # Close the DB connection
-        await models.sesion_close()
+        await models.close_session()
 
 
 def create_app(settings=None):
@@ -25,8 +48,34 @@ def create_app(settings=None):
         settings = config.get_settings()
 
     app = FastAPI(lifespan=lifespan)
+    app.state.settings = settings
 
     models.init_db(settings)
+    replicas.init_replicas(settings)
+    engines = (
+        [models.engine]
+        + models.shard_engines
+        + [replica.engine for replica in replicas.replica_set.replicas]
+    )
+
+    if settings.SQLDB_REPLICA_URLS and settings.READ_YOUR_WRITES_SECONDS > 0:
+        app.add_middleware(
+            replicas.ReadYourWritesMiddleware,
+            seconds=settings.READ_YOUR_WRITES_SECONDS,
+        )
+    query_observers = []
+    if settings.METRICS_ENABLED:
+        app.add_middleware(
+            metrics.MetricsMiddleware, count_queries=settings.METRICS_QUERY_EVENTS
+        )
+        if settings.METRICS_QUERY_EVENTS:
+            query_observers.append(metrics.observe_query)
+    if settings.SLOW_QUERY_LOG:
+        query_observers.append(slow_queries.observe_query)
+    query_events.set_observers(*query_observers)
+    if query_observers:
+        for engine in engines:
+            query_events.instrument_engine(engine.sync_engine)
 
     init_router(app)
     return app
\ No newline at end of file
@@ -0,0 +1,199 @@
+import bisect
+import contextvars
+import time
+from collections import defaultdict
+
+
+# Upper bounds, in seconds, of the request latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Requests that matched no route share one label, so unknown paths
+# cannot grow the number of series without bound
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+class Histogram:
+    __slots__ = ("counts", "sum")
+
+    def __init__(self):
+        # One slot per bucket plus +Inf; cumulated when rendered
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+
+
+class RequestStats:
+    __slots__ = ("queries", "db_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+class Registry:
+    """Counters of this worker, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self.in_flight = 0
+        # (method, route) -> latency histogram
+        self.latency: dict[tuple[str, str], Histogram] = defaultdict(Histogram)
+        # (method, route, status) -> count
+        self.responses: dict[tuple[str, str, int], int] = defaultdict(int)
+        # (method, route) -> [queries, seconds] spent by its requests
+        self.request_db: dict[tuple[str, str], list] = defaultdict(lambda: [0, 0.0])
+        # Every query of the engine, requests or not
+        self.queries = 0
+        self.db_seconds = 0.0
+
+    def observe_request(
+        self,
+        method: str,
+        route: str,
+        status: int,
+        seconds: float,
+        stats: RequestStats | None,
+    ):
+        key = (method, route)
+        self.latency[key].observe(seconds)
+        self.responses[(method, route, status)] += 1
+        if stats is not None:
+            db = self.request_db[key]
+            db[0] += stats.queries
+            db[1] += stats.db_seconds
+
+    def clear(self):
+        self.__init__()
+
+    def render(self) -> str:
+        lines = [
+            "# HELP http_requests_in_flight Requests being handled right now.",
+            "# TYPE http_requests_in_flight gauge",
+            f"http_requests_in_flight {self.in_flight}",
+            "# HELP http_request_duration_seconds Request latency by route.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        for (method, route), histogram in sorted(self.latency.items()):
+            labels = _labels(method=method, route=route)
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), histogram.counts):
+                cumulative += count
+                lines.append(
+                    f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}'
+                )
+            lines.append(f"http_request_duration_seconds_sum{{{labels}}} {histogram.sum!r}")
+            lines.append(f"http_request_duration_seconds_count{{{labels}}} {cumulative}")
+
+        lines += [
+            "# HELP http_responses_total Responses by route and status code.",
+            "# TYPE http_responses_total counter",
+        ]
+        for (method, route, status), count in sorted(self.responses.items()):
+            labels = _labels(method=method, route=route, status=status)
+            lines.append(f"http_responses_total{{{labels}}} {count}")
+
+        lines += [
+            "# HELP http_request_db_queries_total Queries run while handling requests.",
+            "# TYPE http_request_db_queries_total counter",
+        ]
+        lines += [
+            f"http_request_db_queries_total{{{_labels(method=method, route=route)}}} {queries}"
+            for (method, route), (queries, _) in sorted(self.request_db.items())
+        ]
+        lines += [
+            "# HELP http_request_db_seconds_total Time spent in queries while handling requests.",
+            "# TYPE http_request_db_seconds_total counter",
+        ]
+        lines += [
+            f"http_request_db_seconds_total{{{_labels(method=method, route=route)}}} {seconds!r}"
+            for (method, route), (_, seconds) in sorted(self.request_db.items())
+        ]
+
+        lines += [
+            "# HELP db_queries_total Queries run by this worker.",
+            "# TYPE db_queries_total counter",
+            f"db_queries_total {self.queries}",
+            "# HELP db_query_seconds_total Time spent in queries by this worker.",
+            "# TYPE db_query_seconds_total counter",
+            f"db_query_seconds_total {self.db_seconds!r}",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+def _labels(**labels) -> str:
+    return ",".join(
+        '%s="%s"'
+        % (
+            name,
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for name, value in labels.items()
+    )
+
+
+registry = Registry()
+
+_request_stats: contextvars.ContextVar[RequestStats | None] = contextvars.ContextVar(
+    "request_stats", default=None
+)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware timing every HTTP request by its route template.
+
+    With ``count_queries`` each request also gets a ``RequestStats`` for
+    ``observe_query`` to fill; without it the context variable is left alone.
+    """
+
+    def __init__(self, app, count_queries: bool = True):
+        self.app = app
+        self.count_queries = count_queries
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        if self.count_queries:
+            stats = RequestStats()
+            token = _request_stats.set(stats)
+        else:
+            stats = None
+        registry.in_flight += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            registry.in_flight -= 1
+            if stats is not None:
+                _request_stats.reset(token)
+            # The router stores the matched route in the scope
+            route = scope.get("route")
+            registry.observe_request(
+                scope["method"],
+                getattr(route, "path", UNMATCHED_ROUTE),
+                status_code,
+                elapsed,
+                stats,
+            )
+
+
+def observe_query(conn, statement, parameters, executemany, seconds):
+    """A ``query_events`` observer counting queries per worker and per request."""
+    registry.queries += 1
+    registry.db_seconds += seconds
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += seconds
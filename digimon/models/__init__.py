@@ -1,8 +1,15 @@
+import asyncio
+import contextlib
+
 from sqlmodel import SQLModel
-from typing import AsyncIterator
+from typing import AsyncIterator, Awaitable, Callable, TypeVar
 from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.schema import CreateIndex, CreateTable
+from sqlalchemy.types import SchemaType
 
 from .items import *
 from .merchants import *
@@ -10,35 +17,203 @@ from .transactions import *
 from .wallets import *
 from .users import *
 from .customers import *
+from .counters import *
+from .ledgers import *
+from .sales import *
+from .idempotency import *
+from .admin import *
+from .shards import *
+from .stripes import *
+
+T = TypeVar("T")
 
 connect_args = {}
 
 engine = None
+session_factory = None
 
-def init_db(settings):
-    global engine
+# Empty unless SQLDB_SHARD_URLS is set; then the tables below live on
+# the shard of the user who owns the row and everything else on engine
+shard_engines = []
+shard_session_factories = []
+
+SHARDED_TABLES = (
+    DBWallet.__table__,
+    DBLedgerEntry.__table__,
+    DBBalanceSnapshot.__table__,
+    DBTransection.__table__,
+    DBMerchantSales.__table__,
+    DBItemSales.__table__,
+    DBIdempotencyKey.__table__,
+    DBShardTransfer.__table__,
+    DBAppliedTransfer.__table__,
+    DBWalletStripe.__table__,
+    DBStripeCredit.__table__,
+)
 
-    engine = create_async_engine(
-        settings.SQLDB_URL,
-        echo=True,
+def make_engine(url: str, settings):
+    engine_args = dict(
+        echo=settings.DB_ECHO,
         future=True,
-        connect_args=connect_args,
+        connect_args=dict(connect_args),
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        pool_recycle=settings.DB_POOL_RECYCLE,
     )
 
+    # SQLite engines use NullPool/StaticPool, which take no queue sizing
+    parsed = make_url(url)
+    if parsed.get_backend_name() != "sqlite":
+        engine_args.update(
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+        )
+
+    if parsed.get_driver_name() == "asyncpg":
+        engine_args["connect_args"].update(
+            statement_cache_size=settings.DB_STATEMENT_CACHE_SIZE,
+            prepared_statement_cache_size=settings.DB_STATEMENT_CACHE_SIZE,
+        )
+
+    return create_async_engine(url, **engine_args)
+
+
+def init_db(settings):
+    global engine, session_factory, shard_engines, shard_session_factories
+
+    engine = make_engine(settings.SQLDB_URL, settings)
+    session_factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    shard_engines = [make_engine(url, settings) for url in settings.SQLDB_SHARD_URLS]
+    shard_session_factories = [
+        sessionmaker(shard, class_=AsyncSession, expire_on_commit=False)
+        for shard in shard_engines
+    ]
+
+
+def create_shard_tables(conn):
+    # Without foreign keys: the users they point at are on SQLDB_URL
+    for table in SHARDED_TABLES:
+        for column in table.columns:
+            if isinstance(column.type, SchemaType):
+                # Postgres enum types
+                column.type.create(conn, checkfirst=True)
+        conn.execute(
+            CreateTable(table, include_foreign_key_constraints=[], if_not_exists=True)
+        )
+        for index in table.indexes:
+            conn.execute(CreateIndex(index, if_not_exists=True))
+
+
 async def recreate_table():
     async with engine.begin() as conn:
         await conn.run_sync(SQLModel.metadata.drop_all)
         await conn.run_sync(SQLModel.metadata.create_all)
+    for shard in shard_engines:
+        async with shard.begin() as conn:
+            await conn.run_sync(SQLModel.metadata.drop_all, tables=SHARDED_TABLES)
+            await conn.run_sync(create_shard_tables)
+
+
+def jump_hash(key: int, buckets: int) -> int:
+    """Jump consistent hash (Lamping and Veach) of a 64-bit key.
+
+    Growing from n to n + 1 buckets only moves the keys that land in the
+    new bucket, about 1 / (n + 1) of them.
+    """
+    # Sequential ids are mixed first (splitmix64) so neighbours spread out
+    key = (key + 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+    key = ((key ^ (key >> 30)) * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF
+    key = ((key ^ (key >> 27)) * 0x94D049BB133111EB) & 0xFFFFFFFFFFFFFFFF
+    key ^= key >> 31
+
+    bucket, candidate = -1, 0
+    while candidate < buckets:
+        bucket = candidate
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        candidate = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+def sharded() -> bool:
+    return bool(shard_engines)
+
+
+def shard_index(user_id: int) -> int:
+    return jump_hash(user_id, len(shard_engines))
+
+
+def data_session_factories() -> list:
+    """Session factories of every database holding the sharded tables."""
+    return shard_session_factories or [session_factory]
+
+
+@contextlib.asynccontextmanager
+async def shard_session(
+    user_id: int, session: AsyncSession | None = None
+) -> AsyncIterator[AsyncSession]:
+    """A session on the database holding ``user_id``'s wallet and transactions.
+
+    Unsharded that is ``SQLDB_URL``: ``session`` itself when given, so the
+    caller keeps a single transaction, or a new session otherwise.
+    """
+    if shard_session_factories:
+        async with shard_session_factories[shard_index(user_id)]() as shard:
+            yield shard
+    elif session is not None:
+        yield session
+    else:
+        async with session_factory() as session:
+            yield session
+
+
+async def gather_shards(
+    session: AsyncSession, query: Callable[[AsyncSession], Awaitable[T]]
+) -> list[T]:
+    """Run ``query`` on every shard at once, or on ``session`` when unsharded."""
+    if not shard_session_factories:
+        return [await query(session)]
+
+    async def run(factory):
+        async with factory() as shard:
+            return await query(shard)
+
+    return await asyncio.gather(*(run(factory) for factory in shard_session_factories))
+
+
+def dialect_insert(session):
+    # INSERT ... ON CONFLICT is dialect specific in SQLAlchemy
+    if session.bind.dialect.name == "postgresql":
+        return postgresql.insert
+    return sqlite.insert
 
 
 async def get_session() -> AsyncIterator[AsyncSession]:
-    async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
-    async with async_session() as session:
+    async with session_factory() as session:
         yield session
 
 
+def pool_stats(max_overflow: int) -> PoolStats:
+    """Connection counts of the primary pool, made with ``max_overflow``."""
+    pool = engine.pool
+    stats = PoolStats(pool_class=type(pool).__name__)
+
+    # Only queue based pools report sizes
+    if hasattr(pool, "checkedout"):
+        stats.pool_size = pool.size()
+        stats.max_overflow = max_overflow
+        stats.checked_in = pool.checkedin()
+        stats.checked_out = pool.checkedout()
+        stats.overflow = pool.overflow()
+        stats.max_connections_per_worker = stats.pool_size + max(stats.max_overflow, 0)
+
+    return stats
+
+
 async def close_session():
     global engine
     if engine is None:
         raise Exception("DatabaseSessionManager is not initialized")
-    await engine.dispose()
\ No newline at end of file
+    await engine.dispose()
+    for shard in shard_engines:
+        await shard.dispose()
\ No newline at end of file
@@ -0,0 +1,51 @@
+from typing import Optional
+from pydantic import BaseModel
+
+
+class PoolStats(BaseModel):
+    pool_class: str
+    pool_size: Optional[int] = None
+    max_overflow: Optional[int] = None
+    checked_in: Optional[int] = None
+    checked_out: Optional[int] = None
+    overflow: Optional[int] = None
+    # Most connections one worker process can open
+    max_connections_per_worker: Optional[int] = None
+    # Postgres max_connections and how many workers fit under it
+    server_max_connections: Optional[int] = None
+    max_workers: Optional[int] = None
+
+
+class CacheStats(BaseModel):
+    name: str
+    size: int
+    max_size: int
+    ttl: float
+    hits: int
+    misses: int
+
+
+class ReplicaStatus(BaseModel):
+    name: str
+    healthy: bool
+    # Replay lag at the last health check; None until one has run
+    lag_seconds: Optional[float] = None
+
+
+class SlowQueryStats(BaseModel):
+    fingerprint: str
+    # Fast executions are sampled and scaled up, so this is an estimate
+    count: int
+    # Executions at or over the threshold; exact even when sampling
+    slow_count: int
+    total_ms: float
+    mean_ms: float
+    max_ms: float
+    plan: Optional[str] = None
+
+
+class SlowQueryReport(BaseModel):
+    threshold_ms: float
+    sample_rate: float
+    dropped: int
+    queries: list[SlowQueryStats]
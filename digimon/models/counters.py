@@ -0,0 +1,11 @@
+from sqlmodel import Field, SQLModel
+
+
+GLOBAL_COUNTER_ID = 0
+
+
+class DBItemCounter(SQLModel, table=True):
+    __tablename__ = "item_counters"
+    # One row per merchant plus GLOBAL_COUNTER_ID for the whole catalog
+    merchant_id: int = Field(primary_key=True)
+    count: int = Field(default=0)
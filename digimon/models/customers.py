@@ -28,7 +28,7 @@ class DBCustomer(BaseCustomer, SQLModel, table=True):
     
     id: Optional[int] = Field(default=None, primary_key=True)
     
-    user_id: int = Field(default=None, foreign_key="users.id")
+    user_id: int = Field(default=None, foreign_key="users.id", index=True)
     user: DBUser | None = Relationship(back_populates="customer")
 
     #wallets: list["DBWallet"] = Relationship(back_populates="customer")
@@ -0,0 +1,22 @@
+import datetime
+from typing import Optional
+
+from sqlalchemy import Index
+from sqlmodel import Field, SQLModel
+
+
+class DBIdempotencyKey(SQLModel, table=True):
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (Index("ix_idempotency_keys_expires_at", "expires_at"),)
+
+    # Keys are scoped per user, so two clients may pick the same key
+    user_id: int = Field(primary_key=True)
+    key: str = Field(primary_key=True, max_length=255)
+    request_hash: str
+    # Both stay NULL while the first request is still running
+    status_code: Optional[int] = None
+    response_body: Optional[bytes] = None
+    created_at: datetime.datetime = Field(default_factory=datetime.datetime.now)
+    # An in-flight claim older than this is abandoned and may be taken over
+    locked_until: datetime.datetime
+    expires_at: datetime.datetime
@@ -1,5 +1,6 @@
 from typing import Optional, List
 from pydantic import BaseModel, ConfigDict
+from sqlalchemy import Index
 from sqlmodel import Relationship, SQLModel, Field
 
 from . import merchants
@@ -25,7 +26,11 @@ class Item(BaseItem):
     role: UserRole
 
 class DBItem(SQLModel, Item, table=True):
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        # Keyset pagination seeks on (merchant_id, id) for per-merchant listings
+        Index("ix_dbitem_merchant_id_id", "merchant_id", "id"),
+        {'extend_existing': True},
+    )
     # Correctly define the primary key with default=None
     id: int = Field(default=None, primary_key=True)
     # Properly set foreign key reference
@@ -36,6 +41,8 @@ class DBItem(SQLModel, Item, table=True):
     user_id: int = Field( default=None, foreign_key="users.id")
     user: DBUser | None = Relationship(back_populates="item")
     role: UserRole = Field(default=None)
+
+
 class ItemList(BaseModel):
     model_config = ConfigDict(from_attributes=True)
     items: List[Item]
@@ -43,6 +50,32 @@ class ItemList(BaseModel):
     page_count: int
     
     size_per_page: int
+    next_cursor: Optional[str] = None
+
+
+class ItemImportError(BaseModel):
+    # 1-based position among the data rows of the upload
+    row: int
+    errors: List[str]
+
+
+class ItemImportReport(BaseModel):
+    imported: int = 0
+    failed: int = 0
+    errors: List[ItemImportError] = []
+    errors_truncated: bool = False
+
+
+class ItemSearchHit(Item):
+    score: float
+
+
+class ItemSearchResult(BaseModel):
+    query: str
+    items: List[ItemSearchHit]
+    page: int
+    size_per_page: int
+    next_page: Optional[int] = None
     
 
 # Import the BaseMerchant module correctly
@@ -0,0 +1,67 @@
+import datetime
+from enum import Enum
+from typing import Optional
+
+from pydantic import BaseModel, ConfigDict
+from sqlalchemy import Index
+from sqlmodel import Field, SQLModel
+
+
+class LedgerEntryKind(str, Enum):
+    purchase = "purchase"
+    sale = "sale"
+    top_up = "top_up"
+    adjustment = "adjustment"
+
+
+class LedgerEntry(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    wallet_id: int
+    seq: int
+    amount: float
+    kind: LedgerEntryKind
+    transaction_id: Optional[int] = None
+    created_at: datetime.datetime
+
+
+class DBLedgerEntry(LedgerEntry, SQLModel, table=True):
+    __tablename__ = "ledger_entries"
+    __table_args__ = (
+        Index("ix_ledger_entries_wallet_id_created_at", "wallet_id", "created_at"),
+    )
+
+    # seq is allocated from DBWallet.ledger_seq by the UPDATE that moves the money
+    wallet_id: int = Field(primary_key=True)
+    seq: int = Field(primary_key=True)
+    kind: LedgerEntryKind = Field(default=None)
+    created_at: datetime.datetime = Field(default_factory=datetime.datetime.now)
+
+
+class DBBalanceSnapshot(SQLModel, table=True):
+    __tablename__ = "balance_snapshots"
+    __table_args__ = (
+        Index("ix_balance_snapshots_wallet_id_created_at", "wallet_id", "created_at"),
+    )
+
+    # balance includes every entry of the wallet up to and including seq
+    wallet_id: int = Field(primary_key=True)
+    seq: int = Field(primary_key=True)
+    balance: float
+    created_at: datetime.datetime = Field(default_factory=datetime.datetime.now)
+
+
+class LedgerBalance(BaseModel):
+    wallet_id: int
+    balance: float
+    seq: int
+    at: Optional[datetime.datetime] = None
+
+
+class Statement(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    wallet_id: int
+    opening_balance: float
+    entries: list[LedgerEntry]
+    next_cursor: Optional[str] = None
@@ -34,7 +34,7 @@ class DBMerchant(BaseMerchant, SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     items: list["DBItem"] = Relationship(back_populates="merchant", cascade_delete=True)
     #wallets: list["wallets.DBWallet"] = Relationship(back_populates="merchant", cascade_delete=True)
-    user_id: int = Field(default=None, foreign_key="users.id")
+    user_id: int = Field(default=None, foreign_key="users.id", index=True)
     user: users.DBUser | None = Relationship(back_populates="merchant")
 
 class MerchantList(BaseModel):
@@ -0,0 +1,63 @@
+import datetime
+from enum import Enum
+from typing import Optional
+
+from pydantic import BaseModel, ConfigDict
+from sqlalchemy import Index
+from sqlmodel import Field, SQLModel
+
+
+class SalesGranularity(str, Enum):
+    hour = "hour"
+    day = "day"
+
+
+class SalesTotals(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    revenue: float = 0.0
+    orders: int = 0
+    quantity: int = 0
+
+
+class DBMerchantSales(SalesTotals, SQLModel, table=True):
+    __tablename__ = "merchant_sales"
+
+    # bucket is the start of the hour or day the totals cover
+    merchant_id: int = Field(primary_key=True)
+    granularity: SalesGranularity = Field(primary_key=True)
+    bucket: datetime.datetime = Field(primary_key=True)
+
+
+class DBItemSales(SalesTotals, SQLModel, table=True):
+    __tablename__ = "item_sales"
+    __table_args__ = (
+        Index("ix_item_sales_merchant_id_granularity_bucket", "merchant_id", "granularity", "bucket"),
+    )
+
+    item_id: int = Field(primary_key=True)
+    granularity: SalesGranularity = Field(primary_key=True)
+    bucket: datetime.datetime = Field(primary_key=True)
+    merchant_id: int
+
+
+class SalesBucket(SalesTotals):
+    bucket: datetime.datetime
+
+
+class MerchantSales(BaseModel):
+    merchant_id: int
+    granularity: SalesGranularity
+    total: SalesTotals
+    buckets: list[SalesBucket]
+
+
+class ItemSales(SalesTotals):
+    item_id: int
+
+
+class MerchantItemSales(BaseModel):
+    merchant_id: int
+    start: Optional[datetime.datetime] = None
+    end: Optional[datetime.datetime] = None
+    items: list[ItemSales]
@@ -0,0 +1,48 @@
+import datetime
+from enum import Enum
+
+from sqlalchemy import JSON, Column, Index
+from sqlmodel import Field, SQLModel
+
+
+class DBIdBlock(SQLModel, table=True):
+    __tablename__ = "id_blocks"
+
+    # Lives on SQLDB_URL; next_id is the first id no worker has reserved yet
+    # for the sharded table called name
+    name: str = Field(primary_key=True, max_length=64)
+    next_id: int = 1
+
+
+class ShardTransferStatus(str, Enum):
+    pending = "pending"
+    completed = "completed"
+    refunded = "refunded"
+
+
+class DBShardTransfer(SQLModel, table=True):
+    __tablename__ = "shard_transfers"
+    __table_args__ = (
+        Index("ix_shard_transfers_status_created_at", "status", "created_at"),
+    )
+
+    # A merchant credit owed by a purchase whose customer wallet is on this
+    # shard and whose merchant wallet is on another one. Written with the
+    # debit; the credit is applied afterwards, or refunded if it cannot be.
+    id: int = Field(primary_key=True)
+    customer_wallet_id: int
+    merchant_user_id: int
+    amount: float
+    transaction_ids: list[int] = Field(sa_column=Column(JSON, nullable=False))
+    status: ShardTransferStatus = Field(default=ShardTransferStatus.pending)
+    created_at: datetime.datetime = Field(default_factory=datetime.datetime.now)
+
+
+class DBAppliedTransfer(SQLModel, table=True):
+    __tablename__ = "applied_transfers"
+
+    # Written on the merchant's shard together with the credit, so a retried
+    # transfer is never credited twice
+    transfer_id: int = Field(primary_key=True)
+    wallet_id: int
+    created_at: datetime.datetime = Field(default_factory=datetime.datetime.now)
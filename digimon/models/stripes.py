@@ -0,0 +1,34 @@
+import datetime
+
+from pydantic import BaseModel
+from sqlmodel import Field, SQLModel
+
+
+class DBWalletStripe(SQLModel, table=True):
+    __tablename__ = "wallet_stripes"
+
+    # Credits of a striped wallet not yet folded into DBWallet.balance; the
+    # wallet's balance is its own plus the sum of its stripes
+    wallet_id: int = Field(primary_key=True)
+    stripe: int = Field(primary_key=True)
+    balance: float = 0.0
+
+
+class DBStripeCredit(SQLModel, table=True):
+    __tablename__ = "stripe_credits"
+
+    # One per sale credited to a stripe, kept until the compactor posts it
+    # to the ledger; a stripe's balance is the sum of its credits
+    wallet_id: int = Field(primary_key=True)
+    transaction_id: int = Field(primary_key=True)
+    stripe: int
+    amount: float
+    created_at: datetime.datetime = Field(default_factory=datetime.datetime.now)
+
+
+class WalletStripes(BaseModel):
+    wallet_id: int
+    # 0 when credits go to the wallet row itself
+    stripes: int
+    # Credits waiting in the stripes to be folded into the balance
+    unfolded: float
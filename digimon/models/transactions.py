@@ -1,8 +1,10 @@
 # Trasection
 from typing import Optional
+import pydantic
 from pydantic import BaseModel, ConfigDict
+from sqlalchemy import Index
 from sqlmodel import Field, Relationship, SQLModel
-from datetime import datetime
+import datetime
 
 from .users import *
 class BaseTransaction(BaseModel):
@@ -22,20 +24,30 @@ class UpdatedTransaction(BaseTransaction):
 class Transaction(BaseTransaction):
     id: int
     price: float
+    quantity: int = 1
     merchant_id: int
     customer_id: int
+    created_at: Optional[datetime.datetime] = None
 
 
 
 class DBTransection(BaseTransaction, SQLModel , table=True):
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        # History pages seek on (owner, created_at, id) newest first
+        Index("ix_dbtransection_customer_id_created_at_id", "customer_id", "created_at", "id"),
+        Index("ix_dbtransection_merchant_id_created_at_id", "merchant_id", "created_at", "id"),
+        {'extend_existing': True},
+    )
     id: Optional[int] = Field(default=None, primary_key=True)
     price: float = Field(default=None)
+    quantity: int = Field(default=1)
     
     merchant_id: int = Field(default=None)
     
     customer_id: int = Field(default=None)
 
+    created_at: datetime.datetime = Field(default_factory=datetime.datetime.now)
+
 
 
 
@@ -46,4 +58,22 @@ class TransactionList(BaseModel):
     transactions: list[Transaction]
     page: int
     page_size: int
-    size_per_page: int
\ No newline at end of file
+    size_per_page: int
+    next_cursor: Optional[str] = None
+
+
+class CartLine(BaseModel):
+    item_id: int
+    quantity: int = pydantic.Field(default=1, gt=0)
+
+
+class CreatedCart(BaseModel):
+    items: list[CartLine] = pydantic.Field(min_length=1, max_length=100)
+    description: str | None = None
+
+
+class Checkout(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    transactions: list[Transaction]
+    total: float
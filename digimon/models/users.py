@@ -15,7 +15,7 @@ if TYPE_CHECKING:
     
 from enum import Enum
 #pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-import bcrypt
+from .. import security
 
 class UserRole(str, Enum):
     merchant = "merchant"
@@ -91,6 +91,15 @@ class TokenData(BaseModel):
     user_id: int
 
 
+class TokenClaims(BaseModel):
+    # Signed into access tokens at login so hot paths can skip the lookups
+    user_id: int
+    role: UserRole | None = None
+    customer_id: int | None = None
+    merchant_id: int | None = None
+    wallet_id: int | None = None
+
+
 class ChangedPasswordUser(BaseModel):
     current_password: str
     new_password: str
@@ -120,13 +129,12 @@ class DBUser(BaseUser, SQLModel, table=True):
                 return True
         return False
     async def get_encrypted_password(self, plain_password):
-        return bcrypt.hashpw(
-            plain_password.encode("utf-8"), salt=bcrypt.gensalt()
-        ).decode("utf-8")
+        return await security.hash_password(plain_password)
     async def set_password(self, plain_password):
         self.password = await self.get_encrypted_password(plain_password)
 
     async def verify_password(self, plain_password):
-        return bcrypt.checkpw(
-            plain_password.encode("utf-8"), self.password.encode("utf-8")
-        )
\ No newline at end of file
+        return await security.verify_password(plain_password, self.password)
+
+    def password_needs_rehash(self):
+        return security.password_needs_rehash(self.password)
\ No newline at end of file
@@ -34,11 +34,16 @@ class DBWallet(Wallet, SQLModel, table=True):
     
     
     user : DBUser | None = Relationship(back_populates="wallets")
-    user_id: int = Field(default=None, foreign_key="users.id")
+    user_id: int = Field(default=None, foreign_key="users.id", index=True)
     #customer_id: int = Field(default=None, foreign_key="customers.id" )
     #customer: Optional["DBCustomer"] = Relationship(back_populates="wallets")
     
     role: UserRole = Field(default=None)
+    # Last ledger entry sequence number, bumped together with balance
+    ledger_seq: int = Field(default=0)
+    # Above 0, sales are credited to one of this many DBWalletStripe rows
+    # instead of this row, which then only changes when they are compacted
+    stripes: int = Field(default=0)
     
 class WalletList(BaseModel):
     model_config = ConfigDict(from_attributes=True)
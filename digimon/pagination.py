@@ -0,0 +1,33 @@
+import base64
+import json
+
+from fastapi import HTTPException, status
+
+
+def encode_cursor(**values) -> str:
+    """Pack the sort key of the last row of a page into an opaque token."""
+    data = json.dumps(values, separators=(",", ":"), default=str).encode("utf-8")
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, **fields: type) -> dict:
+    """Unpack a token from ``encode_cursor`` whose values have the given types.
+
+    Cursors come from clients, so anything else is a 400 rather than a
+    value of the wrong type reaching the query.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if not isinstance(values, dict) or set(values) != set(fields):
+            raise ValueError(cursor)
+        for key, kind in fields.items():
+            # bool is an int subclass, but never a sort key
+            if not isinstance(values[key], kind) or isinstance(values[key], bool):
+                raise ValueError(cursor)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor",
+        )
+    return values
@@ -0,0 +1,472 @@
+import asyncio
+import datetime
+import logging
+from collections import defaultdict
+
+from fastapi import HTTPException, status
+from sqlalchemy.exc import SQLAlchemyError
+from sqlmodel import insert, select, update
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from . import config
+from . import ledger
+from . import models
+from . import sales
+from . import sharding
+from . import stripes
+
+
+logger = logging.getLogger(__name__)
+
+settings = config.get_settings()
+
+# session.info key for the cross-shard transfers its transaction creates
+PENDING_TRANSFERS = "pending_shard_transfers"
+
+# Pending transfers settled per shard and pass of retry_transfers
+RETRY_BATCH = 1000
+
+
+async def purchase_item(
+    session: AsyncSession,
+    item_id: int,
+    customer: models.TokenClaims,
+    description: str | None = None,
+) -> models.DBTransection:
+    """Move the item price from the customer wallet to the merchant wallet."""
+    transactions, _ = await checkout_cart(
+        session, [models.CartLine(item_id=item_id)], customer, description
+    )
+    return transactions[0]
+
+
+async def _load_items(session: AsyncSession, item_ids) -> dict:
+    result = await session.exec(
+        select(
+            models.DBItem.id,
+            models.DBItem.price,
+            models.DBItem.merchant_id,
+            models.DBItem.user_id,
+        ).where(models.DBItem.id.in_(item_ids))
+    )
+    return {row.id: row for row in result.all()}
+
+
+async def checkout_cart(
+    session: AsyncSession,
+    lines: list[models.CartLine],
+    customer: models.TokenClaims,
+    description: str | None = None,
+) -> tuple[list[models.DBTransection], float]:
+    """Charge the customer once for every line and credit each merchant once.
+
+    Balances are changed with conditional ``UPDATE ... RETURNING`` statements
+    so concurrent purchases never read-modify-write the same wallet, and the
+    debit only succeeds when the customer can afford the whole cart. The
+    customer and wallet ids come from the token claims. The caller owns the
+    transaction and must commit it.
+
+    When sharded ``session`` is on the customer's shard. Merchants on other
+    shards are not credited here: a pending transfer per merchant commits
+    with the debit instead, and ``complete_transfers`` credits them once
+    the caller has committed.
+    """
+    if customer.customer_id is None:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    if customer.wallet_id is None:
+        raise HTTPException(status_code=404, detail="Wallet not found")
+
+    quantities = defaultdict(int)
+    for line in lines:
+        quantities[line.item_id] += line.quantity
+
+    if models.sharded():
+        # Items stay on SQLDB_URL
+        async with models.session_factory() as primary:
+            items = await _load_items(primary, quantities)
+    else:
+        items = await _load_items(session, quantities)
+    if len(items) != len(quantities):
+        raise HTTPException(status_code=404, detail="Item not found")
+
+    total = 0.0
+    merchant_totals = defaultdict(float)
+    for item_id, quantity in quantities.items():
+        amount = items[item_id].price * quantity
+        total += amount
+        merchant_totals[items[item_id].user_id] += amount
+
+    merchant_lines = defaultdict(int)
+    for item_id in quantities:
+        merchant_lines[items[item_id].user_id] += 1
+
+    remote = set()
+    if models.sharded():
+        customer_shard = models.shard_index(customer.user_id)
+        remote = {
+            merchant_user_id
+            for merchant_user_id in merchant_totals
+            if models.shard_index(merchant_user_id) != customer_shard
+        }
+
+    debited = await session.exec(
+        update(models.DBWallet)
+        .where(
+            models.DBWallet.id == customer.wallet_id,
+            models.DBWallet.balance >= total,
+        )
+        .values(
+            balance=models.DBWallet.balance - total,
+            ledger_seq=models.DBWallet.ledger_seq + len(quantities),
+        )
+        .returning(models.DBWallet.balance, models.DBWallet.ledger_seq)
+        .execution_options(synchronize_session=False)
+    )
+    customer_wallet = debited.first()
+    if customer_wallet is None:
+        await session.rollback()
+        if await session.get(models.DBWallet, customer.wallet_id) is None:
+            raise HTTPException(status_code=404, detail="Wallet not found")
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Not enough balance.",
+        )
+
+    # Credit in a fixed order so concurrent carts lock merchant wallets alike
+    merchant_wallets = {}
+    striped_wallets = {}
+    for merchant_user_id in sorted(merchant_totals.keys() - remote):
+        credited = await session.exec(
+            update(models.DBWallet)
+            .where(
+                models.DBWallet.user_id == merchant_user_id,
+                models.DBWallet.stripes == 0,
+            )
+            .values(
+                balance=models.DBWallet.balance + merchant_totals[merchant_user_id],
+                ledger_seq=models.DBWallet.ledger_seq + merchant_lines[merchant_user_id],
+            )
+            .returning(
+                models.DBWallet.id, models.DBWallet.balance, models.DBWallet.ledger_seq
+            )
+            .execution_options(synchronize_session=False)
+        )
+        wallet = credited.first()
+        if wallet is not None:
+            merchant_wallets[merchant_user_id] = wallet
+            continue
+
+        # Striped wallets are credited below, once the transactions exist
+        wallet = await stripes.striped_wallet(session, merchant_user_id)
+        if wallet is None:
+            await session.rollback()
+            raise HTTPException(status_code=404, detail="Merchant wallet not found")
+        striped_wallets[merchant_user_id] = wallet
+
+    batch = ledger.LedgerBatch()
+    ids = await sharding.new_ids(models.DBTransection, len(quantities))
+    result = await session.exec(
+        insert(models.DBTransection).returning(
+            models.DBTransection, sort_by_parameter_order=True
+        ),
+        params=[
+            dict(
+                item_id=item_id,
+                description=description,
+                price=items[item_id].price * quantity,
+                quantity=quantity,
+                merchant_id=items[item_id].merchant_id,
+                customer_id=customer.customer_id,
+                created_at=batch.created_at,
+                **(dict(id=ids[index]) if ids else {}),
+            )
+            for index, (item_id, quantity) in enumerate(quantities.items())
+        ],
+    )
+
+    dbtransactions = list(result.scalars().all())
+
+    batch.post(
+        customer.wallet_id,
+        customer_wallet.ledger_seq,
+        customer_wallet.balance,
+        [(-t.price, models.LedgerEntryKind.purchase, t.id) for t in dbtransactions],
+    )
+    for merchant_user_id, wallet in merchant_wallets.items():
+        batch.post(
+            wallet.id,
+            wallet.ledger_seq,
+            wallet.balance,
+            [
+                (t.price, models.LedgerEntryKind.sale, t.id)
+                for t in dbtransactions
+                if items[t.item_id].user_id == merchant_user_id
+            ],
+        )
+    await batch.write(session)
+    # A striped wallet's sales are rolled up when it is compacted, as its
+    # rollup rows are as hot as its wallet row
+    await sales.record_sales(
+        session,
+        [t for t in dbtransactions if items[t.item_id].user_id not in striped_wallets],
+    )
+
+    # Last, so the stripe stays locked for as short a time as possible
+    for merchant_user_id, wallet in sorted(striped_wallets.items()):
+        await stripes.credit(
+            session,
+            wallet.id,
+            stripes.stripe_for(customer.wallet_id, wallet.stripes),
+            [
+                (t.price, t.id)
+                for t in dbtransactions
+                if items[t.item_id].user_id == merchant_user_id
+            ],
+            batch.created_at,
+        )
+
+    if remote:
+        transfer_ids = await sharding.new_ids(models.DBShardTransfer, len(remote))
+        session.add_all(
+            models.DBShardTransfer(
+                id=transfer_id,
+                customer_wallet_id=customer.wallet_id,
+                merchant_user_id=merchant_user_id,
+                amount=merchant_totals[merchant_user_id],
+                transaction_ids=[
+                    t.id
+                    for t in dbtransactions
+                    if items[t.item_id].user_id == merchant_user_id
+                ],
+                created_at=batch.created_at,
+            )
+            for transfer_id, merchant_user_id in zip(transfer_ids, sorted(remote))
+        )
+        session.info.setdefault(PENDING_TRANSFERS, []).extend(transfer_ids)
+
+    return dbtransactions, total
+
+
+# Cross-shard transfers
+#
+# A purchase from a merchant on another shard is a saga: the debit and a
+# pending transfer commit together on the customer's shard, the credit
+# commits on the merchant's shard, recorded in applied_transfers so it
+# happens once however often it is retried, and the transfer is then
+# marked completed. If the merchant wallet is gone the customer is
+# refunded instead.
+
+
+async def _credit_merchant(
+    merchant_session: AsyncSession, transfer: models.DBShardTransfer, transactions
+) -> bool:
+    """Credit ``transfer`` on the merchant's shard; False when there is no wallet."""
+    insert_applied = models.dialect_insert(merchant_session)
+    striped = await stripes.striped_wallet(merchant_session, transfer.merchant_user_id)
+    if striped is not None:
+        applied = await merchant_session.exec(
+            insert_applied(models.DBAppliedTransfer)
+            .values(transfer_id=transfer.id, wallet_id=striped.id)
+            .on_conflict_do_nothing()
+            .returning(models.DBAppliedTransfer.transfer_id)
+        )
+        if applied.first() is not None:
+            await stripes.credit(
+                merchant_session,
+                striped.id,
+                stripes.stripe_for(transfer.customer_wallet_id, striped.stripes),
+                [(price, t_id) for t_id, price in transactions],
+                transfer.created_at,
+            )
+        await merchant_session.commit()
+        return True
+
+    credited = await merchant_session.exec(
+        update(models.DBWallet)
+        .where(models.DBWallet.user_id == transfer.merchant_user_id)
+        .values(
+            balance=models.DBWallet.balance + transfer.amount,
+            ledger_seq=models.DBWallet.ledger_seq + len(transactions),
+        )
+        .returning(
+            models.DBWallet.id, models.DBWallet.balance, models.DBWallet.ledger_seq
+        )
+        .execution_options(synchronize_session=False)
+    )
+    wallet = credited.first()
+    if wallet is None:
+        await merchant_session.rollback()
+        return False
+
+    applied = await merchant_session.exec(
+        insert_applied(models.DBAppliedTransfer)
+        .values(transfer_id=transfer.id, wallet_id=wallet.id)
+        .on_conflict_do_nothing()
+        .returning(models.DBAppliedTransfer.transfer_id)
+    )
+    if applied.first() is None:
+        # An earlier attempt already credited it
+        await merchant_session.rollback()
+        return True
+
+    batch = ledger.LedgerBatch()
+    batch.post(
+        wallet.id,
+        wallet.ledger_seq,
+        wallet.balance,
+        [(price, models.LedgerEntryKind.sale, t_id) for t_id, price in transactions],
+    )
+    await batch.write(merchant_session)
+    await merchant_session.commit()
+    return True
+
+
+async def _refund_customer(
+    session: AsyncSession, transfer: models.DBShardTransfer, transactions
+):
+    refunded = await session.exec(
+        update(models.DBShardTransfer)
+        .where(
+            models.DBShardTransfer.id == transfer.id,
+            models.DBShardTransfer.status == models.ShardTransferStatus.pending,
+        )
+        .values(status=models.ShardTransferStatus.refunded)
+        .returning(models.DBShardTransfer.id)
+        .execution_options(synchronize_session=False)
+    )
+    if refunded.first() is None:
+        return
+
+    credited = await session.exec(
+        update(models.DBWallet)
+        .where(models.DBWallet.id == transfer.customer_wallet_id)
+        .values(
+            balance=models.DBWallet.balance + transfer.amount,
+            ledger_seq=models.DBWallet.ledger_seq + len(transactions),
+        )
+        .returning(models.DBWallet.balance, models.DBWallet.ledger_seq)
+        .execution_options(synchronize_session=False)
+    )
+    wallet = credited.first()
+    if wallet is None:
+        logger.error("transfer %d: customer wallet to refund is gone", transfer.id)
+        return
+
+    batch = ledger.LedgerBatch()
+    batch.post(
+        transfer.customer_wallet_id,
+        wallet.ledger_seq,
+        wallet.balance,
+        [
+            (price, models.LedgerEntryKind.adjustment, t_id)
+            for t_id, price in transactions
+        ],
+    )
+    await batch.write(session)
+    logger.warning(
+        "transfer %d refunded: merchant user %d has no wallet",
+        transfer.id, transfer.merchant_user_id,
+    )
+
+
+async def complete_transfer(
+    session: AsyncSession, transfer_id: int
+) -> models.ShardTransferStatus | None:
+    """Settle a transfer on ``session``'s shard, the customer's, and commit.
+
+    Safe to repeat, and to run from several workers at once.
+    """
+    transfer = await session.get(
+        models.DBShardTransfer, transfer_id, populate_existing=True
+    )
+    if transfer is None or transfer.status != models.ShardTransferStatus.pending:
+        await session.rollback()
+        return transfer and transfer.status
+
+    result = await session.exec(
+        select(models.DBTransection.id, models.DBTransection.price)
+        .where(models.DBTransection.id.in_(transfer.transaction_ids))
+        .order_by(models.DBTransection.id)
+    )
+    transactions = result.all()
+    # Hold nothing open here while the other shard is written; rolling back
+    # would expire the transfer, so detach it first
+    session.expunge(transfer)
+    await session.rollback()
+
+    async with models.shard_session(transfer.merchant_user_id) as merchant_session:
+        credited = await _credit_merchant(merchant_session, transfer, transactions)
+
+    if credited:
+        await session.exec(
+            update(models.DBShardTransfer)
+            .where(
+                models.DBShardTransfer.id == transfer.id,
+                models.DBShardTransfer.status == models.ShardTransferStatus.pending,
+            )
+            .values(status=models.ShardTransferStatus.completed)
+            .execution_options(synchronize_session=False)
+        )
+    else:
+        await _refund_customer(session, transfer, transactions)
+    await session.commit()
+
+    return (
+        models.ShardTransferStatus.completed
+        if credited
+        else models.ShardTransferStatus.refunded
+    )
+
+
+async def complete_transfers(session: AsyncSession):
+    """Settle the transfers committed by ``session``'s last purchase.
+
+    Failures are logged and left pending for ``retry_transfers``; the
+    purchase itself has already succeeded.
+    """
+    for transfer_id in session.info.pop(PENDING_TRANSFERS, []):
+        try:
+            await complete_transfer(session, transfer_id)
+        except (SQLAlchemyError, OSError) as exc:
+            await session.rollback()
+            logger.warning("transfer %d left for retry: %s", transfer_id, exc)
+
+
+async def retry_transfers(
+    older_than: float = settings.SHARD_TRANSFER_RETRY_SECONDS,
+) -> int:
+    """Settle transfers pending for more than ``older_than`` seconds on every shard."""
+    cutoff = datetime.datetime.now() - datetime.timedelta(seconds=older_than)
+    settled = 0
+    for factory in models.shard_session_factories:
+        async with factory() as session:
+            try:
+                result = await session.exec(
+                    select(models.DBShardTransfer.id)
+                    .where(
+                        models.DBShardTransfer.status
+                        == models.ShardTransferStatus.pending,
+                        models.DBShardTransfer.created_at <= cutoff,
+                    )
+                    .order_by(models.DBShardTransfer.created_at)
+                    .limit(RETRY_BATCH)
+                )
+                transfer_ids = result.all()
+                await session.rollback()
+                for transfer_id in transfer_ids:
+                    await complete_transfer(session, transfer_id)
+                    settled += 1
+            except (SQLAlchemyError, OSError) as exc:
+                await session.rollback()
+                logger.warning("retrying transfers stopped on a shard: %s", exc)
+    return settled
+
+
+async def run_transfer_retries():
+    while True:
+        await asyncio.sleep(settings.SHARD_TRANSFER_RETRY_SECONDS)
+        try:
+            await retry_transfers()
+        except Exception:
+            # Keep retrying; stopping would leave transfers pending for good
+            logger.exception("retrying transfers failed")
@@ -0,0 +1,216 @@
+import asyncio
+import contextlib
+import itertools
+import logging
+import math
+import time
+from typing import AsyncIterator
+
+from fastapi import Request
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.orm import sessionmaker
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from . import config
+from . import models
+
+
+logger = logging.getLogger(__name__)
+
+settings = config.get_settings()
+
+# Holds the time until which the client's reads go to the primary
+PIN_COOKIE = "primary_until"
+
+# Request methods that never write
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+# Replay lag in seconds; an idle replica that has replayed everything it
+# received is current even though its last replayed transaction is old
+LAG_QUERY = text(
+    "SELECT CASE"
+    " WHEN NOT pg_is_in_recovery()"
+    " OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0"
+    " ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())"
+    " END"
+)
+
+
+class Replica:
+    __slots__ = ("name", "engine", "session_factory", "healthy", "lag_seconds")
+
+    def __init__(self, url: str, engine: AsyncEngine):
+        self.name = make_url(url).render_as_string(hide_password=True)
+        self.engine = engine
+        self.session_factory = sessionmaker(
+            engine, class_=AsyncSession, expire_on_commit=False
+        )
+        # Assumed healthy until a connection or health check says otherwise
+        self.healthy = True
+        self.lag_seconds = None
+
+
+class ReplicaSet:
+    """Read-only engines handed out round-robin while they are healthy.
+
+    A replica is marked unhealthy when a read cannot connect to it or a
+    health check fails or finds it lagging, and healthy again by the next
+    health check that passes.
+    """
+
+    def __init__(self, replicas: list[Replica]):
+        self.replicas = replicas
+        self._turn = itertools.count()
+
+    def candidates(self) -> list[Replica]:
+        """Healthy replicas, starting one further along on every call."""
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return healthy
+        start = next(self._turn) % len(healthy)
+        return healthy[start:] + healthy[:start]
+
+    def mark_unhealthy(self, replica: Replica, reason):
+        if replica.healthy:
+            logger.warning("replica %s is unhealthy: %s", replica.name, reason)
+        replica.healthy = False
+
+    async def _lag(self, replica: Replica) -> float | None:
+        """Replay lag in seconds, or None while it cannot be told.
+
+        A replica that is behind but has not replayed a transaction since
+        it started has no replay timestamp to measure from.
+        """
+        async with replica.engine.connect() as conn:
+            if conn.dialect.name != "postgresql":
+                await conn.execute(text("SELECT 1"))
+                return 0.0
+            lag = (await conn.execute(LAG_QUERY)).scalar()
+            return None if lag is None else float(lag)
+
+    async def check(self, replica: Replica):
+        try:
+            lag = await asyncio.wait_for(
+                self._lag(replica), settings.REPLICA_CONNECT_TIMEOUT_SECONDS
+            )
+        except (SQLAlchemyError, OSError) as exc:
+            self.mark_unhealthy(replica, exc)
+            return
+
+        replica.lag_seconds = lag
+        if lag is None:
+            self.mark_unhealthy(replica, "replay lag unknown")
+        elif lag > settings.REPLICA_MAX_LAG_SECONDS:
+            self.mark_unhealthy(replica, f"{lag:.1f}s behind the primary")
+        elif not replica.healthy:
+            logger.info("replica %s is healthy again", replica.name)
+            replica.healthy = True
+
+    async def check_all(self):
+        await asyncio.gather(*(self.check(replica) for replica in self.replicas))
+
+    async def run_health_checks(self):
+        while True:
+            try:
+                await self.check_all()
+            except Exception:
+                # Keep checking; a replica left unhealthy would never return
+                logger.exception("replica health check failed")
+            await asyncio.sleep(settings.REPLICA_HEALTH_CHECK_SECONDS)
+
+    async def dispose(self):
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+
+replica_set = ReplicaSet([])
+
+
+def init_replicas(settings):
+    global replica_set
+    replica_set = ReplicaSet(
+        [
+            Replica(url, models.make_engine(url, settings))
+            for url in settings.SQLDB_REPLICA_URLS
+        ]
+    )
+
+
+@contextlib.asynccontextmanager
+async def read_session(primary: bool = False) -> AsyncIterator[AsyncSession]:
+    """A session for reads on the next healthy replica.
+
+    Falls back to the next replica, and at last to the primary, when one
+    cannot be connected to in time. ``primary`` skips the replicas.
+    """
+    if not primary:
+        for replica in replica_set.candidates():
+            session = replica.session_factory()
+            try:
+                # Connect now, while another database can still be chosen
+                await asyncio.wait_for(
+                    session.connection(), settings.REPLICA_CONNECT_TIMEOUT_SECONDS
+                )
+            except (SQLAlchemyError, OSError) as exc:
+                await session.close()
+                replica_set.mark_unhealthy(replica, exc)
+                continue
+
+            async with session:
+                yield session
+            return
+
+    async with models.session_factory() as session:
+        yield session
+
+
+def pinned_to_primary(request: Request) -> bool:
+    until = request.cookies.get(PIN_COOKIE)
+    if until is None:
+        return False
+    try:
+        return float(until) > time.time()
+    except ValueError:
+        return False
+
+
+async def get_read_session(request: Request) -> AsyncIterator[AsyncSession]:
+    async with read_session(primary=pinned_to_primary(request)) as session:
+        yield session
+
+
+class ReadYourWritesMiddleware:
+    """Pure ASGI middleware pinning a client's reads to the primary after it writes.
+
+    Every successful request with a method that may write sets a cookie
+    that sends the client's reads through ``get_read_session`` to the
+    primary until it expires. The pin travels with the client, so it holds
+    whichever worker serves the next read.
+    """
+
+    def __init__(self, app, seconds: float):
+        self.app = app
+        self.seconds = seconds
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in SAFE_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_pin(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                cookie = (
+                    f"{PIN_COOKIE}={time.time() + self.seconds:.3f}; "
+                    f"Max-Age={math.ceil(self.seconds)}; Path=/; HttpOnly; SameSite=Lax"
+                )
+                message = dict(
+                    message,
+                    headers=list(message.get("headers", []))
+                    + [(b"set-cookie", cookie.encode("latin-1"))],
+                )
+            await send(message)
+
+        await self.app(scope, receive, send_with_pin)
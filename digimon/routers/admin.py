@@ -0,0 +1,99 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from typing import Annotated
+from sqlalchemy import text
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from .. import caching
+from .. import deps
+from .. import models
+from .. import config
+from .. import replicas
+from .. import sharding
+from .. import slow_queries
+from .. import stripes
+
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["admin"],
+    dependencies=[Depends(deps.get_current_active_superuser)],
+)
+
+settings = config.get_settings()
+
+
+@router.get("/pool")
+async def read_pool_stats(
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+) -> models.PoolStats:
+    stats = models.pool_stats(settings.DB_MAX_OVERFLOW)
+
+    if session.bind.dialect.name == "postgresql":
+        result = await session.exec(text("SHOW max_connections"))
+        stats.server_max_connections = int(result.scalar())
+        if stats.max_connections_per_worker:
+            stats.max_workers = (
+                stats.server_max_connections // stats.max_connections_per_worker
+            )
+
+    return stats
+
+
+@router.get("/caches")
+async def read_cache_stats() -> list[models.CacheStats]:
+    return [
+        models.CacheStats(
+            name=cache.name,
+            size=len(cache),
+            max_size=cache.maxsize,
+            ttl=cache.ttl,
+            hits=cache.hits,
+            misses=cache.misses,
+        )
+        for cache in caching.caches.values()
+    ]
+
+
+@router.get("/replicas")
+async def read_replicas(check: bool = False) -> list[models.ReplicaStatus]:
+    if check:
+        await replicas.replica_set.check_all()
+    return [
+        models.ReplicaStatus(
+            name=replica.name,
+            healthy=replica.healthy,
+            lag_seconds=replica.lag_seconds,
+        )
+        for replica in replicas.replica_set.replicas
+    ]
+
+
+@router.get("/slow-queries")
+async def read_slow_queries(
+    limit: Annotated[int, Query(gt=0, le=1000)] = 50,
+    explain: bool = False,
+) -> models.SlowQueryReport:
+    if explain:
+        await slow_queries.log.explain(limit)
+    return slow_queries.log.report(limit)
+
+
+@router.delete("/slow-queries")
+async def reset_slow_queries() -> dict:
+    slow_queries.log.clear()
+    return dict(message="reset success")
+
+
+@router.put("/wallets/{wallet_id}/stripes")
+async def update_wallet_stripes(
+    wallet_id: int,
+    count: Annotated[int, Query(ge=0, le=settings.WALLET_MAX_STRIPES)],
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+) -> models.WalletStripes:
+    """Credit a hot wallet's sales to ``count`` stripes, or to the wallet itself with 0."""
+    async with sharding.row_session(session, models.DBWallet, wallet_id) as shard:
+        wallet_stripes = await stripes.set_stripes(shard, wallet_id, count)
+    if wallet_stripes is None:
+        raise HTTPException(status_code=404, detail="Wallet not found")
+    return wallet_stripes
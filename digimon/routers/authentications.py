@@ -12,6 +12,7 @@ from typing import Annotated
 import datetime
 
 from .. import config
+from .. import deps
 from .. import models
 from .. import security
 
@@ -54,18 +55,25 @@ async def authentication(
             detail="Incorrect username or password",
         )
 
+    if user.password_needs_rehash():
+        # Upgrade hashes made with an older work factor while we know the password
+        await user.set_password(form_data.password)
+
     user.last_login_date = datetime.datetime.now()
 
     session.add(user)
     await session.commit()
     await session.refresh(user)
+    deps.user_cache.invalidate(user.id)
+
+    claims = await deps.resolve_token_claims(session, user.id, user.role)
 
     access_token_expires = datetime.timedelta(
         minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES
     )
     return models.Token(
         access_token=security.create_access_token(
-            data={"sub": user.id},
+            data={"sub": user.id, **claims.model_dump(exclude={"user_id"}, exclude_none=True, mode="json")},
             expires_delta=access_token_expires,
         ),
         refresh_token=security.create_refresh_token(
@@ -1,11 +1,12 @@
-from fastapi import APIRouter, HTTPException, Depends , status
+from fastapi import APIRouter, HTTPException, Depends , Header, status
 
 from typing import Optional, Annotated
-from sqlmodel import Field, SQLModel, create_engine, Session, select
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 from .. import deps
+from .. import idempotency
 from .. import models
+from .. import purchases
 
 
 router = APIRouter(prefix="/buy")
@@ -13,48 +14,69 @@ router = APIRouter(prefix="/buy")
 @router.post("")
 async def buy_item(
     transaction: models.CreatedTransaction,
-    session: Annotated[AsyncSession, Depends(models.get_session)],
-    current_user: models.User = Depends(deps.get_current_user),
-):
-    if current_user.role != "customer" :
+    session: Annotated[AsyncSession, Depends(deps.get_shard_session)],
+    claims: Annotated[models.TokenClaims, Depends(deps.get_token_claims)],
+    idempotency_key: Annotated[str | None, Header(max_length=255)] = None,
+) -> models.Transaction:
+    if claims.role != "customer" :
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Only customer can buy items."
         )
-    statement = select(models.DBItem).where(models.DBItem.id == transaction.item_id)
-    result = await session.exec(statement)
-    dbitem = result.one_or_none()
-    
-
-    
-    statement = select(models.DBWallet).where(models.DBWallet.user_id == dbitem.user_id)
-    result = await session.exec(statement)
-    merchant_wallet = result.one_or_none()
-    
-    statement = select(models.DBWallet).where(models.DBWallet.user_id == current_user.id)
-    result = await session.exec(statement)
-    customer_wallet = result.one_or_none()
-    
-    statement = select(models.DBCustomer).where(models.DBCustomer.user_id == current_user.id)
-    result = await session.exec(statement)
-    dbcustomer = result.one_or_none()
-    
-    dbtransaction = models.DBTransection.from_orm(transaction)
-    
-    price = dbitem.price
-    dbtransaction.price = price
-    dbtransaction.merchant_id = dbitem.merchant_id
-    dbtransaction.customer_id = dbcustomer.id
-    
-    merchant_wallet.balance += price
-    customer_wallet.balance -= price
-    
-    merchant_wallet.sqlmodel_update(merchant_wallet)
-    customer_wallet.sqlmodel_update(customer_wallet)
-    session.add(dbtransaction)
-    session.add(merchant_wallet)
-    session.add(customer_wallet)
-    await session.commit()
-    await session.refresh(dbtransaction)
-    
-    return models.Transaction.from_orm(dbtransaction)
\ No newline at end of file
+
+    async def purchase():
+        dbtransaction = await purchases.purchase_item(
+            session,
+            item_id=transaction.item_id,
+            customer=claims,
+            description=transaction.description,
+        )
+        return models.Transaction.from_orm(dbtransaction)
+
+    response = await idempotency.run(
+        session,
+        claims.user_id,
+        idempotency_key,
+        idempotency.request_hash("POST", "/buy", transaction.model_dump(mode="json")),
+        purchase,
+    )
+    # Credits to merchants on other shards, once the purchase has committed
+    await purchases.complete_transfers(session)
+    return response
+
+
+@router.post("/cart")
+async def buy_cart(
+    cart: models.CreatedCart,
+    session: Annotated[AsyncSession, Depends(deps.get_shard_session)],
+    claims: Annotated[models.TokenClaims, Depends(deps.get_token_claims)],
+    idempotency_key: Annotated[str | None, Header(max_length=255)] = None,
+) -> models.Checkout:
+    if claims.role != "customer" :
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only customer can buy items."
+        )
+
+    async def checkout():
+        dbtransactions, total = await purchases.checkout_cart(
+            session,
+            lines=cart.items,
+            customer=claims,
+            description=cart.description,
+        )
+        return models.Checkout(
+            transactions=[models.Transaction.from_orm(t) for t in dbtransactions],
+            total=total,
+        )
+
+    response = await idempotency.run(
+        session,
+        claims.user_id,
+        idempotency_key,
+        idempotency.request_hash("POST", "/buy/cart", cart.model_dump(mode="json")),
+        checkout,
+    )
+    # Credits to merchants on other shards, once the purchase has committed
+    await purchases.complete_transfers(session)
+    return response
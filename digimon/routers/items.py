@@ -1,11 +1,18 @@
 import math
-from fastapi import APIRouter, HTTPException, Depends , status
+from fastapi import APIRouter, HTTPException, Depends , Query, Request, Response, status
 from typing import Optional, List, Annotated
-from sqlalchemy import func
 from sqlmodel import Field, SQLModel, select
 
+from .. import caching
+from .. import config
 from .. import models
+from .. import counters
 from .. import deps
+from .. import item_import
+from .. import pagination
+from .. import replicas
+from .. import responses
+from .. import search
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 router = APIRouter(prefix="/items")
@@ -14,96 +21,220 @@ router = APIRouter(prefix="/items")
 
 SIZE_PER_PAGE = 50
 
+settings = config.get_settings()
 
-@router.get("")
-async def read_items(
-    session: Annotated[AsyncSession, Depends(models.get_session)],
-    page: int = 1,
+responder = responses.ModelResponder("items")
+
+# item id -> CachedResponse of read_item
+item_cache = caching.TTLCache(
+    "items", settings.ITEM_CACHE_SIZE, settings.ITEM_CACHE_TTL_SECONDS
+)
+# list query -> CachedResponse; any item change clears the whole cache
+item_list_cache = caching.TTLCache(
+    "item_lists", settings.ITEM_LIST_CACHE_SIZE, settings.ITEM_CACHE_TTL_SECONDS
+)
+
+
+def invalidate_item(item_id: int | None = None):
+    if item_id is not None:
+        item_cache.invalidate(item_id)
+    item_list_cache.clear()
+
+
+async def _list_items(
+    session: AsyncSession,
+    page: int,
+    page_size: int,
+    cursor: str | None,
+    merchant_id: int | None,
 ) -> models.ItemList:
+    statement = select(models.DBItem)
 
-    result = await session.exec(
-        select(models.DBItem).offset((page - 1) * SIZE_PER_PAGE).limit(SIZE_PER_PAGE)
-    )
+    if merchant_id is not None:
+        statement = statement.where(models.DBItem.merchant_id == merchant_id)
+        statement = statement.order_by(models.DBItem.merchant_id, models.DBItem.id)
+    else:
+        statement = statement.order_by(models.DBItem.id)
+
+    if cursor:
+        # Seek past the last row of the previous page instead of OFFSET,
+        # so every page costs the same index range scan.
+        if merchant_id is not None:
+            position = pagination.decode_cursor(cursor, merchant_id=int, id=int)
+            if position["merchant_id"] != merchant_id:
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+        else:
+            position = pagination.decode_cursor(cursor, id=int)
+        statement = statement.where(models.DBItem.id > position["id"])
+    else:
+        statement = statement.offset((page - 1) * page_size)
+
+    result = await session.exec(statement.limit(page_size + 1))
     items = result.all()
 
-    page_count = int(
-        math.ceil(
-            (await session.exec(select(func.count(models.DBItem.id)))).first()
-            / SIZE_PER_PAGE
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        if merchant_id is not None:
+            next_cursor = pagination.encode_cursor(merchant_id=merchant_id, id=items[-1].id)
+        else:
+            next_cursor = pagination.encode_cursor(id=items[-1].id)
+
+    item_count = await counters.read_item_count(session, merchant_id)
+    page_count = int(math.ceil(item_count / page_size))
+
+    return responder.validate(
+        models.ItemList,
+        dict(
+            items=items,
+            page_count=page_count,
+            page=page,
+            size_per_page=page_size,
+            next_cursor=next_cursor,
         )
     )
 
-    print("page_count", page_count)
-    print("items", items)
-    return models.ItemList.from_orm(
-        dict(items=items, page_count=page_count, page=page, size_per_page=SIZE_PER_PAGE)
+
+async def _cached_item_list(
+    request: Request,
+    session: AsyncSession,
+    page: int,
+    page_size: int,
+    cursor: str | None,
+    merchant_id: int | None,
+) -> Response:
+    key = (page, page_size, cursor, merchant_id)
+    cached = item_list_cache.get(key)
+    if cached is None:
+        item_list = await _list_items(session, page, page_size, cursor, merchant_id)
+        cached = caching.cached_response(item_list)
+        item_list_cache.set(key, cached)
+    return caching.etag_response(request, cached)
+
+
+@router.get("", response_model=models.ItemList)
+async def read_items(
+    request: Request,
+    session: Annotated[AsyncSession, Depends(replicas.get_read_session)],
+    page: int = 1,
+    cursor: str | None = None,
+    merchant_id: int | None = None,
+) -> Response:
+    return await _cached_item_list(
+        request, session, page, SIZE_PER_PAGE, cursor, merchant_id
     )
 
-@router.get("/{page_size}/")
+@router.get("/{page_size}/", response_model=models.ItemList)
 async def read_items(
+    request: Request,
     page_size : int,
-    session: Annotated[AsyncSession, Depends(models.get_session)],
+    session: Annotated[AsyncSession, Depends(replicas.get_read_session)],
     page: int = 1,
-) -> models.ItemList:
-
-    result = await session.exec(
-        select(models.DBItem).offset((page - 1) * page_size).limit(page_size)
+    cursor: str | None = None,
+    merchant_id: int | None = None,
+) -> Response:
+    return await _cached_item_list(
+        request, session, page, page_size, cursor, merchant_id
     )
-    items = result.all()
 
-    page_count = int(
-        math.ceil(
-            (await session.exec(select(func.count(models.DBItem.id)))).first()
-            / page_size
-        )
-    )
 
-    print("page_count", page_count)
-    print("items", items)
-    return models.ItemList.from_orm(
-        dict(items=items, page_count=page_count, page=page, size_per_page=SIZE_PER_PAGE,page_size=page_size)
-    )
 
+@router.get("/search")
+async def search_items(
+    q: Annotated[str, Query(min_length=1, max_length=100)],
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+    page: Annotated[int, Query(ge=1)] = 1,
+    page_size: Annotated[int, Query(ge=1, le=100)] = 20,
+) -> models.ItemSearchResult:
+    return await search.search_items(session, q, page, page_size)
 
 
 @router.post("")
 async def create_item(
     item: models.CreatedItem,
     session: Annotated[AsyncSession, Depends(models.get_session)],
-    current_user: models.User = Depends(deps.get_current_user),
+    claims: Annotated[models.TokenClaims, Depends(deps.get_token_claims)],
 ) -> models.Item | None:
     # Check if the current user is a merchant
-    if current_user.role != "merchant" :
+    if claims.role != "merchant" :
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Only merchants can create items."
         )
-
-    statement = select(models.DBMerchant).where(models.DBMerchant.user_id == current_user.id)
-    result = await session.exec(statement)
-    dbmerchant = result.one_or_none()
-
+    if claims.merchant_id is None:
+        raise HTTPException(status_code=404, detail="Merchant not found")
 
     # Create the item
-    data = item.dict()
     dbitem = models.DBItem.from_orm(item)
-    dbitem.role = current_user.role
+    dbitem.role = claims.role
     
-    dbitem.user = current_user
-    dbitem.merchant_id = dbmerchant.id
+    dbitem.user_id = claims.user_id
+    dbitem.merchant_id = claims.merchant_id
     session.add(dbitem)
+    await counters.adjust_item_count(session, claims.merchant_id, 1)
     await session.commit()
     await session.refresh(dbitem)
+    invalidate_item()
+    if search.item_index.loaded:
+        search.item_index.add(dbitem.id, dbitem.name, dbitem.description)
 
     return models.Item.from_orm(dbitem)
 
 
-@router.get("/{item_id}")
-async def read_item(item_id: int, session: Annotated[AsyncSession, Depends(models.get_session)]) -> models.Item:
-    db_item = await session.get(models.DBItem, item_id)
-    if db_item:
-        return models.Item.from_orm(db_item)
-    raise HTTPException(status_code=404, detail="Item not found")
+@router.post("/bulk")
+async def import_items(
+    request: Request,
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+    claims: Annotated[models.TokenClaims, Depends(deps.get_token_claims)],
+    format: item_import.ImportFormat | None = None,
+) -> models.ItemImportReport:
+    """Create items from a CSV or NDJSON upload streamed in the request body.
+
+    The format comes from ``format`` or else the Content-Type header. CSV
+    needs a header row naming the item fields.
+    """
+    if claims.role != "merchant" :
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only merchants can create items."
+        )
+    if claims.merchant_id is None:
+        raise HTTPException(status_code=404, detail="Merchant not found")
+
+    if format is None:
+        content_type = request.headers.get("content-type", "")
+        format = (
+            item_import.ImportFormat.csv
+            if content_type.startswith("text/csv")
+            else item_import.ImportFormat.ndjson
+        )
+
+    def index_items(rows):
+        for item_id, name, description in rows:
+            search.item_index.add(item_id, name, description)
+
+    try:
+        return await item_import.import_items(
+            session,
+            claims,
+            request.stream(),
+            format,
+            index_items if search.item_index.loaded else None,
+        )
+    finally:
+        invalidate_item()
+
+
+@router.get("/{item_id}", response_model=models.Item)
+async def read_item(item_id: int, request: Request, session: Annotated[AsyncSession, Depends(replicas.get_read_session)]) -> Response:
+    cached = item_cache.get(item_id)
+    if cached is None:
+        db_item = await session.get(models.DBItem, item_id)
+        if not db_item:
+            raise HTTPException(status_code=404, detail="Item not found")
+        cached = caching.cached_response(models.Item.from_orm(db_item))
+        item_cache.set(item_id, cached)
+    return caching.etag_response(request, cached)
 
 @router.put("/{item_id}")
 async def update_item(item_id: int, item: Annotated[models.UpdatedItem, Depends()], session: Annotated[AsyncSession, Depends(models.get_session)]) -> models.Item:
@@ -117,6 +248,9 @@ async def update_item(item_id: int, item: Annotated[models.UpdatedItem, Depends(
     session.add(db_item)
     await session.commit()
     await session.refresh(db_item)
+    invalidate_item(item_id)
+    if search.item_index.loaded:
+        search.item_index.add(db_item.id, db_item.name, db_item.description)
     return models.Item.from_orm(db_item)
 
 @router.delete("/{item_id}")
@@ -125,5 +259,8 @@ async def delete_item(item_id: int, session: Annotated[AsyncSession, Depends(mod
     if not db_item:
         raise HTTPException(status_code=404, detail="Item not found")
     await session.delete(db_item)
+    await counters.adjust_item_count(session, db_item.merchant_id, -1)
     await session.commit()
+    invalidate_item(item_id)
+    search.item_index.remove(item_id)
     return {"message": "Item deleted successfully"}
@@ -1,4 +1,5 @@
-from fastapi import APIRouter, HTTPException, Depends
+import datetime
+from fastapi import APIRouter, HTTPException, Depends, Query, status
 
 from typing import Optional, Annotated
 from sqlmodel import Field, SQLModel, create_engine, Session, select
@@ -12,7 +13,6 @@ from ..models import (
     UpdatedMerchant,
     MerchantList,
     DBMerchant,
-    engine,
     get_session,
 )
 
@@ -20,6 +20,9 @@ router = APIRouter(prefix="/merchants")
 
 
 from .. import deps
+from .. import models
+from .. import replicas
+from .. import sales
 
 # @router.post("")
 # async def create_merchant(
@@ -41,7 +44,7 @@ from .. import deps
 
 @router.get("")
 async def read_merchants(
-    session: Annotated[AsyncSession, Depends(get_session)]
+    session: Annotated[AsyncSession, Depends(replicas.get_read_session)]
 ) -> MerchantList:
     result = await session.exec(select(DBMerchant))
     merchants = result.all()
@@ -53,7 +56,7 @@ async def read_merchants(
 
 @router.get("/{merchant_id}")
 async def read_merchant(
-    merchant_id: int, session: Annotated[AsyncSession, Depends(get_session)]
+    merchant_id: int, session: Annotated[AsyncSession, Depends(replicas.get_read_session)]
 ) -> Merchant:
     db_merchant = await session.get(DBMerchant, merchant_id)
     if db_merchant:
@@ -76,3 +79,36 @@ async def update_merchant(
 
     return Merchant.from_orm(db_merchant)
 
+
+async def _get_own_merchant_id(
+    merchant_id: int,
+    claims: Annotated[models.TokenClaims, Depends(deps.get_token_claims)],
+) -> int:
+    if claims.merchant_id != merchant_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only the merchant can see its sales.",
+        )
+    return merchant_id
+
+
+@router.get("/{merchant_id}/sales")
+async def read_merchant_sales(
+    merchant_id: Annotated[int, Depends(_get_own_merchant_id)],
+    session: Annotated[AsyncSession, Depends(replicas.get_read_session)],
+    granularity: models.SalesGranularity = models.SalesGranularity.day,
+    start: datetime.datetime | None = None,
+    end: datetime.datetime | None = None,
+) -> models.MerchantSales:
+    return await sales.merchant_sales(session, merchant_id, granularity, start, end)
+
+
+@router.get("/{merchant_id}/sales/items")
+async def read_merchant_item_sales(
+    merchant_id: Annotated[int, Depends(_get_own_merchant_id)],
+    session: Annotated[AsyncSession, Depends(replicas.get_read_session)],
+    start: datetime.datetime | None = None,
+    end: datetime.datetime | None = None,
+    limit: Annotated[int, Query(gt=0, le=500)] = 50,
+) -> models.MerchantItemSales:
+    return await sales.merchant_item_sales(session, merchant_id, start, end, limit)
@@ -1,41 +1,283 @@
+import bisect
+import contextlib
+import csv
+import datetime
+import enum
+import heapq
+import io
+import itertools
+import json
 from typing import Annotated
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import tuple_
 from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlmodel import select
 from ..models.transactions import BaseTransaction, DBTransection, TransactionList
-from ..models import engine
+from .. import config
+from .. import deps
+from .. import models
+from .. import pagination
+from .. import replicas
+from .. import responses
+from .. import sharding
 
 router = APIRouter(prefix="/transections")
 
-async def get_session():
-    async with AsyncSession(engine) as session:
-        yield session
+settings = config.get_settings()
+
+responder = responses.ModelResponder("transactions")
+
+EXPORT_COLUMNS = (
+    DBTransection.id,
+    DBTransection.item_id,
+    DBTransection.merchant_id,
+    DBTransection.customer_id,
+    DBTransection.price,
+    DBTransection.quantity,
+    DBTransection.description,
+    DBTransection.created_at,
+)
+
+
+class ExportFormat(str, enum.Enum):
+    ndjson = "ndjson"
+    csv = "csv"
 
 @router.post("/transection")
 async def create_transection(
     transection: Annotated[BaseTransaction, Depends()],
-    session: Annotated[AsyncSession, Depends(get_session)]
+    session: Annotated[AsyncSession, Depends(models.get_session)]
 ):
     db_transection = DBTransection(**transection.dict())
-    session.add(db_transection)
-    await session.commit()
-    await session.refresh(db_transection)
+    user_id = None
+    if models.sharded():
+        # Transactions live on the shard of the customer's user
+        result = await session.exec(
+            select(models.DBCustomer.user_id).where(
+                models.DBCustomer.id == db_transection.customer_id
+            )
+        )
+        user_id = result.first()
+        if user_id is None:
+            raise HTTPException(status_code=404, detail="Customer not found")
+        db_transection.id = (await sharding.new_ids(DBTransection, 1))[0]
+
+    async with models.shard_session(user_id, session) as shard:
+        shard.add(db_transection)
+        await shard.commit()
+        await shard.refresh(db_transection)
     return db_transection
 
 @router.get("/transections")
 async def read_transections(
-    session: Annotated[AsyncSession, Depends(get_session)]
+    session: Annotated[AsyncSession, Depends(replicas.get_read_session)]
+) -> TransactionList:
+    async def query(shard):
+        return (await shard.exec(select(DBTransection))).all()
+
+    transections = [
+        transection
+        for shard_transections in await models.gather_shards(session, query)
+        for transection in shard_transections
+    ]
+    transections.sort(key=lambda transection: transection.id)
+    return responder.response(TransactionList, dict(transactions=transections, page_size=0, page=0, size_per_page=0))
+
+def _owner_filter(claims: models.TokenClaims):
+    """Where clause for the transactions of the calling customer or merchant."""
+    if claims.role == models.UserRole.customer and claims.customer_id is not None:
+        return DBTransection.customer_id == claims.customer_id
+    if claims.role == models.UserRole.merchant and claims.merchant_id is not None:
+        return DBTransection.merchant_id == claims.merchant_id
+    raise HTTPException(
+        status_code=status.HTTP_403_FORBIDDEN,
+        detail="Only customers and merchants have a transaction history.",
+    )
+
+
+async def _merge_by_id(results):
+    """Merge id-ordered row streams into id-ordered batches.
+
+    Each batch takes the rows up to the lowest last id among the streams'
+    current partitions, so at least one partition is used up per batch and
+    no more than one partition per stream is held in memory.
+    """
+    partitions = [result.partitions() for result in results]
+    pending = [[] for _ in results]
+    while True:
+        for index, stream in enumerate(partitions):
+            if stream is not None and not pending[index]:
+                pending[index] = await anext(stream, [])
+                if not pending[index]:
+                    partitions[index] = None
+
+        bounds = [rows[-1].id for rows in pending if rows]
+        if not bounds:
+            return
+        bound = min(bounds)
+        taken = []
+        for index, rows in enumerate(pending):
+            cut = bisect.bisect_right(rows, bound, key=lambda row: row.id)
+            taken.append(rows[:cut])
+            pending[index] = rows[cut:]
+        yield list(heapq.merge(*taken, key=lambda row: row.id))
+
+
+async def _export_rows(
+    statement, export_format: ExportFormat, primary: bool, claims: models.TokenClaims
+):
+    # The request session is closed before the body is sent, so the stream
+    # owns its sessions and keeps one batch of rows per session in memory.
+    if not models.sharded():
+        open_sessions = [lambda: replicas.read_session(primary)]
+    elif claims.role == models.UserRole.customer:
+        open_sessions = [lambda: models.shard_session(claims.user_id)]
+    else:
+        # A merchant's sales are on every shard, merged back into id order
+        open_sessions = models.shard_session_factories
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if export_format == ExportFormat.csv:
+        writer.writerow(column.key for column in EXPORT_COLUMNS)
+
+    async with contextlib.AsyncExitStack() as stack:
+        results = []
+        for open_session in open_sessions:
+            session = await stack.enter_async_context(open_session())
+            results.append(
+                await session.stream(
+                    statement.execution_options(yield_per=settings.EXPORT_BATCH_SIZE)
+                )
+            )
+        if len(results) == 1:
+            batches = results[0].partitions()
+        else:
+            batches = _merge_by_id(results)
+
+        async for rows in batches:
+            if export_format == ExportFormat.csv:
+                writer.writerows(rows)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            else:
+                yield "".join(
+                    json.dumps(row._asdict(), default=datetime.datetime.isoformat) + "\n"
+                    for row in rows
+                )
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+@router.get("/export")
+async def export_transections(
+    request: Request,
+    claims: Annotated[models.TokenClaims, Depends(deps.get_token_claims)],
+    format: ExportFormat = ExportFormat.ndjson,
+    min_id: Annotated[int | None, Query(ge=0)] = None,
+    max_id: Annotated[int | None, Query(ge=0)] = None,
+) -> StreamingResponse:
+    """Transactions of the calling customer or merchant, in id order."""
+    statement = select(*EXPORT_COLUMNS).where(_owner_filter(claims))
+    if min_id is not None:
+        statement = statement.where(DBTransection.id >= min_id)
+    if max_id is not None:
+        statement = statement.where(DBTransection.id <= max_id)
+    statement = statement.order_by(DBTransection.id)
+    primary = replicas.pinned_to_primary(request)
+
+    if format == ExportFormat.csv:
+        return StreamingResponse(
+            _export_rows(statement, format, primary, claims),
+            media_type="text/csv",
+            headers={"Content-Disposition": 'attachment; filename="transections.csv"'},
+        )
+    return StreamingResponse(
+        _export_rows(statement, format, primary, claims), media_type="application/x-ndjson"
+    )
+
+
+@router.get("/history")
+async def read_transection_history(
+    session: Annotated[AsyncSession, Depends(replicas.get_read_session)],
+    claims: Annotated[models.TokenClaims, Depends(deps.get_token_claims)],
+    start: datetime.datetime | None = None,
+    end: datetime.datetime | None = None,
+    cursor: str | None = None,
+    limit: Annotated[int, Query(gt=0, le=500)] = 50,
 ) -> TransactionList:
-    result = await session.exec(select(DBTransection))
-    transections = result.all()
-    return TransactionList.from_orm(dict(transactions=transections, page_size=0, page=0, size_per_page=0))
+    """Transactions of the calling customer or merchant, newest first."""
+    # Equality on the owner plus a range on (created_at, id) stays inside
+    # one of the (owner, created_at, id) indexes, however old the page is.
+    statement = select(DBTransection).where(_owner_filter(claims))
+    if start is not None:
+        statement = statement.where(DBTransection.created_at >= start)
+    if end is not None:
+        statement = statement.where(DBTransection.created_at < end)
+    if cursor:
+        position = pagination.decode_cursor(cursor, created_at=str, id=int)
+        try:
+            created_at = datetime.datetime.fromisoformat(position["created_at"])
+            last_id = int(position["id"])
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        statement = statement.where(
+            tuple_(DBTransection.created_at, DBTransection.id)
+            < tuple_(created_at, last_id)
+        )
+
+    statement = statement.order_by(
+        DBTransection.created_at.desc(), DBTransection.id.desc()
+    ).limit(limit + 1)
+
+    async def query(shard):
+        return (await shard.exec(statement)).all()
+
+    if claims.role == models.UserRole.customer:
+        async with models.shard_session(claims.user_id, session) as shard:
+            transections = await query(shard)
+    else:
+        # A merchant's sales are on the shards of its customers
+        pages = await models.gather_shards(session, query)
+        transections = list(
+            itertools.islice(
+                heapq.merge(
+                    *pages, key=lambda t: (t.created_at, t.id), reverse=True
+                ),
+                limit + 1,
+            )
+        )
+
+    next_cursor = None
+    if len(transections) > limit:
+        transections = transections[:limit]
+        next_cursor = pagination.encode_cursor(
+            created_at=transections[-1].created_at.isoformat(),
+            id=transections[-1].id,
+        )
+
+    return responder.response(
+        TransactionList,
+        dict(
+            transactions=transections,
+            page=0,
+            page_size=len(transections),
+            size_per_page=limit,
+            next_cursor=next_cursor,
+        )
+    )
+
 
 @router.get("/transection/{transection_id}")
 async def read_transection(
     transection_id: int,
-    session: Annotated[AsyncSession, Depends(get_session)]
+    session: Annotated[AsyncSession, Depends(replicas.get_read_session)]
 ):
-    transection = await session.get(DBTransection, transection_id)
+    async with sharding.row_session(session, DBTransection, transection_id) as shard:
+        transection = await shard.get(DBTransection, transection_id)
     if transection:
         return transection
     raise HTTPException(status_code=404, detail="Transection not found")
@@ -44,26 +286,28 @@ async def read_transection(
 async def update_transection(
     transection_id: int,
     transection: Annotated[BaseTransaction, Depends()],
-    session: Annotated[AsyncSession, Depends(get_session)]
+    session: Annotated[AsyncSession, Depends(models.get_session)]
 ) -> DBTransection:
     print("update_transection", transection)
     data = transection.dict()
-    db_transection = await session.get(DBTransection, transection_id)
-    if db_transection is None:
-        raise HTTPException(status_code=404, detail="Transection not found")
-    for key, value in data.items():
-        setattr(db_transection, key, value)
-    session.add(db_transection)
-    await session.commit()
-    await session.refresh(db_transection)
+    async with sharding.row_session(session, DBTransection, transection_id) as shard:
+        db_transection = await shard.get(DBTransection, transection_id)
+        if db_transection is None:
+            raise HTTPException(status_code=404, detail="Transection not found")
+        for key, value in data.items():
+            setattr(db_transection, key, value)
+        shard.add(db_transection)
+        await shard.commit()
+        await shard.refresh(db_transection)
     return db_transection
 
 @router.delete("/transection/{transection_id}")
 async def delete_transection(
     transection_id: int,
-    session: Annotated[AsyncSession, Depends(get_session)]
+    session: Annotated[AsyncSession, Depends(models.get_session)]
 ) -> dict:
-    db_transection = await session.get(DBTransection, transection_id)
-    await session.delete(db_transection)
-    await session.commit()
+    async with sharding.row_session(session, DBTransection, transection_id) as shard:
+        db_transection = await shard.get(DBTransection, transection_id)
+        await shard.delete(db_transection)
+        await shard.commit()
     return dict(message="delete success")
@@ -1,11 +1,17 @@
+from collections import Counter
+
 from fastapi import APIRouter, Depends, HTTPException, Request, status
 from sqlmodel.ext.asyncio.session import AsyncSession
-from sqlmodel import select
+from sqlmodel import or_, select
 
 from typing import Annotated
 
+from .. import counters
 from .. import deps
 from .. import models
+from .. import search
+from .. import sharding
+from . import items
 
 
 
@@ -13,6 +19,17 @@ from .. import models
 router = APIRouter(prefix="/users", tags=["users"])
 
 
+async def open_wallet(session: AsyncSession, user_id: int, role: models.UserRole):
+    """Create the empty wallet of a new user, on the user's shard when sharded."""
+    ids = await sharding.new_ids(models.DBWallet, 1)
+    wallet = models.DBWallet(
+        id=ids[0] if ids else None, balance=0.0, user_id=user_id, role=role
+    )
+    async with models.shard_session(user_id, session) as shard:
+        shard.add(wallet)
+        await shard.commit()
+
+
 @router.get("/me")
 def get_me(current_user: models.User = Depends(deps.get_current_user)) -> models.User:
     return current_user
@@ -73,19 +90,11 @@ async def register_merchant(
     await session.refresh(user)
     await session.refresh(dbmerchant)
 
-    wallet = models.DBWallet(
-        balance=0.0,  # You can set the initial balance to 0 or any other value
-        user_id=user.id , role=models.UserRole.merchant
-    )
-    session.add(wallet)
+    await open_wallet(session, user.id, models.UserRole.merchant)
 
-    # Final commit
-    await session.commit()
-    
     # Refresh to get the latest data
     await session.refresh(user)
     await session.refresh(dbmerchant)
-    await session.refresh(wallet)
 
     return models.Merchant.model_validate(dbmerchant)
 
@@ -129,21 +138,11 @@ async def register_customer(
     await session.refresh(dbcustomer)
     
     # Create new wallet for the customer with valid user_id and customer_id
-    wallet = models.DBWallet(
-        balance=0.0,  # You can set the initial balance to 0 or any other value
-        user_id=user.id,
-        role=models.UserRole.customer
-       
-    )
-    session.add(wallet)
+    await open_wallet(session, user.id, models.UserRole.customer)
 
-    # Final commit
-    await session.commit()
-    
     # Refresh to get the latest data
     await session.refresh(user)
     await session.refresh(dbcustomer)
-    await session.refresh(wallet)
     
     return models.Customer.from_orm(dbcustomer)
 
@@ -156,7 +155,7 @@ async def change_password(
     password_update: models.ChangedPassword,
     session: Annotated[AsyncSession, Depends(models.get_session)],
     current_user: models.User = Depends(deps.get_current_user),
-) -> models.Merchant:
+) -> dict:
     user = await session.get(models.DBUser, user_id)
 
     if not user:
@@ -171,15 +170,16 @@ async def change_password(
             detail="Not authorized to change this user's password",
         )
 
-    if not user.verify_password(password_update.current_password):
+    if not await user.verify_password(password_update.current_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect password",
         )
     
-    user.set_password(password_update.new_password)
+    await user.set_password(password_update.new_password)
     session.add(user)
     await session.commit()
+    deps.user_cache.invalidate(user.id)
 
     return {"message": "Password changed successfully"}
 
@@ -196,13 +196,13 @@ async def update(
 
     user = await session.get(models.DBUser, user_id)
 
-    if user != current_user:
+    if user is None or user.id != current_user.id:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Not found this user",
         )
 
-    if not user.verify_password(user_update.current_password):
+    if not await user.verify_password(user_update.current_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect password",
@@ -214,6 +214,7 @@ async def update(
     session.add(user)
     await session.commit()
     await session.refresh(user)
+    deps.user_cache.invalidate(user.id)
 
     return user
 
@@ -225,9 +226,31 @@ async def delete_user(
 ) -> dict:
     db_user = await session.get(models.DBUser, user_id)
     if db_user:
+        # The delete cascades to the user's items and to those of its
+        # merchants; their counters go down in the same transaction
+        result = await session.exec(
+            select(models.DBItem.id, models.DBItem.merchant_id).where(
+                or_(
+                    models.DBItem.user_id == user_id,
+                    models.DBItem.merchant_id.in_(
+                        select(models.DBMerchant.id).where(
+                            models.DBMerchant.user_id == user_id
+                        )
+                    ),
+                )
+            )
+        )
+        owned_items = result.all()
         await session.delete(db_user)
+        item_counts = Counter(merchant_id for _, merchant_id in owned_items)
+        for merchant_id, count in item_counts.items():
+            await counters.adjust_item_count(session, merchant_id, -count)
         await session.commit()
-
+        deps.user_cache.invalidate(db_user.id)
+        items.invalidate_item()
+        for item_id, _ in owned_items:
+            items.item_cache.invalidate(item_id)
+            search.item_index.remove(item_id)
 
         return dict(message="delete success")
     raise HTTPException(status_code=404, detail="user not found")
\ No newline at end of file
@@ -1,18 +1,21 @@
+import datetime
 from typing import Annotated
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Header, Query
 from sqlmodel.ext.asyncio.session import AsyncSession
-from sqlmodel import select
+from sqlmodel import select, update
 from ..models.wallets import BaseWallet, DBWallet, UpdatedWallet, Wallet, WalletList
-from ..models import engine
 from .. import models
 
 from .. import deps
+from .. import idempotency
+from .. import ledger
+from .. import replicas
+from .. import responses
+from .. import sharding
+from .. import stripes
 router = APIRouter(prefix="/wallets")
 
-
-async def get_session():
-    async with AsyncSession(engine) as session:
-        yield session
+responder = responses.ModelResponder("wallets")
 
 # @router.post("")
 # async def create_wallet(
@@ -28,47 +31,126 @@ async def get_session():
 #     return models.Item.from_orm(dbwallet)
 @router.get("")
 async def read_wallets(
-    session: Annotated[AsyncSession, Depends(get_session)]
+    session: Annotated[AsyncSession, Depends(replicas.get_read_session)]
 ) -> WalletList:
-    result = await session.exec(select(DBWallet))
-    wallets = result.all()
-    return WalletList.from_orm(dict(wallets=wallets, page_size=0, page=0, size_per_page=0))
+    async def query(shard):
+        return await stripes.with_stripes(shard, (await shard.exec(select(DBWallet))).all())
+
+    wallets = [
+        wallet
+        for shard_wallets in await models.gather_shards(session, query)
+        for wallet in shard_wallets
+    ]
+    wallets.sort(key=lambda wallet: wallet.id)
+    return responder.response(WalletList, dict(wallets=wallets, page_size=0, page=0, size_per_page=0))
 
 @router.get("/{customer_id}")
 
 async def get_wallet_by_customer_id(
     customer_id: int,
-    session: Annotated[AsyncSession, Depends(models.get_session)]
+    session: Annotated[AsyncSession, Depends(replicas.get_read_session)]
 ) -> models.Wallet:
-    result = await session.exec(select(DBWallet).where(DBWallet.user_id == customer_id))
-    wallet = result.first()
-    if wallet:
-        return Wallet.from_orm(wallet)
+    async with models.shard_session(customer_id, session) as shard:
+        result = await shard.exec(select(DBWallet).where(DBWallet.user_id == customer_id))
+        wallet = result.first()
+        if wallet:
+            return (await stripes.with_stripes(shard, [wallet]))[0]
     raise HTTPException(status_code=404, detail="Wallet not found")
 
 @router.get("/{merchant_id}")
 
 async def get_wallet_by_merchant_id(
     merchant_id: int,
-    session: Annotated[AsyncSession, Depends(models.get_session)]
+    session: Annotated[AsyncSession, Depends(replicas.get_read_session)]
 ) -> models.Wallet:
-    result = await session.exec(select(DBWallet).where(DBWallet.user_id == merchant_id))
-    wallet = result.first()
-    if wallet:
-        return Wallet.from_orm(wallet)
+    async with models.shard_session(merchant_id, session) as shard:
+        result = await shard.exec(select(DBWallet).where(DBWallet.user_id == merchant_id))
+        wallet = result.first()
+        if wallet:
+            return (await stripes.with_stripes(shard, [wallet]))[0]
     raise HTTPException(status_code=404, detail="Wallet not found")
 
 
+@router.put("/add")
+async def add_balance(
+    balance: UpdatedWallet,
+    session: Annotated[AsyncSession, Depends(deps.get_shard_session)],
+    claims: Annotated[models.TokenClaims, Depends(deps.get_token_claims)],
+    idempotency_key: Annotated[str | None, Header(max_length=255)] = None,
+) -> Wallet :
+    if balance.balance <= 0:
+        raise HTTPException(status_code=400, detail="Amount must be positive")
+
+    async def top_up():
+        result = await session.exec(
+            update(DBWallet)
+            .where(DBWallet.id == claims.wallet_id)
+            .values(
+                balance=DBWallet.balance + balance.balance,
+                ledger_seq=DBWallet.ledger_seq + 1,
+            )
+            .returning(
+                DBWallet.id,
+                DBWallet.user_id,
+                DBWallet.role,
+                DBWallet.balance,
+                DBWallet.ledger_seq,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        dbwallet = result.first()
+        if dbwallet is None:
+            raise HTTPException(status_code=404, detail="Wallet not found")
+
+        batch = ledger.LedgerBatch()
+        batch.post(
+            dbwallet.id,
+            dbwallet.ledger_seq,
+            dbwallet.balance,
+            [(balance.balance, models.LedgerEntryKind.top_up, None)],
+        )
+        await batch.write(session)
+        return Wallet.model_validate(dbwallet._mapping)
+
+    return await idempotency.run(
+        session,
+        claims.user_id,
+        idempotency_key,
+        idempotency.request_hash("PUT", "/wallets/add", balance.model_dump(mode="json")),
+        top_up,
+    )
+
+
 @router.put("/{wallet_id}")
 async def update_wallet(
     wallet_id: int,
     wallet: Annotated[UpdatedWallet, Depends()],
-    session: Annotated[AsyncSession, Depends(get_session)]
+    session: Annotated[AsyncSession, Depends(models.get_session)]
 ) -> Wallet :
-    print("update_wallet", wallet)
-    data = wallet.dict()
-    db_wallet = await session.get(DBWallet, wallet_id)
-    db_wallet.update_from_dict(data)
+    async with sharding.row_session(session, DBWallet, wallet_id) as shard:
+        return await _override_balance(shard, wallet_id, wallet)
+
+
+async def _override_balance(
+    session: AsyncSession, wallet_id: int, wallet: UpdatedWallet
+) -> Wallet:
+    db_wallet = await session.get(DBWallet, wallet_id, with_for_update=True)
+    if db_wallet is None:
+        raise HTTPException(status_code=404, detail="Wallet not found")
+
+    # Record the override as an adjustment so the ledger still adds up
+    adjustment = wallet.balance - db_wallet.balance
+    db_wallet.balance = wallet.balance
+    db_wallet.ledger_seq += 1
+    batch = ledger.LedgerBatch()
+    batch.post(
+        db_wallet.id,
+        db_wallet.ledger_seq,
+        db_wallet.balance,
+        [(adjustment, models.LedgerEntryKind.adjustment, None)],
+    )
+    session.add(db_wallet)
+    await batch.write(session)
     await session.commit()
     await session.refresh(db_wallet)
     return Wallet.from_orm(db_wallet)
@@ -76,34 +158,45 @@ async def update_wallet(
 @router.delete("/{wallet_id}")
 async def delete_wallet(
     wallet_id: int,
-    session: Annotated[AsyncSession, Depends(get_session)]
+    session: Annotated[AsyncSession, Depends(models.get_session)]
 ) -> dict:
-    db_wallet = await session.get(DBWallet, wallet_id)
-    await session.delete(db_wallet)
-    await session.commit()
+    async with sharding.row_session(session, DBWallet, wallet_id) as shard:
+        db_wallet = await shard.get(DBWallet, wallet_id)
+        await shard.delete(db_wallet)
+        await shard.commit()
     return dict(message="delete success")
 
 
-@router.put("add")
-async def add_balance(
-    balance: UpdatedWallet,
-    
-    
-    session: Annotated[AsyncSession, Depends(models.get_session)],
-    current_user: models.User = Depends(deps.get_current_user)
-) -> Wallet :
-    statement = select(DBWallet).where(DBWallet.user_id == current_user.id)
-    result = await session.exec(statement)
-    dbwallet = result.one_or_none()
-    
-    dbwallet.balance += balance.balance
-
-    
-    
-    if dbwallet:
-        dbwallet.sqlmodel_update(dbwallet)
-        session.add(dbwallet)
-        await session.commit()
-        await session.refresh(dbwallet)
-        return Wallet.from_orm(dbwallet)
-    raise HTTPException(status_code=404, detail="Wallet not found")
+async def _get_owned_wallet_id(
+    wallet_id: int,
+    claims: Annotated[models.TokenClaims, Depends(deps.get_token_claims)],
+) -> int:
+    if claims.wallet_id != wallet_id:
+        raise HTTPException(status_code=403, detail="Not your wallet")
+    return wallet_id
+
+
+@router.get("/{wallet_id}/balance")
+async def read_balance(
+    wallet_id: Annotated[int, Depends(_get_owned_wallet_id)],
+    session: Annotated[AsyncSession, Depends(deps.get_shard_read_session)],
+    at: datetime.datetime | None = None,
+) -> models.LedgerBalance:
+    balance = await ledger.balance_at(session, wallet_id, at)
+    if at is None:
+        # Sales still in the wallet's stripes are not in the ledger yet
+        pending = await stripes.unfolded(session, [wallet_id])
+        balance.balance += pending.get(wallet_id, 0.0)
+    return balance
+
+
+@router.get("/{wallet_id}/statement")
+async def read_statement(
+    wallet_id: Annotated[int, Depends(_get_owned_wallet_id)],
+    session: Annotated[AsyncSession, Depends(deps.get_shard_read_session)],
+    start: datetime.datetime | None = None,
+    end: datetime.datetime | None = None,
+    cursor: str | None = None,
+    limit: Annotated[int, Query(gt=0, le=1000)] = 100,
+) -> models.Statement:
+    return await ledger.statement(session, wallet_id, start, end, cursor, limit)
@@ -0,0 +1,246 @@
+import datetime
+from collections import defaultdict
+
+from sqlmodel import delete, func, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from . import models
+
+
+GRANULARITIES = tuple(models.SalesGranularity)
+
+
+def truncate(moment: datetime.datetime, granularity: models.SalesGranularity):
+    moment = moment.replace(minute=0, second=0, microsecond=0)
+    if granularity == models.SalesGranularity.day:
+        moment = moment.replace(hour=0)
+    return moment
+
+
+def _rollup_rows(rows):
+    """Sum (item_id, merchant_id, price, quantity, created_at) rows per bucket."""
+    merchants = defaultdict(lambda: [0.0, 0, 0])
+    items = {}
+    for item_id, merchant_id, price, quantity, created_at in rows:
+        for granularity in GRANULARITIES:
+            bucket = truncate(created_at, granularity)
+            for totals in (
+                merchants[(merchant_id, granularity, bucket)],
+                items.setdefault((item_id, granularity, bucket), [0.0, 0, 0, merchant_id]),
+            ):
+                totals[0] += price
+                totals[1] += 1
+                totals[2] += quantity
+
+    merchant_rows = [
+        dict(
+            merchant_id=merchant_id,
+            granularity=granularity,
+            bucket=bucket,
+            revenue=revenue,
+            orders=orders,
+            quantity=quantity,
+        )
+        for (merchant_id, granularity, bucket), (revenue, orders, quantity)
+        in sorted(merchants.items())
+    ]
+    item_rows = [
+        dict(
+            item_id=item_id,
+            granularity=granularity,
+            bucket=bucket,
+            merchant_id=merchant_id,
+            revenue=revenue,
+            orders=orders,
+            quantity=quantity,
+        )
+        for (item_id, granularity, bucket), (revenue, orders, quantity, merchant_id)
+        in sorted(items.items())
+    ]
+    return merchant_rows, item_rows
+
+
+async def _upsert(session: AsyncSession, table, rows):
+    insert = models.dialect_insert(session)
+    statement = insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=table.__table__.primary_key.columns,
+        set_=dict(
+            revenue=table.revenue + statement.excluded.revenue,
+            orders=table.orders + statement.excluded.orders,
+            quantity=table.quantity + statement.excluded.quantity,
+        ),
+    )
+    await session.exec(statement, params=rows)
+
+
+async def _write_rollups(session: AsyncSession, merchant_rows, item_rows):
+    if merchant_rows:
+        await _upsert(session, models.DBMerchantSales, merchant_rows)
+    if item_rows:
+        await _upsert(session, models.DBItemSales, item_rows)
+
+
+async def record_sales(session: AsyncSession, transactions: list[models.DBTransection]):
+    """Add freshly inserted transactions to the hourly and daily rollups.
+
+    Runs inside the purchase transaction. Rows are upserted in key order so
+    concurrent purchases lock shared rollup rows in the same order.
+    """
+    merchant_rows, item_rows = _rollup_rows(
+        (t.item_id, t.merchant_id, t.price, t.quantity, t.created_at)
+        for t in transactions
+    )
+    await _write_rollups(session, merchant_rows, item_rows)
+
+
+async def rebuild_sales(
+    session: AsyncSession,
+    start: datetime.datetime | None = None,
+    end: datetime.datetime | None = None,
+    batch_size: int = 10_000,
+):
+    """Recompute the rollups of every day overlapping [start, end).
+
+    The window is widened to whole days so that both hourly and daily
+    buckets are rebuilt completely from the raw transactions.
+    """
+    if start is not None:
+        start = truncate(start, models.SalesGranularity.day)
+    if end is not None:
+        day_end = truncate(end, models.SalesGranularity.day)
+        end = day_end if day_end == end else day_end + datetime.timedelta(days=1)
+
+    for table in (models.DBMerchantSales, models.DBItemSales):
+        statement = delete(table)
+        if start is not None:
+            statement = statement.where(table.bucket >= start)
+        if end is not None:
+            statement = statement.where(table.bucket < end)
+        await session.exec(statement)
+
+    query = select(
+        models.DBTransection.item_id,
+        models.DBTransection.merchant_id,
+        models.DBTransection.price,
+        models.DBTransection.quantity,
+        models.DBTransection.created_at,
+    )
+    if start is not None:
+        query = query.where(models.DBTransection.created_at >= start)
+    if end is not None:
+        query = query.where(models.DBTransection.created_at < end)
+    # Sales waiting in a striped wallet on this database are rolled up when
+    # the wallet is compacted
+    query = query.where(
+        models.DBTransection.id.not_in(select(models.DBStripeCredit.transaction_id))
+    )
+
+    # Stream the window and fold each batch into the rollups, so memory is
+    # bounded by the number of buckets rather than the number of rows.
+    result = await session.stream(query.execution_options(yield_per=batch_size))
+    async for rows in result.partitions():
+        merchant_rows, item_rows = _rollup_rows(rows)
+        await _write_rollups(session, merchant_rows, item_rows)
+    await session.commit()
+
+
+def _add_totals(totals: models.SalesTotals, row):
+    totals.revenue += row.revenue
+    totals.orders += row.orders
+    totals.quantity += row.quantity
+
+
+async def merchant_sales(
+    session: AsyncSession,
+    merchant_id: int,
+    granularity: models.SalesGranularity,
+    start: datetime.datetime | None = None,
+    end: datetime.datetime | None = None,
+) -> models.MerchantSales:
+    statement = select(models.DBMerchantSales).where(
+        models.DBMerchantSales.merchant_id == merchant_id,
+        models.DBMerchantSales.granularity == granularity,
+    )
+    if start is not None:
+        statement = statement.where(
+            models.DBMerchantSales.bucket >= truncate(start, granularity)
+        )
+    if end is not None:
+        statement = statement.where(models.DBMerchantSales.bucket < end)
+    statement = statement.order_by(models.DBMerchantSales.bucket)
+
+    async def query(shard):
+        return (await shard.exec(statement)).all()
+
+    # Sharded, a merchant's rollups are on the shards of its customers
+    merged = {}
+    for rows in await models.gather_shards(session, query):
+        for row in rows:
+            bucket = merged.get(row.bucket)
+            if bucket is None:
+                merged[row.bucket] = models.SalesBucket.model_validate(row)
+            else:
+                _add_totals(bucket, row)
+    buckets = [merged[bucket] for bucket in sorted(merged)]
+    total = models.SalesTotals(
+        revenue=sum(b.revenue for b in buckets),
+        orders=sum(b.orders for b in buckets),
+        quantity=sum(b.quantity for b in buckets),
+    )
+    return models.MerchantSales(
+        merchant_id=merchant_id, granularity=granularity, total=total, buckets=buckets
+    )
+
+
+async def merchant_item_sales(
+    session: AsyncSession,
+    merchant_id: int,
+    start: datetime.datetime | None = None,
+    end: datetime.datetime | None = None,
+    limit: int = 50,
+) -> models.MerchantItemSales:
+    """Per-item totals of one merchant, best sellers first.
+
+    Reads daily buckets, so ``start`` and ``end`` are rounded to whole days.
+    """
+    granularity = models.SalesGranularity.day
+    revenue = func.sum(models.DBItemSales.revenue).label("revenue")
+    statement = select(
+        models.DBItemSales.item_id,
+        revenue,
+        func.sum(models.DBItemSales.orders).label("orders"),
+        func.sum(models.DBItemSales.quantity).label("quantity"),
+    ).where(
+        models.DBItemSales.merchant_id == merchant_id,
+        models.DBItemSales.granularity == granularity,
+    )
+    if start is not None:
+        statement = statement.where(
+            models.DBItemSales.bucket >= truncate(start, granularity)
+        )
+    if end is not None:
+        statement = statement.where(models.DBItemSales.bucket < end)
+    statement = statement.group_by(models.DBItemSales.item_id).order_by(
+        revenue.desc(), models.DBItemSales.item_id
+    )
+    if not models.sharded():
+        # Sharded, the best sellers are only known once the shards are merged
+        statement = statement.limit(limit)
+
+    async def query(shard):
+        return (await shard.exec(statement)).all()
+
+    merged = {}
+    for rows in await models.gather_shards(session, query):
+        for row in rows:
+            item = merged.get(row.item_id)
+            if item is None:
+                merged[row.item_id] = models.ItemSales.model_validate(row._mapping)
+            else:
+                _add_totals(item, row)
+    items = sorted(merged.values(), key=lambda item: (-item.revenue, item.item_id))
+
+    return models.MerchantItemSales(
+        merchant_id=merchant_id, start=start, end=end, items=items[:limit]
+    )
@@ -0,0 +1,273 @@
+import asyncio
+import bisect
+import re
+from collections import defaultdict
+
+from sqlalchemy import case, func, literal, or_, text
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from . import models
+
+
+NAME_WEIGHT = 2.0
+DESCRIPTION_WEIGHT = 1.0
+PREFIX_SCORE = 0.8
+FUZZY_SCORE = 0.6
+# pg_trgm's default similarity threshold
+FUZZY_THRESHOLD = 0.3
+# Upper bound on vocabulary words a short prefix may expand to
+MAX_PREFIX_EXPANSION = 200
+
+_word = re.compile(r"\w+")
+
+
+def tokenize(text: str | None) -> list[str]:
+    return _word.findall(text.lower()) if text else []
+
+
+def trigrams(token: str) -> set[str]:
+    # Padded like pg_trgm so short words still produce a few trigrams
+    padded = f"  {token} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class InvertedIndex:
+    """In-process word index over item names and descriptions.
+
+    Words map to the items containing them, and trigrams map to words for
+    fuzzy lookups. It is built from the database on first use and kept
+    current by the item handlers of this process, so it is meant for
+    single-worker SQLite runs; databases with pg_trgm are searched directly.
+    """
+
+    def __init__(self):
+        self.postings: dict[str, dict[int, float]] = defaultdict(dict)
+        self.documents: dict[int, set[str]] = {}
+        self.trigram_words: dict[str, set[str]] = defaultdict(set)
+        self.loaded = False
+        self._lock = asyncio.Lock()
+        self._sorted_words: list[str] | None = None
+
+    async def ensure_loaded(self, session: AsyncSession, batch_size: int = 10_000):
+        async with self._lock:
+            if self.loaded:
+                return
+            result = await session.stream(
+                select(
+                    models.DBItem.id, models.DBItem.name, models.DBItem.description
+                ).execution_options(yield_per=batch_size)
+            )
+            async for rows in result.partitions():
+                for item_id, name, description in rows:
+                    self.add(item_id, name, description)
+            self.loaded = True
+
+    def add(self, item_id: int, name: str, description: str | None):
+        self.remove(item_id)
+        weights = {}
+        for word in tokenize(description):
+            weights[word] = DESCRIPTION_WEIGHT
+        for word in tokenize(name):
+            weights[word] = NAME_WEIGHT
+
+        for word, weight in weights.items():
+            if word not in self.postings:
+                self._sorted_words = None
+                for trigram in trigrams(word):
+                    self.trigram_words[trigram].add(word)
+            self.postings[word][item_id] = weight
+        self.documents[item_id] = set(weights)
+
+    def remove(self, item_id: int):
+        for word in self.documents.pop(item_id, ()):
+            items = self.postings[word]
+            items.pop(item_id, None)
+            if not items:
+                del self.postings[word]
+                self._sorted_words = None
+                for trigram in trigrams(word):
+                    self.trigram_words[trigram].discard(word)
+
+    def clear(self):
+        self.__init__()
+
+    def _expand(self, term: str) -> dict[str, float]:
+        """Vocabulary words matching ``term`` exactly, by prefix or fuzzily."""
+        matches = {}
+        if term in self.postings:
+            matches[term] = 1.0
+
+        if self._sorted_words is None:
+            self._sorted_words = sorted(self.postings)
+        start = bisect.bisect_left(self._sorted_words, term)
+        for word in self._sorted_words[start : start + MAX_PREFIX_EXPANSION]:
+            if not word.startswith(term):
+                break
+            matches.setdefault(word, PREFIX_SCORE)
+
+        term_trigrams = trigrams(term)
+        shared = defaultdict(int)
+        for trigram in term_trigrams:
+            for word in self.trigram_words.get(trigram, ()):
+                shared[word] += 1
+        for word, count in shared.items():
+            similarity = count / (len(term_trigrams) + len(trigrams(word)) - count)
+            if similarity >= FUZZY_THRESHOLD:
+                score = FUZZY_SCORE * similarity
+                if score > matches.get(word, 0.0):
+                    matches[word] = score
+        return matches
+
+    def search(self, query: str, limit: int, offset: int = 0) -> list[tuple[int, float]]:
+        """Rank items matching every query word, best first."""
+        scores = None
+        for term in dict.fromkeys(tokenize(query)):
+            term_scores = defaultdict(float)
+            for word, match in self._expand(term).items():
+                for item_id, weight in self.postings[word].items():
+                    score = match * weight
+                    if score > term_scores[item_id]:
+                        term_scores[item_id] = score
+
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {
+                    item_id: score + term_scores[item_id]
+                    for item_id, score in scores.items()
+                    if item_id in term_scores
+                }
+            if not scores:
+                return []
+
+        ranked = sorted((scores or {}).items(), key=lambda hit: (-hit[1], hit[0]))
+        return ranked[offset : offset + limit]
+
+
+item_index = InvertedIndex()
+
+# Whether the database has pg_trgm, checked once per process
+_trigram_search: bool | None = None
+
+TRIGRAM_INDEXES = {
+    "ix_dbitem_name_trgm": "name",
+    "ix_dbitem_description_trgm": "description",
+}
+
+
+async def enable_trigram_search(engine) -> bool:
+    """Install pg_trgm and the trigram indexes /items/search queries.
+
+    Creating an extension needs a superuser or the database owner, so this
+    is run once by scripts/enable-trigram-search.py rather than by the app.
+    The indexes are built concurrently so item writes carry on meanwhile.
+    Returns False when the server is not PostgreSQL or lacks pg_trgm.
+    """
+    if engine.dialect.name != "postgresql":
+        return False
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        result = await conn.exec_driver_sql(
+            "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'"
+        )
+        if result.first() is None:
+            return False
+
+        await conn.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        table = models.DBItem.__tablename__
+        for index, column in TRIGRAM_INDEXES.items():
+            await conn.exec_driver_sql(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index} "
+                f"ON {table} USING gin ({column} gin_trgm_ops)"
+            )
+    return True
+
+
+async def _has_trigram_search(session: AsyncSession) -> bool:
+    global _trigram_search
+    if _trigram_search is None:
+        _trigram_search = False
+        if session.bind.dialect.name == "postgresql":
+            result = await session.exec(
+                text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            )
+            _trigram_search = result.first() is not None
+    return _trigram_search
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+async def _search_postgresql(
+    session: AsyncSession, query: str, limit: int, offset: int
+) -> list[tuple[models.DBItem, float]]:
+    # Every predicate is one the gin_trgm_ops indexes on name and
+    # description can answer: ILIKE substrings and <% (word similarity).
+    contains = f"%{_escape_like(query)}%"
+    starts = f"{_escape_like(query)}%"
+    description = func.coalesce(models.DBItem.description, "")
+    score = (
+        NAME_WEIGHT * func.word_similarity(query, models.DBItem.name)
+        + DESCRIPTION_WEIGHT * func.word_similarity(query, description)
+        + case((models.DBItem.name.ilike(starts, escape="\\"), NAME_WEIGHT), else_=0.0)
+    ).label("score")
+
+    result = await session.exec(
+        select(models.DBItem, score)
+        .where(
+            or_(
+                models.DBItem.name.ilike(contains, escape="\\"),
+                models.DBItem.description.ilike(contains, escape="\\"),
+                literal(query).op("<%")(models.DBItem.name),
+                literal(query).op("<%")(models.DBItem.description),
+            )
+        )
+        .order_by(score.desc(), models.DBItem.id)
+        .offset(offset)
+        .limit(limit)
+    )
+    return [(item, float(score)) for item, score in result.all()]
+
+
+async def _search_index(
+    session: AsyncSession, query: str, limit: int, offset: int
+) -> list[tuple[models.DBItem, float]]:
+    await item_index.ensure_loaded(session)
+    hits = item_index.search(query, limit, offset)
+    if not hits:
+        return []
+
+    result = await session.exec(
+        select(models.DBItem).where(models.DBItem.id.in_([item_id for item_id, _ in hits]))
+    )
+    items = {item.id: item for item in result.all()}
+    return [(items[item_id], score) for item_id, score in hits if item_id in items]
+
+
+async def search_items(
+    session: AsyncSession, query: str, page: int, page_size: int
+) -> models.ItemSearchResult:
+    search = (
+        _search_postgresql if await _has_trigram_search(session) else _search_index
+    )
+    hits = await search(session, query, page_size + 1, (page - 1) * page_size)
+
+    next_page = None
+    if len(hits) > page_size:
+        hits = hits[:page_size]
+        next_page = page + 1
+
+    return models.ItemSearchResult(
+        query=query,
+        page=page,
+        size_per_page=page_size,
+        next_page=next_page,
+        items=[
+            models.ItemSearchHit(**models.Item.from_orm(item).model_dump(), score=score)
+            for item, score in hits
+        ],
+    )
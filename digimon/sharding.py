@@ -0,0 +1,280 @@
+import asyncio
+import contextlib
+import logging
+from collections import defaultdict
+from typing import AsyncIterator
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlmodel import SQLModel, delete, func, select, update
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from . import config
+from . import models
+from . import sales
+
+
+logger = logging.getLogger(__name__)
+
+settings = config.get_settings()
+
+# Sharded tables whose ids must be unique across shards
+ID_TABLES = (models.DBWallet, models.DBTransection, models.DBShardTransfer)
+
+
+class IdAllocator:
+    """Ids for rows of sharded tables, unique across every shard.
+
+    Each worker reserves blocks of ``block_size`` ids per table from the
+    ``id_blocks`` row on ``SQLDB_URL`` and hands them out from memory, so
+    the primary sees one short write per block rather than one per row.
+    Ids are unique, not ordered across workers.
+    """
+
+    def __init__(self, block_size: int):
+        self.block_size = block_size
+        # table name -> [next id, end of the reserved block]
+        self.blocks: dict[str, list[int]] = {}
+        self.lock = asyncio.Lock()
+
+    async def _reserve(self, name: str, size: int) -> list[int]:
+        async with models.session_factory() as session:
+            insert = models.dialect_insert(session)
+            await session.exec(
+                insert(models.DBIdBlock)
+                .values(name=name, next_id=1)
+                .on_conflict_do_nothing()
+            )
+            result = await session.exec(
+                update(models.DBIdBlock)
+                .where(models.DBIdBlock.name == name)
+                .values(next_id=models.DBIdBlock.next_id + size)
+                .returning(models.DBIdBlock.next_id)
+            )
+            end = result.one()[0]
+            await session.commit()
+        return [end - size, end]
+
+    async def allocate(self, name: str, count: int) -> list[int]:
+        ids = []
+        async with self.lock:
+            while len(ids) < count:
+                block = self.blocks.get(name)
+                if block is None or block[0] >= block[1]:
+                    block = self.blocks[name] = await self._reserve(
+                        name, max(self.block_size, count - len(ids))
+                    )
+                taken = min(block[1] - block[0], count - len(ids))
+                ids.extend(range(block[0], block[0] + taken))
+                block[0] += taken
+        return ids
+
+
+id_allocator = IdAllocator(settings.SHARD_ID_BLOCK_SIZE)
+
+
+async def new_ids(model: type[SQLModel], count: int) -> list[int] | None:
+    """``count`` ids for new ``model`` rows when sharded; None lets the database pick."""
+    if not models.sharded():
+        return None
+    return await id_allocator.allocate(model.__table__.name, count)
+
+
+@contextlib.asynccontextmanager
+async def row_session(
+    session: AsyncSession, model: type[SQLModel], row_id: int
+) -> AsyncIterator[AsyncSession]:
+    """A session on the shard holding the ``model`` row ``row_id``.
+
+    For routes that address sharded rows by id alone. Unsharded, or when no
+    shard has the row, it is ``session``.
+    """
+    if models.sharded():
+
+        async def find(shard):
+            return (await shard.exec(select(model.id).where(model.id == row_id))).first()
+
+        found = await models.gather_shards(session, find)
+        for index, found_id in enumerate(found):
+            if found_id is not None:
+                async with models.shard_session_factories[index]() as shard:
+                    yield shard
+                return
+    yield session
+
+
+# Rebalancing
+
+REBALANCE_BATCH = 500
+
+
+def _insert_ignore(session: AsyncSession, table):
+    return models.dialect_insert(session)(table).on_conflict_do_nothing()
+
+
+async def _move_users(
+    source: AsyncSession,
+    target: AsyncSession,
+    user_ids: list[int],
+    customer_ids: list[int],
+):
+    """Copy the sharded rows of ``user_ids`` to ``target``, then delete them.
+
+    The copy commits before the delete and skips rows already there, so a
+    run interrupted between the two can simply be repeated.
+    """
+    wallet_ids = (
+        await source.exec(
+            select(models.DBWallet.id).where(models.DBWallet.user_id.in_(user_ids))
+        )
+    ).all()
+    owned = [
+        (models.DBWallet, models.DBWallet.user_id, user_ids),
+        (models.DBLedgerEntry, models.DBLedgerEntry.wallet_id, wallet_ids),
+        (models.DBBalanceSnapshot, models.DBBalanceSnapshot.wallet_id, wallet_ids),
+        (models.DBWalletStripe, models.DBWalletStripe.wallet_id, wallet_ids),
+        (models.DBStripeCredit, models.DBStripeCredit.wallet_id, wallet_ids),
+        (models.DBShardTransfer, models.DBShardTransfer.customer_wallet_id, wallet_ids),
+        (models.DBTransection, models.DBTransection.customer_id, customer_ids),
+        (models.DBIdempotencyKey, models.DBIdempotencyKey.user_id, user_ids),
+    ]
+
+    moved = 0
+    for model, column, keys in owned:
+        if not keys:
+            continue
+        table = model.__table__
+        result = await source.exec(select(*table.columns).where(column.in_(keys)))
+        rows = [dict(row._mapping) for row in result.all()]
+        if rows:
+            await target.exec(_insert_ignore(target, table), params=rows)
+            moved += len(rows)
+    await target.commit()
+
+    for model, column, keys in owned:
+        if keys:
+            await source.exec(delete(model).where(column.in_(keys)))
+    await source.commit()
+    return moved
+
+
+async def rebalance(
+    source_urls: list[str],
+    target_urls: list[str],
+    dry_run: bool = False,
+    rebuild_rollups: bool = True,
+) -> dict[tuple[str, str], int]:
+    """Move every user's sharded rows from the ``source_urls`` layout to ``target_urls``.
+
+    Users are placed by jump hash over ``target_urls``, so a URL kept at the
+    same position keeps most of its users when shards are added. Splitting
+    an unsharded database is moving from ``[SQLDB_URL]``. Meant to run with
+    the application stopped and refuses while credits are pending. Sales
+    rollups are rebuilt from the moved transactions afterwards, and the id
+    blocks on ``SQLDB_URL`` are moved past every id in the new layout.
+    Returns the number of users moved per (source, target).
+    """
+    def display(url):
+        return make_url(url).render_as_string(hide_password=True)
+
+    engines = {
+        url: create_async_engine(url) for url in dict.fromkeys(source_urls + target_urls)
+    }
+    sessions = {
+        url: sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        for url, engine in engines.items()
+    }
+    moves: dict[tuple[str, str], int] = defaultdict(int)
+
+    try:
+        for url in target_urls:
+            async with engines[url].begin() as conn:
+                await conn.run_sync(models.create_shard_tables)
+
+        for url in source_urls:
+            async with sessions[url]() as session:
+                pending = (
+                    await session.exec(
+                        select(func.count()).where(
+                            models.DBShardTransfer.status
+                            == models.ShardTransferStatus.pending
+                        )
+                    )
+                ).one()
+            if pending:
+                raise RuntimeError(
+                    f"{pending} cross-shard credits are pending on {display(url)}; "
+                    "let the application retry them first"
+                )
+
+        async with models.session_factory() as session:
+            result = await session.exec(
+                select(models.DBCustomer.user_id, models.DBCustomer.id)
+            )
+            customers = defaultdict(list)
+            for user_id, customer_id in result.all():
+                customers[user_id].append(customer_id)
+
+        for source_url in source_urls:
+            async with sessions[source_url]() as source:
+                result = await source.exec(select(models.DBWallet.user_id).distinct())
+                leaving = defaultdict(list)
+                for user_id in result.all():
+                    target_url = target_urls[models.jump_hash(user_id, len(target_urls))]
+                    if target_url != source_url:
+                        leaving[target_url].append(user_id)
+
+                for target_url, user_ids in leaving.items():
+                    moves[(display(source_url), display(target_url))] = len(user_ids)
+                    if dry_run:
+                        continue
+                    async with sessions[target_url]() as target:
+                        for start in range(0, len(user_ids), REBALANCE_BATCH):
+                            batch = user_ids[start : start + REBALANCE_BATCH]
+                            await _move_users(
+                                source,
+                                target,
+                                batch,
+                                [c for user_id in batch for c in customers[user_id]],
+                            )
+                    logger.info(
+                        "moved %d users from %s to %s",
+                        len(user_ids), display(source_url), display(target_url),
+                    )
+
+        if dry_run:
+            return dict(moves)
+
+        if rebuild_rollups:
+            # Rollups follow the transactions they were built from
+            for url in engines:
+                async with sessions[url]() as session:
+                    await sales.rebuild_sales(session)
+
+        async with models.session_factory() as session:
+            for model in ID_TABLES:
+                last = 0
+                for url in target_urls:
+                    async with sessions[url]() as shard:
+                        last = max(
+                            last, (await shard.exec(select(func.max(model.id)))).one() or 0
+                        )
+                insert = models.dialect_insert(session)(models.DBIdBlock)
+                await session.exec(
+                    insert.values(name=model.__table__.name, next_id=last + 1)
+                    .on_conflict_do_update(
+                        index_elements=[models.DBIdBlock.name],
+                        set_=dict(
+                            next_id=func.max(models.DBIdBlock.next_id, last + 1)
+                            if session.bind.dialect.name == "sqlite"
+                            else func.greatest(models.DBIdBlock.next_id, last + 1)
+                        ),
+                    )
+                )
+            await session.commit()
+    finally:
+        for engine in engines.values():
+            await engine.dispose()
+
+    return dict(moves)
@@ -0,0 +1,196 @@
+import functools
+import logging
+import random
+import re
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from . import config
+from . import models
+
+
+logger = logging.getLogger(__name__)
+
+settings = config.get_settings()
+
+# Statement kinds EXPLAIN accepts without running them
+EXPLAINABLE = ("select", "insert", "update", "delete", "with")
+
+_casts = re.compile(r"::\w+(?:\[\])?")
+_strings = re.compile(r"'(?:[^']|'')*'")
+_numbers = re.compile(r"(?<![\w$])-?\d+(?:\.\d+)?\b")
+_placeholders = re.compile(r"\$\d+|%\(\w+\)s|%s|(?<!:):\w+|\?")
+_lists = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_rows = re.compile(r"\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+")
+_whitespace = re.compile(r"\s+")
+
+
+@functools.lru_cache(maxsize=4096)
+def fingerprint(statement: str) -> str:
+    """Reduce a statement to its shape: literals, parameters and lists collapsed.
+
+    ``IN`` lists and multi-row ``VALUES`` of any length share a fingerprint.
+    """
+    text = _casts.sub("", statement)
+    text = _strings.sub("?", text)
+    text = _numbers.sub("?", text)
+    text = _placeholders.sub("?", text)
+    text = _lists.sub("(...)", text)
+    text = _rows.sub("(...)", text)
+    return _whitespace.sub(" ", text).strip()
+
+
+class QueryStats:
+    __slots__ = (
+        "fingerprint", "count", "slow_count", "total_seconds", "max_seconds",
+        "statement", "parameters", "engine", "plan",
+    )
+
+    def __init__(self, fingerprint: str):
+        self.fingerprint = fingerprint
+        # Estimated executions; fractional when sampled ones are included
+        self.count = 0.0
+        self.slow_count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        # The slowest execution and the engine it ran on, kept to EXPLAIN
+        # it later there; shards and replicas have engines of their own
+        self.statement = None
+        self.parameters = None
+        self.engine = None
+        self.plan = None
+
+
+class SlowQueryLog:
+    """Per-fingerprint statement timings of this worker.
+
+    Statements at or over the threshold are always logged and counted.
+    Faster ones are counted for a ``sample_rate`` fraction of executions,
+    each standing for ``1 / sample_rate`` of them, so counts and totals
+    that include fast executions are estimates.
+    """
+
+    def __init__(self, threshold_ms: float, sample_rate: float, max_fingerprints: int):
+        self.threshold = threshold_ms / 1000
+        self.sample_rate = sample_rate
+        self.max_fingerprints = max_fingerprints
+        self.keep_parameters = settings.SLOW_QUERY_EXPLAIN
+        self.stats: dict[str, QueryStats] = {}
+        # Executions not counted because max_fingerprints was reached
+        self.dropped = 0
+
+    def record(
+        self,
+        statement: str,
+        parameters,
+        executemany: bool,
+        seconds: float,
+        engine: Engine | None = None,
+    ):
+        slow = seconds >= self.threshold
+        if not slow and random.random() >= self.sample_rate:
+            return
+
+        key = fingerprint(statement)
+        stats = self.stats.get(key)
+        if stats is None:
+            if len(self.stats) >= self.max_fingerprints:
+                self.dropped += 1
+                return
+            stats = self.stats[key] = QueryStats(key)
+
+        if not slow:
+            # Scale the sample up, so fast fingerprints rank by their real share
+            weight = 1 / self.sample_rate
+            stats.count += weight
+            stats.total_seconds += seconds * weight
+            return
+
+        stats.count += 1
+        stats.slow_count += 1
+        stats.total_seconds += seconds
+        logger.warning("slow query %.1f ms: %s", seconds * 1000, key)
+        if seconds > stats.max_seconds:
+            stats.max_seconds = seconds
+            stats.statement = statement
+            if self.keep_parameters:
+                stats.parameters = parameters[0] if executemany else parameters
+                stats.engine = engine
+                stats.plan = None
+
+    def clear(self):
+        self.stats.clear()
+        self.dropped = 0
+
+    def ranked(self, limit: int) -> list[QueryStats]:
+        """The fingerprints that took the most time in total."""
+        return sorted(
+            self.stats.values(), key=lambda stats: stats.total_seconds, reverse=True
+        )[:limit]
+
+    def report(self, limit: int) -> models.SlowQueryReport:
+        return models.SlowQueryReport(
+            threshold_ms=self.threshold * 1000,
+            sample_rate=self.sample_rate,
+            dropped=self.dropped,
+            queries=[
+                models.SlowQueryStats(
+                    fingerprint=stats.fingerprint,
+                    count=round(stats.count),
+                    slow_count=stats.slow_count,
+                    total_ms=stats.total_seconds * 1000,
+                    mean_ms=stats.total_seconds * 1000 / stats.count,
+                    max_ms=stats.max_seconds * 1000,
+                    plan=stats.plan,
+                )
+                for stats in self.ranked(limit)
+            ],
+        )
+
+    async def explain(self, limit: int):
+        """EXPLAIN the slowest execution of the top ``limit`` fingerprints.
+
+        Each runs on the engine the statement ran on, on a connection of its
+        own, and rolls back, so a statement the database refuses to explain
+        cannot affect any request.
+        """
+        candidates = [
+            stats
+            for stats in self.ranked(limit)
+            if stats.plan is None
+            and stats.parameters is not None
+            and stats.engine is not None
+            and stats.statement.lstrip().lower().startswith(EXPLAINABLE)
+        ]
+        if not candidates:
+            return
+
+        for stats in candidates:
+            engine = AsyncEngine(stats.engine)
+            prefix = (
+                "EXPLAIN QUERY PLAN " if engine.dialect.name == "sqlite" else "EXPLAIN "
+            )
+            async with engine.connect() as conn:
+                try:
+                    result = await conn.exec_driver_sql(
+                        prefix + stats.statement, stats.parameters
+                    )
+                    stats.plan = "\n".join(
+                        " ".join(str(value) for value in row) for row in result
+                    )
+                except Exception as exc:
+                    stats.plan = f"EXPLAIN failed: {exc}"
+                await conn.rollback()
+
+
+log = SlowQueryLog(
+    settings.SLOW_QUERY_THRESHOLD_MS,
+    settings.SLOW_QUERY_SAMPLE_RATE,
+    settings.SLOW_QUERY_MAX_FINGERPRINTS,
+)
+
+
+def observe_query(conn, statement, parameters, executemany, seconds):
+    """A ``query_events`` observer feeding ``log``."""
+    log.record(statement, parameters, executemany, seconds, conn.engine)
@@ -0,0 +1,260 @@
+import asyncio
+import logging
+from collections import defaultdict
+
+from sqlalchemy.exc import SQLAlchemyError
+from sqlmodel import delete, func, insert, select, update
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from . import config
+from . import ledger
+from . import models
+from . import sales
+
+
+logger = logging.getLogger(__name__)
+
+settings = config.get_settings()
+
+MASK64 = (1 << 64) - 1
+
+# Most credits folded by one compact_wallet transaction
+COMPACT_BATCH = 5_000
+
+
+def stripe_for(key: int, stripes: int) -> int:
+    """The stripe a credit keyed by ``key`` goes to.
+
+    Keys are customer wallet ids, so concurrent buyers spread over the
+    stripes while one buyer's purchases always land on the same stripe.
+    """
+    # Fibonacci hashing, so ids that stride by the stripe count still spread
+    return (((key * 0x9E3779B97F4A7C15) & MASK64) >> 32) % stripes
+
+
+async def striped_wallet(session: AsyncSession, user_id: int):
+    """(id, stripes) of ``user_id``'s wallet when it is striped, else None."""
+    result = await session.exec(
+        select(models.DBWallet.id, models.DBWallet.stripes).where(
+            models.DBWallet.user_id == user_id, models.DBWallet.stripes > 0
+        )
+    )
+    return result.first()
+
+
+async def credit(
+    session: AsyncSession,
+    wallet_id: int,
+    stripe: int,
+    postings: list[tuple[float, int]],
+    created_at,
+):
+    """Credit ``(amount, transaction_id)`` sales to one stripe of a wallet.
+
+    Only the stripe row is locked; the wallet row, its ``ledger_seq`` and
+    the ledger are left to :func:`compact_wallet`. The caller commits.
+    """
+    amount = sum(price for price, _ in postings)
+    upsert = models.dialect_insert(session)(models.DBWalletStripe)
+    await session.exec(
+        upsert.values(wallet_id=wallet_id, stripe=stripe, balance=amount)
+        .on_conflict_do_update(
+            index_elements=[models.DBWalletStripe.wallet_id, models.DBWalletStripe.stripe],
+            set_=dict(balance=models.DBWalletStripe.balance + upsert.excluded.balance),
+        )
+    )
+    await session.exec(
+        insert(models.DBStripeCredit),
+        params=[
+            dict(
+                wallet_id=wallet_id,
+                transaction_id=transaction_id,
+                stripe=stripe,
+                amount=price,
+                created_at=created_at,
+            )
+            for price, transaction_id in postings
+        ],
+    )
+
+
+async def unfolded(session: AsyncSession, wallet_ids: list[int]) -> dict[int, float]:
+    """Credits still in the stripes of the given wallets, by wallet id."""
+    if not wallet_ids:
+        return {}
+    result = await session.exec(
+        select(models.DBWalletStripe.wallet_id, func.sum(models.DBWalletStripe.balance))
+        .where(models.DBWalletStripe.wallet_id.in_(wallet_ids))
+        .group_by(models.DBWalletStripe.wallet_id)
+    )
+    return dict(result.all())
+
+
+async def with_stripes(
+    session: AsyncSession, dbwallets: list[models.DBWallet]
+) -> list[models.Wallet]:
+    """Wallets with the credits waiting in their stripes added to the balance."""
+    pending = await unfolded(
+        session, [wallet.id for wallet in dbwallets if wallet.stripes]
+    )
+    # Built afresh: validating a DBWallet as a Wallet returns the row itself,
+    # and changing its balance would be flushed
+    return [
+        models.Wallet(
+            id=dbwallet.id,
+            balance=dbwallet.balance + pending.get(dbwallet.id, 0.0),
+            user_id=dbwallet.user_id,
+            role=dbwallet.role,
+        )
+        for dbwallet in dbwallets
+    ]
+
+
+async def compact_wallet(session: AsyncSession, wallet_id: int) -> int:
+    """Fold up to ``COMPACT_BATCH`` credits in a wallet's stripes into its
+    balance, ledger and sales rollups, and commit.
+
+    Takes exactly the credits it deletes out of their stripes, so credits
+    committing meanwhile stay in the stripes for the next run. Ledger
+    entries are dated when they are folded. Returns the number folded.
+    """
+    batch_ids = (
+        select(models.DBStripeCredit.transaction_id)
+        .where(models.DBStripeCredit.wallet_id == wallet_id)
+        .order_by(models.DBStripeCredit.transaction_id)
+        .limit(COMPACT_BATCH)
+    )
+    result = await session.exec(
+        delete(models.DBStripeCredit)
+        .where(
+            models.DBStripeCredit.wallet_id == wallet_id,
+            models.DBStripeCredit.transaction_id.in_(batch_ids),
+        )
+        .returning(
+            models.DBStripeCredit.stripe,
+            models.DBStripeCredit.amount,
+            models.DBStripeCredit.transaction_id,
+            models.DBStripeCredit.created_at,
+        )
+    )
+    credits = sorted(result.all(), key=lambda c: (c.created_at, c.transaction_id))
+    if not credits:
+        await session.rollback()
+        return 0
+
+    folded = defaultdict(float)
+    for c in credits:
+        folded[c.stripe] += c.amount
+    for stripe, amount in sorted(folded.items()):
+        await session.exec(
+            update(models.DBWalletStripe)
+            .where(
+                models.DBWalletStripe.wallet_id == wallet_id,
+                models.DBWalletStripe.stripe == stripe,
+            )
+            .values(balance=models.DBWalletStripe.balance - amount)
+            .execution_options(synchronize_session=False)
+        )
+
+    credited = await session.exec(
+        update(models.DBWallet)
+        .where(models.DBWallet.id == wallet_id)
+        .values(
+            balance=models.DBWallet.balance + sum(folded.values()),
+            ledger_seq=models.DBWallet.ledger_seq + len(credits),
+        )
+        .returning(models.DBWallet.balance, models.DBWallet.ledger_seq)
+        .execution_options(synchronize_session=False)
+    )
+    wallet = credited.first()
+    if wallet is None:
+        # The wallet was deleted; leave its credits where they are
+        await session.rollback()
+        return 0
+
+    batch = ledger.LedgerBatch()
+    batch.post(
+        wallet_id,
+        wallet.ledger_seq,
+        wallet.balance,
+        [(c.amount, models.LedgerEntryKind.sale, c.transaction_id) for c in credits],
+    )
+    await batch.write(session)
+
+    # Purchases on another shard were rolled up on the customer's shard, so
+    # only the transactions found here are left to roll up
+    result = await session.exec(
+        select(models.DBTransection).where(
+            models.DBTransection.id.in_([c.transaction_id for c in credits])
+        )
+    )
+    await sales.record_sales(session, result.all())
+    await session.commit()
+    return len(credits)
+
+
+async def compact(session: AsyncSession) -> int:
+    """Compact every wallet with credits in its stripes on ``session``'s database."""
+    result = await session.exec(select(models.DBStripeCredit.wallet_id).distinct())
+    wallet_ids = result.all()
+    await session.rollback()
+
+    folded = 0
+    for wallet_id in wallet_ids:
+        while True:
+            count = await compact_wallet(session, wallet_id)
+            folded += count
+            if count < COMPACT_BATCH:
+                break
+    return folded
+
+
+async def compact_all() -> int:
+    folded = 0
+    for factory in models.data_session_factories():
+        async with factory() as session:
+            try:
+                folded += await compact(session)
+            except (SQLAlchemyError, OSError) as exc:
+                await session.rollback()
+                logger.warning("compacting wallet stripes failed: %s", exc)
+    return folded
+
+
+async def run_compactor(seconds: float):
+    while True:
+        await asyncio.sleep(seconds)
+        try:
+            await compact_all()
+        except Exception:
+            # Keep compacting; stopping would let the stripes grow for good
+            logger.exception("compacting wallet stripes failed")
+
+
+async def set_stripes(
+    session: AsyncSession, wallet_id: int, stripes: int
+) -> models.WalletStripes | None:
+    """Stripe a wallet over ``stripes`` rows, or stop striping it with 0, and commit.
+
+    Credits already in the stripes stay readable and are folded as usual;
+    turning striping off folds them at once.
+    """
+    result = await session.exec(
+        update(models.DBWallet)
+        .where(models.DBWallet.id == wallet_id)
+        .values(stripes=stripes)
+        .returning(models.DBWallet.id)
+        .execution_options(synchronize_session=False)
+    )
+    if result.first() is None:
+        await session.rollback()
+        return None
+    await session.commit()
+
+    if not stripes:
+        while await compact_wallet(session, wallet_id) == COMPACT_BATCH:
+            pass
+    pending = await unfolded(session, [wallet_id])
+    return models.WalletStripes(
+        wallet_id=wallet_id, stripes=stripes, unfolded=pending.get(wallet_id, 0.0)
+    )
@@ -0,0 +1,106 @@
+"""Time to create a catalog through ``POST /items/bulk``.
+
+Registers a merchant, then uploads ``--items`` generated rows as CSV or
+NDJSON, streamed in 64 KiB chunks through the ASGI app. With ``--single N``
+it also times N plain ``POST /items`` calls to extrapolate what the same
+catalog costs one request per item. Set ``ITEM_IMPORT_BATCH_SIZE`` in the
+environment to try other batch sizes. The target database is dropped and
+recreated.
+
+    poetry run python performance-tests/bench_bulk_import.py --items 100000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import pathlib
+import time
+
+from httpx import ASGITransport, AsyncClient
+
+from digimon import config, main, models
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+def rows(count: int, fmt: str):
+    if fmt == "csv":
+        yield b"name,description,price,tax\n"
+    for i in range(count):
+        if fmt == "csv":
+            yield f"item {i},bulk item number {i},{i % 100 + 1}.5,0.07\n".encode()
+        else:
+            yield (json.dumps(dict(name=f"item {i}", description=f"bulk item number {i}",
+                                   price=i % 100 + 1.5, tax=0.07)) + "\n").encode()
+
+
+async def body(count: int, fmt: str):
+    buffer = bytearray()
+    for row in rows(count, fmt):
+        buffer += row
+        if len(buffer) >= CHUNK_SIZE:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+async def login(client: AsyncClient) -> dict:
+    user = dict(email="bulk@bench.local", username="bench-bulk",
+                first_name="Bench", last_name="Bulk", password="bench")
+    await client.post("/users/register_merchant",
+                      json=dict(user_info=user, merchant_info=dict(name="bench")))
+    response = await client.post("/token", data=dict(username="bench-bulk", password="bench"))
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+async def run(args):
+    settings = config.Settings(SQLDB_URL=args.url)
+    app = main.create_app(settings)
+    await models.recreate_table()
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://bench", timeout=None
+    ) as client:
+        headers = await login(client)
+
+        started = time.perf_counter()
+        response = await client.post(
+            "/items/bulk",
+            params=dict(format=args.format),
+            content=body(args.items, args.format),
+            headers=headers,
+        )
+        elapsed = time.perf_counter() - started
+        report = response.json()
+        print(f"bulk {args.format:<6}: {report['imported']} imported, {report['failed']} failed "
+              f"in {elapsed:.2f}s ({report['imported'] / elapsed:,.0f} items/s)")
+
+        if args.single:
+            started = time.perf_counter()
+            for i in range(args.single):
+                await client.post("/items", json=dict(name=f"single {i}", price=1.5),
+                                  headers=headers)
+            elapsed = time.perf_counter() - started
+            print(f"single POST : {args.single / elapsed:,.0f} items/s, "
+                  f"{args.items} items would take {args.items * elapsed / args.single:.0f}s")
+
+    await models.close_session()
+
+
+if __name__ == "__main__":
+    pathlib.Path("test-data").mkdir(exist_ok=True)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--url",
+        default=os.environ.get(
+            "BENCH_SQLDB_URL", "sqlite+aiosqlite:///test-data/bench-bulk-import.db"
+        ),
+    )
+    parser.add_argument("--items", type=int, default=100_000)
+    parser.add_argument("--format", choices=["csv", "ndjson"], default="csv")
+    parser.add_argument("--single", type=int, default=0)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,137 @@
+"""Rows/sec and peak memory of ``GET /transections/export``.
+
+Seeds ``--rows`` sales of one merchant and streams them back as that
+merchant by calling the ASGI app directly with a ``send`` that counts and drops body chunks, so memory growth
+is the server's alone. Pass ``--legacy`` to fetch
+``GET /transections/transections`` instead, which loads the whole table into
+one response. The target database is dropped and recreated.
+
+    poetry run python performance-tests/bench_export.py --rows 1000000
+"""
+
+import argparse
+import asyncio
+import os
+import pathlib
+import resource
+import time
+
+from sqlmodel import insert
+
+from digimon import config, main, models, security
+
+
+SEED_BATCH = 10_000
+MERCHANT_ID = 1
+
+
+async def seed(rows: int):
+    async with models.session_factory() as session:
+        for start in range(0, rows, SEED_BATCH):
+            await session.exec(
+                insert(models.DBTransection),
+                params=[
+                    dict(
+                        item_id=i % 100 + 1,
+                        price=1.0,
+                        quantity=1,
+                        merchant_id=MERCHANT_ID,
+                        customer_id=i % 1000 + 1,
+                    )
+                    for i in range(start, min(start + SEED_BATCH, rows))
+                ],
+            )
+        await session.commit()
+
+
+async def fetch(app, path: str, query: str, token: str = ""):
+    """Run one GET through ``app`` and return (status, newlines in the body)."""
+    scope = dict(
+        type="http",
+        asgi=dict(version="3.0"),
+        http_version="1.1",
+        method="GET",
+        scheme="http",
+        path=path,
+        raw_path=path.encode(),
+        query_string=query.encode(),
+        root_path="",
+        headers=[
+            (b"host", b"bench"),
+            (b"authorization", f"Bearer {token}".encode()),
+        ],
+        client=("127.0.0.1", 0),
+        server=("bench", 80),
+    )
+    received = False
+    response = dict(status=None, lines=0)
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return dict(type="http.request", body=b"", more_body=False)
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            response["lines"] += message.get("body", b"").count(b"\n")
+
+    await app(scope, receive, send)
+    return response["status"], response["lines"]
+
+
+def max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def run(args):
+    settings = config.Settings(SQLDB_URL=args.url)
+    app = main.create_app(settings)
+    await models.recreate_table()
+    await seed(args.rows)
+
+    rss_before = max_rss_mb()
+    started = time.perf_counter()
+    if args.legacy:
+        status, _ = await fetch(app, "/transections/transections", "")
+        exported = args.rows
+    else:
+        # Claims in the token, so no user rows are needed
+        token = security.create_access_token(
+            data=dict(sub=1, role=models.UserRole.merchant, merchant_id=MERCHANT_ID)
+        )
+        status, exported = await fetch(
+            app, "/transections/export", f"format={args.format}", token
+        )
+        if args.format == "csv":
+            exported -= 1
+    elapsed = time.perf_counter() - started
+    assert status == 200, status
+
+    print(f"mode            : {'legacy' if args.legacy else args.format}")
+    print(f"batch size      : {settings.EXPORT_BATCH_SIZE}")
+    print(f"rows exported   : {exported}")
+    print(f"elapsed         : {elapsed:.2f}s")
+    print(f"rows/sec        : {exported / elapsed:.0f}")
+    print(f"peak RSS growth : {max_rss_mb() - rss_before:.1f} MB")
+
+    await models.close_session()
+
+
+if __name__ == "__main__":
+    pathlib.Path("test-data").mkdir(exist_ok=True)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--url",
+        default=os.environ.get(
+            "BENCH_SQLDB_URL", "sqlite+aiosqlite:///test-data/bench-export.db"
+        ),
+    )
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--format", choices=("ndjson", "csv"), default="ndjson")
+    parser.add_argument("--legacy", action="store_true")
+    asyncio.run(run(parser.parse_args()))
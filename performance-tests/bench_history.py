@@ -0,0 +1,124 @@
+"""Latency of a merchant's last-30-days ``/transections/history`` page.
+
+Seeds ``--rows`` transactions spread over a year and ``--merchants``
+merchants, then times the first history page of one merchant for the last
+30 days. On PostgreSQL the rows are generated server-side and the query
+plan is printed. The target database is dropped and recreated.
+
+    poetry run python performance-tests/bench_history.py --rows 10000000
+"""
+
+import argparse
+import asyncio
+import datetime
+import os
+import pathlib
+import statistics
+import time
+
+from sqlalchemy import text
+from sqlmodel import insert
+
+from digimon import config, models
+from digimon.routers import transactions
+
+
+SEED_BATCH = 10_000
+YEAR_SECONDS = 365 * 24 * 3600
+
+
+async def seed(session, args, now):
+    table = models.DBTransection.__tablename__
+    if session.bind.dialect.name == "postgresql":
+        await session.exec(
+            text(
+                f"INSERT INTO {table} "
+                "(item_id, price, quantity, merchant_id, customer_id, created_at) "
+                "SELECT i % 100 + 1, 1.0, 1, i % :merchants + 1, i % 100000 + 1, "
+                ":now - (i % :year) * interval '1 second' "
+                "FROM generate_series(1, :rows) AS i"
+            ).bindparams(
+                merchants=args.merchants, year=YEAR_SECONDS, rows=args.rows, now=now
+            )
+        )
+        await session.exec(text(f"ANALYZE {table}"))
+    else:
+        for start in range(0, args.rows, SEED_BATCH):
+            await session.exec(
+                insert(models.DBTransection),
+                params=[
+                    dict(
+                        item_id=i % 100 + 1,
+                        price=1.0,
+                        quantity=1,
+                        merchant_id=i % args.merchants + 1,
+                        customer_id=i % 100000 + 1,
+                        created_at=now - datetime.timedelta(seconds=i % YEAR_SECONDS),
+                    )
+                    for i in range(start, min(start + SEED_BATCH, args.rows))
+                ],
+            )
+    await session.commit()
+
+
+def percentile(values, q):
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+
+async def run(args):
+    settings = config.Settings(SQLDB_URL=args.url)
+    models.init_db(settings)
+    await models.recreate_table()
+
+    now = datetime.datetime.now()
+    start = now - datetime.timedelta(days=30)
+    claims = models.TokenClaims(
+        user_id=1, role=models.UserRole.merchant, merchant_id=1
+    )
+
+    async with models.session_factory() as session:
+        started = time.perf_counter()
+        await seed(session, args, now)
+        print(f"seeded          : {args.rows} rows in {time.perf_counter() - started:.1f}s")
+
+        latencies = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            page = await transactions.read_transection_history(
+                session, claims, start=start, limit=args.limit
+            )
+            latencies.append(time.perf_counter() - started)
+
+        if session.bind.dialect.name == "postgresql":
+            plan = await session.exec(
+                text(
+                    "EXPLAIN ANALYZE SELECT * FROM dbtransection "
+                    "WHERE merchant_id = 1 AND created_at >= :start "
+                    "ORDER BY created_at DESC, id DESC LIMIT :limit"
+                ).bindparams(start=start, limit=args.limit + 1)
+            )
+            print("plan            :")
+            for (line,) in plan.all():
+                print(f"    {line}")
+
+    print(f"page size       : {len(page.transactions)}")
+    print(f"p50 / p99       : {percentile(latencies, 50) * 1000:.2f} / {percentile(latencies, 99) * 1000:.2f} ms")
+
+    await models.close_session()
+
+
+if __name__ == "__main__":
+    pathlib.Path("test-data").mkdir(exist_ok=True)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--url",
+        default=os.environ.get(
+            "BENCH_SQLDB_URL", "sqlite+aiosqlite:///test-data/bench-history.db"
+        ),
+    )
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--merchants", type=int, default=1000)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=200)
+    asyncio.run(run(parser.parse_args()))
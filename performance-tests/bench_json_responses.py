@@ -0,0 +1,129 @@
+"""CPU per request of 1,000-row list pages, standard vs fast JSON mode.
+
+Seeds ``--rows`` items, wallets and transactions, then requests
+``/items/{rows}/``, ``/wallets`` and ``/transections/transections`` through
+the ASGI app ``--requests`` times per round for ``--rounds`` rounds, with
+each router's ``responder`` alternating between the standard mode (FastAPI
+validates the returned model again and encodes it) and the fast mode (one
+``TypeAdapter`` pass, bytes from pydantic-core).
+The item list cache is cleared before every request so each one builds
+its page. The target database is dropped and recreated.
+
+    poetry run python performance-tests/bench_json_responses.py --rows 1000
+"""
+
+import argparse
+import asyncio
+import os
+import pathlib
+import time
+
+from httpx import ASGITransport, AsyncClient
+from sqlmodel import insert
+
+from digimon import config, main, models
+from digimon.routers import items, transactions, wallets
+
+
+async def seed(rows: int):
+    async with models.session_factory() as session:
+        await session.exec(
+            insert(models.DBUser),
+            params=[
+                dict(
+                    email=f"user{i}@bench.local",
+                    username=f"bench-{i}",
+                    first_name="Bench",
+                    last_name="Json",
+                    password="-",
+                    role=models.UserRole.customer,
+                )
+                for i in range(rows)
+            ],
+        )
+        merchant = models.DBMerchant(name="bench", user_id=1)
+        session.add(merchant)
+        await session.flush()
+        await session.exec(
+            insert(models.DBItem),
+            params=[
+                dict(
+                    name=f"item {i}",
+                    description=f"description of item {i}",
+                    price=i + 0.5,
+                    tax=0.07,
+                    merchant_id=merchant.id,
+                    user_id=1,
+                    role=models.UserRole.merchant,
+                )
+                for i in range(rows)
+            ],
+        )
+        await session.exec(
+            insert(models.DBWallet),
+            params=[
+                dict(balance=100.0, user_id=i + 1, role=models.UserRole.customer)
+                for i in range(rows)
+            ],
+        )
+        await session.exec(
+            insert(models.DBTransection),
+            params=[
+                dict(item_id=i + 1, price=i + 0.5, quantity=1, merchant_id=1, customer_id=1)
+                for i in range(rows)
+            ],
+        )
+        await session.commit()
+
+
+async def measure(client: AsyncClient, path: str, requests: int) -> float:
+    """Process CPU seconds per request, after one warm-up request."""
+    for attempt in range(requests + 1):
+        if attempt == 1:
+            started = time.process_time()
+        items.item_list_cache.clear()
+        response = await client.get(path)
+        assert response.status_code == 200, response.text
+    return (time.process_time() - started) / requests
+
+
+async def run(args):
+    settings = config.Settings(SQLDB_URL=args.url)
+    app = main.create_app(settings)
+    await models.recreate_table()
+    await seed(args.rows)
+
+    endpoints = (
+        (items, f"/items/{args.rows}/"),
+        (wallets, "/wallets"),
+        (transactions, "/transections/transections"),
+    )
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench") as client:
+        for router, path in endpoints:
+            # Alternate the modes in rounds so drift hits both equally
+            cpu = {False: 0.0, True: 0.0}
+            for _ in range(args.rounds):
+                for fast in (False, True):
+                    router.responder.fast = fast
+                    cpu[fast] += await measure(client, path, args.requests) / args.rounds
+            print(f"{path:<28}: standard {cpu[False] * 1000:6.2f} ms, "
+                  f"fast {cpu[True] * 1000:6.2f} ms, "
+                  f"saved {(1 - cpu[True] / cpu[False]) * 100:4.1f}%")
+
+    await models.close_session()
+
+
+if __name__ == "__main__":
+    pathlib.Path("test-data").mkdir(exist_ok=True)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--url",
+        default=os.environ.get(
+            "BENCH_SQLDB_URL", "sqlite+aiosqlite:///test-data/bench-json.db"
+        ),
+    )
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=5)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,122 @@
+"""``GET /items`` latency while a ``POST /token`` login storm is running.
+
+The app runs in-process behind httpx's ASGI transport, so logins and item
+reads share one event loop exactly like a single uvicorn worker. Pass
+``--blocking`` to hash on the event loop (the old behaviour) for comparison.
+The target database is dropped and recreated.
+
+    poetry run python performance-tests/bench_login_storm.py --logins 200
+"""
+
+import argparse
+import asyncio
+import os
+import pathlib
+import statistics
+import time
+
+from httpx import ASGITransport, AsyncClient
+
+from digimon import config, main, models, security
+
+
+async def seed(client: AsyncClient, users: int):
+    for i in range(users):
+        response = await client.post(
+            "/users/register_customer",
+            json=dict(
+                user_info=dict(
+                    email=f"storm{i}@bench.local",
+                    username=f"storm{i}",
+                    first_name="Storm",
+                    last_name="User",
+                    password="password",
+                ),
+                customer_info=dict(name=f"storm{i}"),
+            ),
+        )
+        response.raise_for_status()
+
+
+async def login_storm(client: AsyncClient, users: int, logins: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def login(i):
+        async with semaphore:
+            response = await client.post(
+                "/token",
+                data=dict(username=f"storm{i % users}", password="password"),
+            )
+            response.raise_for_status()
+
+    await asyncio.gather(*[login(i) for i in range(logins)])
+
+
+async def probe_items(client: AsyncClient, done: asyncio.Event, latencies: list):
+    while not done.is_set():
+        started = time.perf_counter()
+        response = await client.get("/items")
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(0.01)
+
+
+def percentile(values, q):
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+
+async def run(args):
+    settings = config.Settings(SQLDB_URL=args.url)
+    app = main.create_app(settings)
+    await models.recreate_table()
+
+    if args.blocking:
+        async def verify_on_loop(plain_password, hashed_password):
+            return security._check_password(plain_password, hashed_password)
+
+        security.verify_password = verify_on_loop
+
+    client = AsyncClient(transport=ASGITransport(app=app), base_url="http://bench")
+    await seed(client, args.users)
+
+    idle = []
+    idle_done = asyncio.Event()
+    probe = asyncio.create_task(probe_items(client, idle_done, idle))
+    await asyncio.sleep(1)
+    idle_done.set()
+    await probe
+
+    storm = []
+    storm_done = asyncio.Event()
+    probe = asyncio.create_task(probe_items(client, storm_done, storm))
+    started = time.perf_counter()
+    await login_storm(client, args.users, args.logins, args.concurrency)
+    elapsed = time.perf_counter() - started
+    storm_done.set()
+    await probe
+
+    print(f"mode              : {'blocking' if args.blocking else 'executor'}")
+    print(f"bcrypt rounds     : {settings.BCRYPT_ROUNDS}")
+    print(f"hash workers      : {settings.PASSWORD_HASH_WORKERS}")
+    print(f"logins/sec        : {args.logins / elapsed:.1f}")
+    print(f"idle  p50 / p99   : {percentile(idle, 50) * 1000:.1f} / {percentile(idle, 99) * 1000:.1f} ms")
+    print(f"storm p50 / p99   : {percentile(storm, 50) * 1000:.1f} / {percentile(storm, 99) * 1000:.1f} ms")
+
+    await models.close_session()
+
+
+if __name__ == "__main__":
+    pathlib.Path("test-data").mkdir(exist_ok=True)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--url",
+        default=os.environ.get(
+            "BENCH_SQLDB_URL", "sqlite+aiosqlite:///test-data/bench-login.db"
+        ),
+    )
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--blocking", action="store_true")
+    asyncio.run(run(parser.parse_args()))
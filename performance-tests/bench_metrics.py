@@ -0,0 +1,215 @@
+"""Per-request overhead of the metrics, timed on ``POST /buy``.
+
+Builds the app twice from the same settings, once with ``METRICS_ENABLED``
+and once without, each on an engine of its own over one seeded database.
+A customer then buys through the ASGI app directly, alternating between
+the two on every request. The median difference in process CPU time per
+purchase is the cost of the middleware and of counting every query of the
+request. It is checked against ``--budget-us``, and the run exits with an
+error when it is over. Both apps keep the slow query log as configured,
+so with it and ``METRICS_QUERY_EVENTS`` on the metrics only add their
+observer to its listeners.
+
+    poetry run python performance-tests/bench_metrics.py --rounds 20
+"""
+
+import argparse
+import asyncio
+import datetime
+import gc
+import json
+import os
+import pathlib
+import statistics
+import sys
+import time
+
+from digimon import config, deps, main, metrics, models, query_events, security
+
+
+PRICE = 1.0
+# Purchases per arm before timing starts
+WARMUP = 20
+
+
+async def seed(session_maker, balance: float) -> str:
+    async with session_maker() as session:
+        merchant_user = models.DBUser(
+            email="merchant@bench.local",
+            username="bench-merchant",
+            first_name="Bench",
+            last_name="Merchant",
+            password="-",
+            role=models.UserRole.merchant,
+        )
+        customer_user = models.DBUser(
+            email="buyer@bench.local",
+            username="bench-buyer",
+            first_name="Bench",
+            last_name="Buyer",
+            password="-",
+            role=models.UserRole.customer,
+        )
+        session.add(merchant_user)
+        session.add(customer_user)
+        await session.flush()
+
+        merchant = models.DBMerchant(name="bench", user_id=merchant_user.id)
+        session.add(merchant)
+        session.add(models.DBCustomer(name="buyer", user_id=customer_user.id))
+        session.add(
+            models.DBWallet(
+                balance=0.0, user_id=merchant_user.id, role=models.UserRole.merchant
+            )
+        )
+        session.add(
+            models.DBWallet(
+                balance=balance, user_id=customer_user.id, role=models.UserRole.customer
+            )
+        )
+        await session.flush()
+        item = models.DBItem(
+            name="bench-item",
+            price=PRICE,
+            merchant_id=merchant.id,
+            user_id=merchant_user.id,
+            role=models.UserRole.merchant,
+        )
+        session.add(item)
+        await session.commit()
+
+        # Signed as POST /token signs it
+        claims = await deps.resolve_token_claims(
+            session, customer_user.id, customer_user.role
+        )
+        token = security.create_access_token(
+            data=dict(
+                sub=customer_user.id,
+                **claims.model_dump(exclude={"user_id"}, exclude_none=True, mode="json"),
+            ),
+            expires_delta=datetime.timedelta(hours=1),
+        )
+        return token, item.id
+
+
+class Arm:
+    """One app and the engine its requests run on."""
+
+    def __init__(self, settings: config.Settings):
+        self.app = main.create_app(settings)
+        self.engine = models.engine
+        self.session_factory = models.session_factory
+        self.observers = list(query_events.observers)
+
+    def activate(self):
+        models.engine = self.engine
+        models.session_factory = self.session_factory
+        query_events.set_observers(*self.observers)
+
+
+def purchase_scope(token: str) -> dict:
+    return dict(
+        type="http",
+        asgi=dict(version="3.0"),
+        http_version="1.1",
+        method="POST",
+        scheme="http",
+        path="/buy",
+        raw_path=b"/buy",
+        query_string=b"",
+        root_path="",
+        headers=[
+            (b"host", b"bench"),
+            (b"content-type", b"application/json"),
+            (b"authorization", f"Bearer {token}".encode()),
+        ],
+        client=("127.0.0.1", 0),
+        server=("bench", 80),
+    )
+
+
+async def time_purchase(arm: Arm, scope: dict, body: bytes) -> float:
+    async def receive():
+        return dict(type="http.request", body=body, more_body=False)
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status_codes.append(message["status"])
+        elif status_codes[-1] != 200:
+            raise RuntimeError(f"POST /buy answered {status_codes[-1]}: {message['body']}")
+
+    status_codes = []
+
+    arm.activate()
+    started = time.thread_time()
+    await arm.app(dict(scope), receive, send)
+    return time.thread_time() - started
+
+
+async def run(args) -> bool:
+    base = config.Settings(SQLDB_URL=args.url)
+    without = Arm(base.model_copy(update=dict(METRICS_ENABLED=False)))
+    await models.recreate_table()
+    purchases = 2 * (WARMUP + args.rounds * args.requests)
+    token, item_id = await seed(models.session_factory, PRICE * purchases)
+    with_metrics = Arm(base.model_copy(update=dict(METRICS_ENABLED=True)))
+    scope = purchase_scope(token)
+    body = json.dumps(dict(item_id=item_id)).encode()
+
+    for _ in range(WARMUP):
+        for arm in (without, with_metrics):
+            await time_purchase(arm, scope, body)
+    metrics.registry.clear()
+
+    # Requests alternate between the arms, so drift in the database or the
+    # machine lands on both; collections are kept out of the timed requests
+    timings = {without: [], with_metrics: []}
+    for round_ in range(args.rounds):
+        gc.collect()
+        gc.disable()
+        for request in range(args.requests):
+            order = (without, with_metrics) if request % 2 else (with_metrics, without)
+            for arm in order:
+                timings[arm].append(await time_purchase(arm, scope, body))
+        gc.enable()
+    for arm in timings:
+        await arm.engine.dispose()
+
+    queries = sum(queries for queries, _ in metrics.registry.request_db.values())
+    differences = [
+        with_ - without_
+        for with_, without_ in zip(timings[with_metrics], timings[without])
+    ]
+    # Single requests vary by far more than the budget; the median of the
+    # paired differences is not dragged about by the slowest of them
+    overhead = statistics.median(differences)
+    mean = statistics.mean(differences)
+    error = statistics.stdev(differences) / len(differences) ** 0.5
+    print(f"url             : {args.url}")
+    print(f"slow query log  : {'on' if base.SLOW_QUERY_LOG else 'off'}")
+    print(f"query events    : {'on' if base.METRICS_QUERY_EVENTS else 'off'}")
+    if base.METRICS_QUERY_EVENTS:
+        print(f"queries/request : {queries / len(differences):7.1f}")
+    print(f"without metrics : {statistics.mean(timings[without]) * 1e6:7.1f} µs/request")
+    print(f"with metrics    : {statistics.mean(timings[with_metrics]) * 1e6:7.1f} µs/request")
+    print(f"mean difference : {mean * 1e6:7.1f} ± {error * 1e6:.1f} µs/request")
+    print(f"overhead        : {overhead * 1e6:7.1f} µs/request, median "
+          f"(budget {args.budget_us:.0f} µs)")
+    return overhead * 1e6 <= args.budget_us
+
+
+if __name__ == "__main__":
+    pathlib.Path("test-data").mkdir(exist_ok=True)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--url",
+        default=os.environ.get(
+            "BENCH_SQLDB_URL", "sqlite+aiosqlite:///test-data/bench-metrics.db"
+        ),
+    )
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--budget-us", type=float, default=50)
+    if not asyncio.run(run(parser.parse_args())):
+        sys.exit("metrics overhead is over budget")
@@ -0,0 +1,227 @@
+"""Purchase throughput and lost-update check for the ``POST /buy`` engine.
+
+Runs ``purchases.purchase_item`` from many concurrent buyers and then checks
+that every committed purchase is reflected in the wallet balances. Pass
+``--cart N`` to check out N items from ``--merchants`` merchants per purchase
+through ``purchases.checkout_cart`` instead, or ``--legacy`` to run the old
+read-modify-write single-item path for comparison. The target database is dropped and recreated, so point
+``BENCH_SQLDB_URL`` at a scratch database.
+
+    poetry run python performance-tests/bench_purchase.py --buyers 200
+"""
+
+import argparse
+import asyncio
+import os
+import pathlib
+import time
+
+from fastapi import HTTPException
+from sqlmodel import func, select
+
+from digimon import config, models, purchases
+
+
+PRICE = 1.0
+
+
+async def seed(session_maker, args):
+    async with session_maker() as session:
+        merchants = []
+        for i in range(args.merchants):
+            merchant_user = models.DBUser(
+                email=f"merchant{i}@bench.local",
+                username=f"bench-merchant-{i}",
+                first_name="Bench",
+                last_name="Merchant",
+                password="-",
+                role=models.UserRole.merchant,
+            )
+            session.add(merchant_user)
+            await session.flush()
+
+            merchant = models.DBMerchant(name=f"bench{i}", user_id=merchant_user.id)
+            session.add(merchant)
+            session.add(
+                models.DBWallet(
+                    balance=0.0, user_id=merchant_user.id, role=models.UserRole.merchant
+                )
+            )
+            await session.flush()
+            merchants.append(merchant)
+
+        items = []
+        for i in range(args.cart):
+            merchant = merchants[i % len(merchants)]
+            item = models.DBItem(
+                name=f"bench-item-{i}",
+                price=PRICE,
+                merchant_id=merchant.id,
+                user_id=merchant.user_id,
+                role=models.UserRole.merchant,
+            )
+            session.add(item)
+            items.append(item)
+
+        customers = []
+        for i in range(args.buyers):
+            user = models.DBUser(
+                email=f"buyer{i}@bench.local",
+                username=f"bench-buyer-{i}",
+                first_name="Bench",
+                last_name="Buyer",
+                password="-",
+                role=models.UserRole.customer,
+            )
+            session.add(user)
+            await session.flush()
+            customer = models.DBCustomer(name=f"buyer{i}", user_id=user.id)
+            wallet = models.DBWallet(
+                balance=PRICE * args.purchases * args.cart,
+                user_id=user.id,
+                role=models.UserRole.customer,
+            )
+            session.add(customer)
+            session.add(wallet)
+            await session.flush()
+            customers.append(
+                models.TokenClaims(
+                    user_id=user.id,
+                    role=models.UserRole.customer,
+                    customer_id=customer.id,
+                    wallet_id=wallet.id,
+                )
+            )
+
+        await session.commit()
+        return (
+            [item.id for item in items],
+            [merchant.user_id for merchant in merchants],
+            customers,
+        )
+
+
+async def legacy_purchase(session, item_id: int, customer_user_id: int):
+    dbitem = await session.get(models.DBItem, item_id)
+    merchant_wallet = (
+        await session.exec(
+            select(models.DBWallet).where(models.DBWallet.user_id == dbitem.user_id)
+        )
+    ).one()
+    customer_wallet = (
+        await session.exec(
+            select(models.DBWallet).where(models.DBWallet.user_id == customer_user_id)
+        )
+    ).one()
+    dbcustomer = (
+        await session.exec(
+            select(models.DBCustomer).where(
+                models.DBCustomer.user_id == customer_user_id
+            )
+        )
+    ).one()
+
+    merchant_wallet.balance += dbitem.price
+    customer_wallet.balance -= dbitem.price
+    session.add(
+        models.DBTransection(
+            item_id=item_id,
+            price=dbitem.price,
+            merchant_id=dbitem.merchant_id,
+            customer_id=dbcustomer.id,
+        )
+    )
+
+
+async def buyer(session_maker, item_ids, customer, args, stats):
+    lines = [models.CartLine(item_id=item_id) for item_id in item_ids]
+    for _ in range(args.purchases):
+        async with session_maker() as session:
+            try:
+                if args.legacy:
+                    await legacy_purchase(session, item_ids[0], customer.user_id)
+                elif args.cart > 1:
+                    await purchases.checkout_cart(session, lines, customer)
+                else:
+                    await purchases.purchase_item(session, item_ids[0], customer)
+                await session.commit()
+                stats["ok"] += 1
+            except HTTPException:
+                stats["rejected"] += 1
+            except Exception:
+                stats["errors"] += 1
+
+
+async def main(args):
+    settings = config.Settings(SQLDB_URL=args.url)
+    models.init_db(settings)
+    await models.recreate_table()
+
+    session_maker = models.session_factory
+    item_ids, merchant_user_ids, customers = await seed(session_maker, args)
+
+    stats = dict(ok=0, rejected=0, errors=0)
+    started = time.perf_counter()
+    await asyncio.gather(
+        *[
+            buyer(session_maker, item_ids, customer, args, stats)
+            for customer in customers
+        ]
+    )
+    elapsed = time.perf_counter() - started
+
+    async with session_maker() as session:
+        merchant_balance = (
+            await session.exec(
+                select(func.sum(models.DBWallet.balance)).where(
+                    models.DBWallet.user_id.in_(merchant_user_ids)
+                )
+            )
+        ).one()
+        customer_balance = (
+            await session.exec(
+                select(func.sum(models.DBWallet.balance)).where(
+                    models.DBWallet.id.in_([c.wallet_id for c in customers])
+                )
+            )
+        ).one()
+        sold = (
+            await session.exec(select(func.sum(models.DBTransection.price)))
+        ).one() or 0.0
+
+    initial_customer_balance = PRICE * args.purchases * args.cart * args.buyers
+    lost_credits = round((sold - merchant_balance) / PRICE)
+    lost_debits = round(
+        (customer_balance - (initial_customer_balance - sold)) / PRICE
+    )
+
+    print(f"mode            : {'legacy' if args.legacy else 'atomic'}")
+    print(f"buyers          : {args.buyers}")
+    print(f"items per buy   : {args.cart}")
+    print(f"committed       : {stats['ok']}")
+    print(f"rejected        : {stats['rejected']}")
+    print(f"errors          : {stats['errors']}")
+    print(f"elapsed         : {elapsed:.2f}s")
+    print(f"purchases/sec   : {stats['ok'] / elapsed:.1f}")
+    print(f"lost credits    : {lost_credits}")
+    print(f"lost debits     : {lost_debits}")
+
+    await models.close_session()
+
+
+if __name__ == "__main__":
+    pathlib.Path("test-data").mkdir(exist_ok=True)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--url",
+        default=os.environ.get(
+            "BENCH_SQLDB_URL", "sqlite+aiosqlite:///test-data/bench-purchase.db"
+        ),
+    )
+    parser.add_argument("--buyers", type=int, default=200)
+    parser.add_argument("--purchases", type=int, default=5)
+    parser.add_argument("--cart", type=int, default=1)
+    parser.add_argument("--merchants", type=int, default=1)
+    parser.add_argument("--legacy", action="store_true")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,149 @@
+"""Latency of ``/items/search`` on a generated catalog.
+
+Seeds ``--items`` items named from a synthetic vocabulary, then times exact,
+prefix and misspelt one-word queries and two-word queries taken from seeded
+item names through ``search.search_items``. The backend is the one the app
+would pick: pg_trgm when the database has it, otherwise the in-process
+inverted index, whose build time is reported separately. The target
+database is dropped and recreated.
+
+    poetry run python performance-tests/bench_search.py --items 1000000
+"""
+
+import argparse
+import asyncio
+import os
+import pathlib
+import random
+import resource
+import statistics
+import string
+import time
+
+from sqlmodel import insert
+
+from digimon import config, models, search
+
+
+SEED_BATCH = 10_000
+
+
+def vocabulary(size: int, rng: random.Random) -> list[str]:
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 10))))
+    return sorted(words)
+
+
+def misspell(word: str, rng: random.Random) -> str:
+    i = rng.randrange(len(word) - 1)
+    return word[:i] + word[i + 1] + word[i] + word[i + 2 :]
+
+
+async def seed(session, args, words, rng):
+    user = models.DBUser(
+        email="search@bench.local",
+        username="bench-search",
+        first_name="Bench",
+        last_name="Search",
+        password="-",
+        role=models.UserRole.merchant,
+    )
+    session.add(user)
+    await session.flush()
+    merchant = models.DBMerchant(name="bench", user_id=user.id)
+    session.add(merchant)
+    await session.flush()
+
+    names = []
+    for start in range(0, args.items, SEED_BATCH):
+        batch = [
+            " ".join(rng.choices(words, k=rng.randint(1, 3)))
+            for _ in range(start, min(start + SEED_BATCH, args.items))
+        ]
+        names += [name for name in batch[:10] if " " in name]
+        await session.exec(
+            insert(models.DBItem),
+            params=[
+                dict(
+                    name=name,
+                    description=" ".join(rng.choices(words, k=rng.randint(4, 8))),
+                    price=1.0,
+                    merchant_id=merchant.id,
+                    user_id=user.id,
+                    role=models.UserRole.merchant,
+                )
+                for name in batch
+            ],
+        )
+    await session.commit()
+    return names
+
+
+def percentile(values, q):
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+
+async def run(args):
+    settings = config.Settings(SQLDB_URL=args.url)
+    models.init_db(settings)
+    await models.recreate_table()
+
+    rng = random.Random(0)
+    words = vocabulary(args.vocabulary, rng)
+    queries = dict(
+        exact=[rng.choice(words) for _ in range(args.queries)],
+        prefix=[rng.choice(words)[:3] for _ in range(args.queries)],
+        misspelt=[misspell(rng.choice(words), rng) for _ in range(args.queries)],
+    )
+
+    async with models.session_factory() as session:
+        started = time.perf_counter()
+        names = await seed(session, args, words, rng)
+        queries["two_words"] = [
+            " ".join(rng.choice(names).split()[:2]) for _ in range(args.queries)
+        ]
+        print(f"seeded          : {args.items} items in {time.perf_counter() - started:.1f}s")
+        if await search.enable_trigram_search(models.engine):
+            print(f"trigram indexes : {time.perf_counter() - started:.1f}s after seeding began")
+
+        trigram = await search._has_trigram_search(session)
+        print(f"backend         : {'pg_trgm' if trigram else 'inverted index'}")
+        if not trigram:
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            started = time.perf_counter()
+            await search.item_index.ensure_loaded(session)
+            print(f"index build     : {time.perf_counter() - started:.1f}s, "
+                  f"{len(search.item_index.postings)} words, "
+                  f"+{(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss) / 1024:.0f} MB")
+
+        for kind, terms in queries.items():
+            latencies = []
+            hits = 0
+            for term in terms:
+                started = time.perf_counter()
+                result = await search.search_items(session, term, 1, args.page_size)
+                latencies.append(time.perf_counter() - started)
+                hits += bool(result.items)
+            print(f"{kind:<16}: p50 {percentile(latencies, 50) * 1000:.2f} ms, "
+                  f"p99 {percentile(latencies, 99) * 1000:.2f} ms, "
+                  f"{hits}/{len(terms)} with results")
+
+    await models.close_session()
+
+
+if __name__ == "__main__":
+    pathlib.Path("test-data").mkdir(exist_ok=True)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--url",
+        default=os.environ.get(
+            "BENCH_SQLDB_URL", "sqlite+aiosqlite:///test-data/bench-search.db"
+        ),
+    )
+    parser.add_argument("--items", type=int, default=1_000_000)
+    parser.add_argument("--vocabulary", type=int, default=20_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--page-size", type=int, default=20)
+    asyncio.run(run(parser.parse_args()))
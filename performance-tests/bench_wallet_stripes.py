@@ -0,0 +1,260 @@
+"""Checkout throughput against one hot merchant with a striped wallet.
+
+Every purchase credits the same merchant. Each ``--stripes`` count runs on
+a freshly seeded database: 0 credits the wallet row itself, and K > 0
+credits one of K stripes. The compactor folds the stripes back every
+``--compact-every`` seconds while the buyers run. Afterwards the merchant
+balance and ledger are checked against what was sold.
+
+The buyers are split over ``--workers`` processes, as they would be over
+API workers, so the database rather than one event loop is the limit. Point
+``BENCH_SQLDB_URL`` at a scratch PostgreSQL database on a machine with
+cores to spare: SQLite locks the whole file for each write, so it has no
+row contention for stripes to remove.
+
+    BENCH_SQLDB_URL=postgresql+asyncpg://... \\
+        poetry run python performance-tests/bench_wallet_stripes.py --stripes 1 16
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import os
+import pathlib
+import statistics
+import time
+
+from fastapi import HTTPException
+from sqlmodel import func, select
+
+from digimon import config, models, purchases, stripes
+
+
+PRICE = 1.0
+
+
+async def seed(session_maker, args, stripe_count: int):
+    async with session_maker() as session:
+        merchant_user = models.DBUser(
+            email="merchant@bench.local",
+            username="bench-merchant",
+            first_name="Bench",
+            last_name="Merchant",
+            password="-",
+            role=models.UserRole.merchant,
+        )
+        session.add(merchant_user)
+        await session.flush()
+
+        merchant = models.DBMerchant(name="bench", user_id=merchant_user.id)
+        merchant_wallet = models.DBWallet(
+            balance=0.0,
+            user_id=merchant_user.id,
+            role=models.UserRole.merchant,
+            stripes=stripe_count,
+        )
+        session.add(merchant)
+        session.add(merchant_wallet)
+        await session.flush()
+
+        item = models.DBItem(
+            name="bench-item",
+            price=PRICE,
+            merchant_id=merchant.id,
+            user_id=merchant_user.id,
+            role=models.UserRole.merchant,
+        )
+        session.add(item)
+
+        customers = []
+        for i in range(args.buyers):
+            user = models.DBUser(
+                email=f"buyer{i}@bench.local",
+                username=f"bench-buyer-{i}",
+                first_name="Bench",
+                last_name="Buyer",
+                password="-",
+                role=models.UserRole.customer,
+            )
+            session.add(user)
+            await session.flush()
+            customer = models.DBCustomer(name=f"buyer{i}", user_id=user.id)
+            wallet = models.DBWallet(
+                balance=PRICE * args.purchases,
+                user_id=user.id,
+                role=models.UserRole.customer,
+            )
+            session.add(customer)
+            session.add(wallet)
+            await session.flush()
+            customers.append(
+                models.TokenClaims(
+                    user_id=user.id,
+                    role=models.UserRole.customer,
+                    customer_id=customer.id,
+                    wallet_id=wallet.id,
+                )
+            )
+
+        await session.commit()
+        return item.id, merchant_wallet.id, customers
+
+
+# Per worker process
+_loop = None
+
+
+def _init_worker(url: str):
+    global _loop
+    _loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(_loop)
+    models.init_db(config.Settings(SQLDB_URL=url))
+
+
+async def buyer(item_id, customer, purchase_count, stats):
+    for _ in range(purchase_count):
+        async with models.session_factory() as session:
+            started = time.perf_counter()
+            try:
+                await purchases.purchase_item(session, item_id, customer)
+                await session.commit()
+                stats["ok"] += 1
+                stats["latencies"].append(time.perf_counter() - started)
+            except HTTPException:
+                stats["rejected"] += 1
+            except Exception:
+                stats["errors"] += 1
+
+
+def _buy(item_id: int, customers: list, purchase_count: int) -> dict:
+    stats = dict(ok=0, rejected=0, errors=0, latencies=[])
+    _loop.run_until_complete(
+        asyncio.gather(
+            *[buyer(item_id, customer, purchase_count, stats) for customer in customers]
+        )
+    )
+    return stats
+
+
+async def compactor(every: float, stop: asyncio.Event):
+    while not stop.is_set():
+        await stripes.compact_all()
+        try:
+            await asyncio.wait_for(stop.wait(), every)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run(args, stripe_count: int) -> dict:
+    settings = config.Settings(SQLDB_URL=args.url)
+    models.init_db(settings)
+    await models.recreate_table()
+
+    session_maker = models.session_factory
+    item_id, merchant_wallet_id, customers = await seed(session_maker, args, stripe_count)
+
+    stop = asyncio.Event()
+    compacting = None
+    if stripe_count and args.compact_every > 0:
+        compacting = asyncio.create_task(compactor(args.compact_every, stop))
+
+    loop = asyncio.get_running_loop()
+    # Fresh workers per run, so no pooled connection outlives its tables
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=args.workers, initializer=_init_worker, initargs=(args.url,)
+    ) as pool:
+        started = time.perf_counter()
+        results = await asyncio.gather(
+            *[
+                loop.run_in_executor(
+                    pool, _buy, item_id, customers[worker :: args.workers], args.purchases
+                )
+                for worker in range(args.workers)
+            ]
+        )
+        elapsed = time.perf_counter() - started
+    stats = dict(ok=0, rejected=0, errors=0, latencies=[])
+    for result in results:
+        for key, value in result.items():
+            stats[key] += value
+
+    stop.set()
+    if compacting is not None:
+        await compacting
+    await stripes.compact_all()
+
+    async with session_maker() as session:
+        balance = (
+            await session.exec(
+                select(models.DBWallet.balance).where(
+                    models.DBWallet.id == merchant_wallet_id
+                )
+            )
+        ).one()
+        ledger_total = (
+            await session.exec(
+                select(func.coalesce(func.sum(models.DBLedgerEntry.amount), 0.0)).where(
+                    models.DBLedgerEntry.wallet_id == merchant_wallet_id
+                )
+            )
+        ).one()
+        sold = (
+            await session.exec(select(func.sum(models.DBTransection.price)))
+        ).one() or 0.0
+    await models.close_session()
+
+    latencies = sorted(stats["latencies"]) or [0.0]
+    return dict(
+        stripes=stripe_count,
+        committed=stats["ok"],
+        rejected=stats["rejected"],
+        errors=stats["errors"],
+        elapsed=elapsed,
+        rate=stats["ok"] / elapsed,
+        p50=statistics.median(latencies) * 1000,
+        p99=latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        lost_credits=round((sold - balance) / PRICE),
+        ledger_gap=round((balance - ledger_total) / PRICE),
+    )
+
+
+async def main(args):
+    results = [await run(args, stripe_count) for stripe_count in args.stripes]
+
+    print(f"url             : {args.url}")
+    print(f"buyers          : {args.buyers} x {args.purchases} purchases")
+    print(f"workers         : {args.workers}")
+    print(
+        f"{'stripes':>7} {'committed':>9} {'errors':>6} {'elapsed':>8} "
+        f"{'buys/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'lost':>5} {'ledger':>6}"
+    )
+    for r in results:
+        print(
+            f"{r['stripes']:>7} {r['committed']:>9} {r['errors'] + r['rejected']:>6} "
+            f"{r['elapsed']:>7.2f}s {r['rate']:>8.1f} {r['p50']:>8.1f} {r['p99']:>8.1f} "
+            f"{r['lost_credits']:>5} {r['ledger_gap']:>6}"
+        )
+    baseline = results[0]["rate"]
+    for r in results[1:]:
+        print(f"{r['stripes']} stripes vs {results[0]['stripes']}: {r['rate'] / baseline:.2f}x")
+
+
+if __name__ == "__main__":
+    pathlib.Path("test-data").mkdir(exist_ok=True)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--url",
+        default=os.environ.get(
+            "BENCH_SQLDB_URL", "sqlite+aiosqlite:///test-data/bench-stripes.db"
+        ),
+    )
+    parser.add_argument("--buyers", type=int, default=200)
+    parser.add_argument("--purchases", type=int, default=5)
+    parser.add_argument(
+        "--stripes", type=int, nargs="+", default=[1, 16],
+        help="stripe counts to compare; 0 credits the wallet row itself",
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--compact-every", type=float, default=0.5)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,174 @@
+"""Locust suite modelling shop traffic against a running API.
+
+Seed the database with ``seed_load_test.py``, start the API on the host
+the profile targets, then run a headless profile, or drop ``--config`` to
+use the web UI:
+
+    export SQLDB_URL=postgresql+asyncpg://...
+    poetry run python performance-tests/seed_load_test.py --customers 1000
+    poetry run uvicorn --factory digimon.main:create_app --port 8000
+    poetry run locust --config performance-tests/profiles/baseline.conf
+
+Shoppers log in as pre-seeded customers and browse item pages, open items,
+buy, top up their wallet and read their transaction history. A small share
+of visitors register a new account first. Requests are named by route so
+the per-endpoint stats line up with ``/metrics``. With ``--summary-file``
+the run's throughput and latency percentiles per endpoint are written as
+JSON on exit, for ``summarize_load_test.py`` to compare between releases.
+"""
+
+import json
+import pathlib
+import random
+import uuid
+
+from locust import HttpUser, between, events, task
+from locust.runners import WorkerRunner
+
+
+PASSWORD = "load-password"
+
+# Item ids seen on item pages, shared by the users of this process
+_item_ids: list[int] = []
+
+
+@events.init_command_line_parser.add_listener
+def _add_arguments(parser):
+    parser.add_argument(
+        "--seeded-customers",
+        type=int,
+        default=1000,
+        help="Customers created by seed_load_test.py",
+    )
+    parser.add_argument(
+        "--summary-file",
+        default="",
+        help="Write per-endpoint throughput and percentiles here as JSON on exit",
+    )
+
+
+def _summarize(entry) -> dict:
+    return dict(
+        requests=entry.num_requests,
+        failures=entry.num_failures,
+        rps=round(entry.total_rps, 2),
+        p50=entry.get_response_time_percentile(0.5),
+        p95=entry.get_response_time_percentile(0.95),
+        p99=entry.get_response_time_percentile(0.99),
+        max=round(entry.max_response_time or 0, 1),
+    )
+
+
+@events.quitting.add_listener
+def _write_summary(environment, **kwargs):
+    options = environment.parsed_options
+    if not getattr(options, "summary_file", None):
+        return
+    if isinstance(environment.runner, WorkerRunner):
+        return
+
+    stats = environment.stats
+    summary = dict(
+        host=environment.host,
+        users=options.num_users,
+        run_time=options.run_time,
+        total=_summarize(stats.total),
+        endpoints={
+            f"{entry.method} {entry.name}": _summarize(entry)
+            for entry in sorted(stats.entries.values(), key=lambda e: (e.name, e.method))
+        },
+    )
+    path = pathlib.Path(options.summary_file)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(summary, indent=2))
+
+
+class Shopper(HttpUser):
+    weight = 19
+    wait_time = between(0.5, 2)
+
+    def on_start(self):
+        self.next_cursor = None
+        customers = self.environment.parsed_options.seeded_customers
+        self.login(f"load-customer-{random.randrange(customers)}")
+        if not _item_ids:
+            self.browse_items()
+
+    def login(self, username: str):
+        with self.client.post(
+            "/token",
+            data=dict(username=username, password=PASSWORD),
+            name="/token",
+            catch_response=True,
+        ) as response:
+            if response.status_code != 200:
+                response.failure(f"login as {username} failed: {response.status_code}")
+                return
+            token = response.json()["access_token"]
+        self.client.headers["Authorization"] = f"Bearer {token}"
+
+    @task(10)
+    def browse_items(self):
+        params = dict(cursor=self.next_cursor) if self.next_cursor else {}
+        response = self.client.get("/items", params=params, name="/items")
+        if response.status_code == 200:
+            page = response.json()
+            self.next_cursor = page["next_cursor"]
+            if len(_item_ids) < 10_000:
+                _item_ids.extend(item["id"] for item in page["items"])
+
+    @task(8)
+    def read_item(self):
+        if _item_ids:
+            self.client.get(f"/items/{random.choice(_item_ids)}", name="/items/{item_id}")
+
+    @task(3)
+    def buy(self):
+        if _item_ids:
+            self.client.post(
+                "/buy",
+                json=dict(item_id=random.choice(_item_ids)),
+                headers={"Idempotency-Key": uuid.uuid4().hex},
+                name="/buy",
+            )
+
+    @task(1)
+    def top_up(self):
+        self.client.put(
+            "/wallets/add",
+            json=dict(balance=random.choice((100, 500, 1000))),
+            headers={"Idempotency-Key": uuid.uuid4().hex},
+            name="/wallets/add",
+        )
+
+    @task(2)
+    def read_history(self):
+        self.client.get(
+            "/transections/history", params=dict(limit=50), name="/transections/history"
+        )
+
+
+class NewCustomer(Shopper):
+    """A visitor who registers before shopping with an empty wallet."""
+
+    weight = 1
+
+    def on_start(self):
+        self.next_cursor = None
+        username = f"load-new-{uuid.uuid4().hex[:12]}"
+        self.client.post(
+            "/users/register_customer",
+            json=dict(
+                user_info=dict(
+                    email=f"{username}@load.local",
+                    username=username,
+                    first_name="Load",
+                    last_name="Visitor",
+                    password=PASSWORD,
+                ),
+                customer_info=dict(name=username),
+            ),
+            name="/users/register_customer",
+        )
+        self.login(username)
+        self.top_up()
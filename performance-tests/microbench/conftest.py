@@ -0,0 +1,16 @@
+import asyncio
+import os
+
+import pytest
+
+# Settings are read at import time; nothing here needs a real database
+os.environ.setdefault("SQLDB_URL", "sqlite+aiosqlite://")
+
+pytest.importorskip("pytest_benchmark")
+
+
+@pytest.fixture(name="loop", scope="module")
+def loop_fixture():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
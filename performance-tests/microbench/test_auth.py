@@ -0,0 +1,26 @@
+from digimon import deps, models, security
+
+
+CLAIMS = dict(sub="1", role="customer", customer_id=1, merchant_id=None, wallet_id=1)
+
+
+def test_create_access_token(benchmark):
+    token = benchmark(security.create_access_token, CLAIMS)
+    assert token.count(".") == 2
+
+
+def test_decode_token(benchmark):
+    token = security.create_access_token(CLAIMS)
+    payload = benchmark(deps.decode_token, token)
+    assert payload["sub"] == "1"
+
+
+def test_token_claims(benchmark):
+    # What deps.get_token_claims does for a token that carries its claims
+    token = security.create_access_token(CLAIMS)
+
+    def claims():
+        payload = deps.decode_token(token)
+        return models.TokenClaims(user_id=payload["sub"], **payload)
+
+    assert benchmark(claims).wallet_id == 1
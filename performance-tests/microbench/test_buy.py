@@ -0,0 +1,94 @@
+import pytest
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import StaticPool
+from sqlmodel import SQLModel
+
+from digimon import models
+from digimon.routers import buy_items
+
+
+async def seed(session_maker) -> models.TokenClaims:
+    async with session_maker() as session:
+        merchant_user = models.DBUser(
+            email="merchant@bench.local",
+            username="bench-merchant",
+            first_name="Bench",
+            last_name="Merchant",
+            password="-",
+            role=models.UserRole.merchant,
+        )
+        customer_user = models.DBUser(
+            email="customer@bench.local",
+            username="bench-customer",
+            first_name="Bench",
+            last_name="Customer",
+            password="-",
+            role=models.UserRole.customer,
+        )
+        session.add_all([merchant_user, customer_user])
+        await session.flush()
+
+        merchant = models.DBMerchant(name="bench", user_id=merchant_user.id)
+        customer = models.DBCustomer(name="bench", user_id=customer_user.id)
+        wallet = models.DBWallet(
+            balance=1e12, user_id=customer_user.id, role=models.UserRole.customer
+        )
+        session.add_all([
+            merchant,
+            customer,
+            wallet,
+            models.DBWallet(
+                balance=0.0, user_id=merchant_user.id, role=models.UserRole.merchant
+            ),
+        ])
+        await session.flush()
+
+        session.add(
+            models.DBItem(
+                id=1,
+                name="bench item",
+                price=1.0,
+                merchant_id=merchant.id,
+                user_id=merchant_user.id,
+                role=models.UserRole.merchant,
+            )
+        )
+        await session.commit()
+
+        return models.TokenClaims(
+            user_id=customer_user.id,
+            role=models.UserRole.customer,
+            customer_id=customer.id,
+            wallet_id=wallet.id,
+        )
+
+
+@pytest.fixture(name="shop", scope="module")
+def shop_fixture(loop):
+    # One in-memory database shared by every session of the engine
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+
+    async def create():
+        async with engine.begin() as conn:
+            await conn.run_sync(SQLModel.metadata.create_all)
+
+    loop.run_until_complete(create())
+    session_maker = models.sessionmaker(
+        engine, class_=models.AsyncSession, expire_on_commit=False
+    )
+    claims = loop.run_until_complete(seed(session_maker))
+    yield session_maker, claims
+    loop.run_until_complete(engine.dispose())
+
+
+def test_buy_item(benchmark, loop, shop):
+    session_maker, claims = shop
+    order = models.CreatedTransaction(item_id=1)
+
+    async def buy():
+        # A session per call, as models.get_session gives each request
+        async with session_maker() as session:
+            return await buy_items.buy_item(order, session, claims)
+
+    transaction = benchmark(lambda: loop.run_until_complete(buy()))
+    assert transaction.price == 1.0
@@ -0,0 +1,71 @@
+import datetime
+
+import pytest
+
+from digimon import models, responses
+
+
+def make_user() -> models.DBUser:
+    now = datetime.datetime(2024, 1, 1)
+    return models.DBUser(
+        id=1,
+        email="bench@example.com",
+        username="bench",
+        first_name="Bench",
+        last_name="User",
+        password="-",
+        role=models.UserRole.customer,
+        register_date=now,
+        updated_date=now,
+    )
+
+
+def make_item(item_id: int) -> models.DBItem:
+    return models.DBItem(
+        id=item_id,
+        name=f"item {item_id}",
+        description="a benchmark item",
+        price=9.99,
+        tax=0.07,
+        merchant_id=1,
+        user_id=2,
+        role=models.UserRole.merchant,
+    )
+
+
+def test_user_from_orm(benchmark):
+    dbuser = make_user()
+    assert benchmark(models.User.model_validate, dbuser).id == 1
+
+
+def test_item_from_orm(benchmark):
+    dbitem = make_item(1)
+    assert benchmark(models.Item.model_validate, dbitem).id == 1
+
+
+def test_wallet_from_orm(benchmark):
+    dbwallet = models.DBWallet(
+        id=1, balance=100.0, user_id=1, role=models.UserRole.customer
+    )
+    assert benchmark(models.Wallet.model_validate, dbwallet).id == 1
+
+
+@pytest.mark.parametrize("rows", [50, 1000])
+@pytest.mark.parametrize("mode", ["from_orm", "type_adapter"])
+def test_item_list(benchmark, rows, mode):
+    # The two ways responses.ModelResponder builds an items page
+    data = dict(
+        items=[make_item(i) for i in range(1, rows + 1)],
+        page=1,
+        page_count=1,
+        size_per_page=rows,
+    )
+    if mode == "from_orm":
+        validate = models.ItemList.from_orm
+    else:
+        adapter = responses.type_adapter(models.ItemList)
+
+        def validate(data):
+            return adapter.validate_python(data, from_attributes=True)
+
+    assert len(benchmark(validate, data).items) == rows
@@ -0,0 +1,71 @@
+"""Run the request hot-path microbenchmarks against a stored baseline.
+
+The suite in ``performance-tests/microbench`` uses pytest-benchmark, which
+is not a project dependency; install it with ``pip install pytest-benchmark``.
+Results are kept per machine and interpreter under
+``performance-tests/microbench/.benchmarks``. ``--save`` stores a run as the
+new baseline; otherwise the run is compared with the latest stored one and
+fails when any benchmark's ``--stat`` is more than ``--max-regression``
+percent slower (``MICROBENCH_MAX_REGRESSION``, default 10). The first run on
+a machine has nothing to compare with and is saved as the baseline. Compare
+runs on an otherwise idle machine; on shared VMs the larger benchmarks can
+vary by more than 10% on their own.
+
+    poetry run python performance-tests/run_microbench.py --save
+    poetry run python performance-tests/run_microbench.py --max-regression 15
+    poetry run python performance-tests/run_microbench.py -- -k item_list
+"""
+
+import argparse
+import os
+import pathlib
+import sys
+
+import pytest
+
+
+SUITE = pathlib.Path(__file__).parent / "microbench"
+STORAGE = SUITE / ".benchmarks"
+
+
+def main(args) -> int:
+    pytest_args = [
+        str(SUITE),
+        "-p", "no:cacheprovider",
+        f"--benchmark-storage=file://{STORAGE}",
+        "--benchmark-columns=min,median,mean,stddev,rounds",
+        "--benchmark-sort=name",
+        # Steadier numbers: warm up the interpreter caches, no collector pauses
+        "--benchmark-warmup=on",
+        "--benchmark-disable-gc",
+        "-W", "ignore::DeprecationWarning",
+    ]
+    if args.save or not any(STORAGE.glob("*/*.json")):
+        if not args.save:
+            print(f"No baseline in {STORAGE}; saving this run as the baseline")
+        pytest_args.append("--benchmark-save=baseline")
+    else:
+        pytest_args += [
+            "--benchmark-compare",
+            f"--benchmark-compare-fail={args.stat}:{args.max_regression:g}%",
+        ]
+    return pytest.main(pytest_args + args.pytest_args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--save", action="store_true", help="store this run as the baseline")
+    parser.add_argument(
+        "--max-regression",
+        type=float,
+        default=float(os.environ.get("MICROBENCH_MAX_REGRESSION", 10)),
+        help="percent slower than the baseline that fails the run",
+    )
+    parser.add_argument(
+        "--stat",
+        choices=["min", "median", "mean"],
+        default="min",
+        help="statistic compared with the baseline",
+    )
+    parser.add_argument("pytest_args", nargs="*", help="passed on to pytest after --")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,124 @@
+"""Seed the database the Locust suite in ``locustfile.py`` runs against.
+
+Creates ``--customers`` customers named ``load-customer-{i}`` and
+``--merchants`` merchants named ``load-merchant-{i}``, all with the password
+``load-password``, every customer wallet opened with ``--balance`` through
+the ledger, and ``--items`` items spread over the merchants. The target
+database is dropped and recreated.
+
+    poetry run python performance-tests/seed_load_test.py --customers 1000
+"""
+
+import argparse
+import asyncio
+import os
+
+from sqlmodel import insert, select
+
+from digimon import config, counters, ledger, models, security
+
+
+PASSWORD = "load-password"
+BATCH = 5_000
+
+
+async def insert_users(session, prefix: str, count: int, role, password: str) -> list[int]:
+    usernames = [f"{prefix}-{i}" for i in range(count)]
+    for start in range(0, count, BATCH):
+        await session.exec(
+            insert(models.DBUser),
+            params=[
+                dict(
+                    email=f"{username}@load.local",
+                    username=username,
+                    first_name="Load",
+                    last_name="Test",
+                    password=password,
+                    role=role,
+                )
+                for username in usernames[start : start + BATCH]
+            ],
+        )
+    result = await session.exec(
+        select(models.DBUser.username, models.DBUser.id).where(
+            models.DBUser.username.startswith(f"{prefix}-")
+        )
+    )
+    ids = dict(result.all())
+    return [ids[username] for username in usernames]
+
+
+async def seed(args):
+    password = await security.hash_password(PASSWORD)
+    async with models.session_factory() as session:
+        customer_ids = await insert_users(
+            session, "load-customer", args.customers, models.UserRole.customer, password
+        )
+        merchant_user_ids = await insert_users(
+            session, "load-merchant", args.merchants, models.UserRole.merchant, password
+        )
+
+        await session.exec(
+            insert(models.DBCustomer),
+            params=[dict(name=f"customer {i}", user_id=user_id) for i, user_id in enumerate(customer_ids)],
+        )
+        await session.exec(
+            insert(models.DBMerchant),
+            params=[dict(name=f"merchant {i}", user_id=user_id) for i, user_id in enumerate(merchant_user_ids)],
+        )
+        await session.exec(
+            insert(models.DBWallet),
+            params=[
+                dict(balance=args.balance, ledger_seq=1, user_id=user_id, role=models.UserRole.customer)
+                for user_id in customer_ids
+            ]
+            + [
+                dict(balance=0.0, user_id=user_id, role=models.UserRole.merchant)
+                for user_id in merchant_user_ids
+            ],
+        )
+
+        # Open the customer wallets through the ledger so statements add up
+        result = await session.exec(
+            select(models.DBWallet.id).where(models.DBWallet.role == models.UserRole.customer)
+        )
+        batch = ledger.LedgerBatch()
+        for wallet_id in result.all():
+            batch.post(wallet_id, 1, args.balance, [(args.balance, models.LedgerEntryKind.top_up, None)])
+        await batch.write(session)
+
+        merchant_ids = (await session.exec(select(models.DBMerchant.id))).all()
+        for start in range(0, args.items, BATCH):
+            rows = [
+                dict(
+                    name=f"load item {i}",
+                    description=f"item {i} seeded for load tests",
+                    price=float(i % 50 + 1),
+                    merchant_id=merchant_ids[i % len(merchant_ids)],
+                    user_id=merchant_user_ids[i % len(merchant_ids)],
+                    role=models.UserRole.merchant,
+                )
+                for i in range(start, min(start + BATCH, args.items))
+            ]
+            await session.exec(insert(models.DBItem), params=rows)
+        await counters.rebuild_item_counters(session)
+        await session.commit()
+
+
+async def run(args):
+    settings = config.Settings(SQLDB_URL=args.url)
+    models.init_db(settings)
+    await models.recreate_table()
+    await seed(args)
+    await models.close_session()
+    print(f"seeded {args.customers} customers, {args.merchants} merchants, {args.items} items")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default=os.environ.get("SQLDB_URL"))
+    parser.add_argument("--customers", type=int, default=1000)
+    parser.add_argument("--merchants", type=int, default=20)
+    parser.add_argument("--items", type=int, default=10_000)
+    parser.add_argument("--balance", type=float, default=1_000_000.0)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,49 @@
+"""Print a Locust summary written by ``locustfile.py --summary-file``.
+
+Given a second summary as ``--baseline``, every figure is followed by its
+change against it, so two releases can be compared endpoint by endpoint.
+
+    poetry run python performance-tests/summarize_load_test.py \\
+        test-data/load-baseline.json --baseline test-data/load-baseline-v1.json
+"""
+
+import argparse
+import json
+
+
+COLUMNS = ("requests", "failures", "rps", "p50", "p95", "p99")
+
+
+def change(value, before):
+    if before in (None, 0):
+        return ""
+    return f" ({(value - before) / before * 100:+.0f}%)"
+
+
+def main(args):
+    with open(args.summary) as file:
+        summary = json.load(file)
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+
+    print(f"host {summary['host']}, {summary['users']} users, run time {summary['run_time']}")
+    print(f"{'endpoint':<36}" + "".join(f"{column:>18}" for column in COLUMNS))
+
+    rows = list(summary["endpoints"].items()) + [("Aggregated", summary["total"])]
+    before_rows = dict(baseline.get("endpoints", {}), Aggregated=baseline.get("total"))
+    for name, row in rows:
+        before = before_rows.get(name) or {}
+        cells = "".join(
+            f"{str(row[column]) + change(row[column], before.get(column)):>18}"
+            for column in COLUMNS
+        )
+        print(f"{name:<36}{cells}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("summary")
+    parser.add_argument("--baseline")
+    main(parser.parse_args())
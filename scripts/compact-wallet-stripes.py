@@ -0,0 +1,13 @@
+import asyncio
+from digimon import models , config , stripes
+
+
+async def compact():
+    folded = await stripes.compact_all()
+    print(f"folded {folded} stripe credits")
+
+
+if __name__ == "__main__":
+    settings = config.get_settings()
+    models.init_db(settings)
+    asyncio.run(compact())
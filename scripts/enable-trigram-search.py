@@ -0,0 +1,16 @@
+import asyncio
+from digimon import models , config , search
+
+
+async def enable():
+    if await search.enable_trigram_search(models.engine):
+        print("pg_trgm and the item trigram indexes are installed")
+    else:
+        print("not PostgreSQL with pg_trgm; /items/search keeps the in-process index")
+    await models.close_session()
+
+
+if __name__ == "__main__":
+    settings = config.get_settings()
+    models.init_db(settings)
+    asyncio.run(enable())
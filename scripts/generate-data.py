@@ -0,0 +1,351 @@
+"""Fill the database with synthetic users, merchants, customers, wallets,
+items and transactions at a chosen scale.
+
+Rows are built in fixed chunks whose random generator is seeded from
+``--seed``, the table and the chunk number, and an item's merchant and price
+are a hash of its id, so the same arguments give the same rows whatever
+``--workers`` is. A process pool loads the chunks with asyncpg ``COPY`` on
+Postgres and batched multi-row ``INSERT``s elsewhere. Every user shares one
+bcrypt hash of ``--password``, computed up front with a seeded salt.
+Customer wallets are opened with a ledger top-up; the generated transactions
+are history only and do not move wallet balances. The tables are dropped and
+recreated.
+
+    poetry run python scripts/generate-data.py --scale medium --workers 8
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import datetime
+import random
+import time
+
+import bcrypt
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from digimon import config, counters, models, sales
+
+
+SCALES = dict(
+    tiny=dict(customers=1_000, merchants=20, items=2_000, transactions=20_000),
+    small=dict(customers=20_000, merchants=200, items=20_000, transactions=1_000_000),
+    medium=dict(customers=200_000, merchants=2_000, items=200_000, transactions=10_000_000),
+    large=dict(customers=2_000_000, merchants=20_000, items=2_000_000, transactions=50_000_000),
+)
+
+# Rows per generated chunk; part of the seed, so changing it changes the data
+CHUNK_ROWS = 50_000
+INSERT_BATCH = 5_000
+
+MASK64 = (1 << 64) - 1
+
+WORDS = (
+    "apple", "banana", "coffee", "rice", "mango", "noodle", "tea", "soap", "shirt",
+    "lamp", "chair", "pen", "book", "phone", "cable", "bag", "shoe", "cup", "towel",
+)
+
+
+def _hash(seed: int, salt: int, n: int) -> int:
+    # splitmix64 finalizer: cheap, well mixed and identical in every process
+    x = (seed * 0x9E3779B97F4A7C15 + salt * 0xBF58476D1CE4E5B9 + n) & MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & MASK64
+    return x ^ (x >> 31)
+
+
+def password_hash(password: str, seed: int, rounds: int) -> str:
+    """A bcrypt hash whose salt comes from ``seed``, so reruns match."""
+    rng = random.Random(f"{seed}:password")
+    alphabet = "./ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789"
+    # The last salt character carries only two bits
+    salt = "".join(rng.choice(alphabet) for _ in range(21)) + rng.choice(".Oeu")
+    return bcrypt.hashpw(
+        password.encode("utf-8"), f"$2b${rounds:02d}${salt}".encode()
+    ).decode("utf-8")
+
+
+def item_merchant(plan: dict, item_id: int) -> int:
+    return _hash(plan["seed"], 1, item_id) % plan["merchants"] + 1
+
+
+def item_price(plan: dict, item_id: int) -> float:
+    return (100 + _hash(plan["seed"], 2, item_id) % 9_900) / 100
+
+
+def _moment(plan: dict, fraction: float) -> datetime.datetime:
+    """A point ``fraction`` of the way through the generated period."""
+    return plan["until"] - plan["span"] * (1 - fraction)
+
+
+# Each generator yields tuples in the order of the column names above it;
+# columns left out are NULL or take their default
+USER_COLUMNS = (
+    "id", "email", "username", "first_name", "last_name", "password", "role",
+    "register_date", "updated_date",
+)
+
+
+def user_rows(plan, rng, start, stop):
+    customers = plan["customers"]
+    for user_id in range(start + 1, stop + 1):
+        kind = "customer" if user_id <= customers else "merchant"
+        registered = _moment(plan, rng.random() * 0.5)
+        yield (
+            user_id,
+            f"{kind}{user_id}@generated.local",
+            f"{kind}{user_id}",
+            rng.choice(WORDS).title(),
+            rng.choice(WORDS).title(),
+            plan["password_hash"],
+            kind,
+            registered,
+            registered,
+        )
+
+
+CUSTOMER_COLUMNS = ("id", "name", "user_id")
+
+
+def customer_rows(plan, rng, start, stop):
+    for customer_id in range(start + 1, stop + 1):
+        yield (customer_id, f"customer {customer_id}", customer_id)
+
+
+MERCHANT_COLUMNS = ("id", "name", "user_id")
+
+
+def merchant_rows(plan, rng, start, stop):
+    for merchant_id in range(start + 1, stop + 1):
+        yield (
+            merchant_id,
+            f"{rng.choice(WORDS)} shop {merchant_id}",
+            plan["customers"] + merchant_id,
+        )
+
+
+WALLET_COLUMNS = ("id", "user_id", "role", "balance", "ledger_seq", "stripes")
+
+
+def wallet_rows(plan, rng, start, stop):
+    for wallet_id in range(start + 1, stop + 1):
+        if wallet_id <= plan["customers"]:
+            yield (wallet_id, wallet_id, "customer", plan["balance"], 1, 0)
+        else:
+            yield (wallet_id, wallet_id, "merchant", 0.0, 0, 0)
+
+
+LEDGER_COLUMNS = ("wallet_id", "seq", "amount", "kind", "created_at")
+
+
+def ledger_rows(plan, rng, start, stop):
+    opened = _moment(plan, 0)
+    for wallet_id in range(start + 1, stop + 1):
+        yield (wallet_id, 1, plan["balance"], "top_up", opened)
+
+
+ITEM_COLUMNS = (
+    "id", "name", "description", "price", "tax", "merchant_id", "user_id", "role",
+)
+
+
+def item_rows(plan, rng, start, stop):
+    for item_id in range(start + 1, stop + 1):
+        merchant_id = item_merchant(plan, item_id)
+        yield (
+            item_id,
+            f"{rng.choice(WORDS)} {rng.choice(WORDS)} {item_id}",
+            f"{rng.choice(WORDS)} {rng.choice(WORDS)} {rng.choice(WORDS)}",
+            item_price(plan, item_id),
+            0.07 if rng.random() < 0.5 else None,
+            merchant_id,
+            plan["customers"] + merchant_id,
+            "merchant",
+        )
+
+
+TRANSACTION_COLUMNS = (
+    "id", "item_id", "price", "quantity", "merchant_id", "customer_id", "created_at",
+)
+
+
+def transaction_rows(plan, rng, start, stop):
+    total = plan["transactions"]
+    for transaction_id in range(start + 1, stop + 1):
+        item_id = rng.randrange(plan["items"]) + 1
+        quantity = 1 if rng.random() < 0.8 else rng.randint(2, 5)
+        # Later ids are later in time, as they are in production
+        jitter = rng.random() / total
+        yield (
+            transaction_id,
+            item_id,
+            item_price(plan, item_id) * quantity,
+            quantity,
+            item_merchant(plan, item_id),
+            rng.randrange(plan["customers"]) + 1,
+            _moment(plan, min((transaction_id - 1) / total + jitter, 1.0)),
+        )
+
+
+# Loaded in this order so foreign keys always point at loaded rows
+TABLES = (
+    ("users", models.DBUser, USER_COLUMNS,
+     lambda plan: plan["customers"] + plan["merchants"], user_rows),
+    ("customers", models.DBCustomer, CUSTOMER_COLUMNS,
+     lambda plan: plan["customers"], customer_rows),
+    ("merchants", models.DBMerchant, MERCHANT_COLUMNS,
+     lambda plan: plan["merchants"], merchant_rows),
+    ("wallets", models.DBWallet, WALLET_COLUMNS,
+     lambda plan: plan["customers"] + plan["merchants"], wallet_rows),
+    ("ledger", models.DBLedgerEntry, LEDGER_COLUMNS,
+     lambda plan: plan["customers"], ledger_rows),
+    ("items", models.DBItem, ITEM_COLUMNS,
+     lambda plan: plan["items"], item_rows),
+    ("transactions", models.DBTransection, TRANSACTION_COLUMNS,
+     lambda plan: plan["transactions"], transaction_rows),
+)
+ROW_FUNCTIONS = {name: (model, columns, rows) for name, model, columns, _, rows in TABLES}
+
+# Per worker process
+_loop = None
+_engine = None
+
+
+def _init_worker(url: str):
+    global _loop, _engine
+    _loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(_loop)
+    _engine = create_async_engine(url)
+
+
+async def _write(model, columns: tuple[str, ...], rows: list[tuple]):
+    table = model.__table__
+    if _engine.dialect.name == "postgresql":
+        async with _engine.connect() as conn:
+            raw = await conn.get_raw_connection()
+            await raw.driver_connection.copy_records_to_table(
+                table.name, records=rows, columns=list(columns)
+            )
+        return
+
+    async with _engine.begin() as conn:
+        for start in range(0, len(rows), INSERT_BATCH):
+            await conn.execute(
+                table.insert(),
+                [dict(zip(columns, row)) for row in rows[start : start + INSERT_BATCH]],
+            )
+
+
+def _load_chunk(name: str, chunk: int, count: int, plan: dict) -> int:
+    model, columns, row_function = ROW_FUNCTIONS[name]
+    rng = random.Random(f"{plan['seed']}:{name}:{chunk}")
+    start = chunk * CHUNK_ROWS
+    rows = list(row_function(plan, rng, start, min(start + CHUNK_ROWS, count)))
+    _loop.run_until_complete(_write(model, columns, rows))
+    return len(rows)
+
+
+async def _finish(url: str, skip_rollups: bool):
+    settings = config.Settings(SQLDB_URL=url)
+    models.init_db(settings)
+    async with models.session_factory() as session:
+        if session.bind.dialect.name == "postgresql":
+            # Rows were loaded with explicit ids; move the sequences past them
+            for model in (models.DBUser, models.DBCustomer, models.DBMerchant,
+                          models.DBWallet, models.DBItem, models.DBTransection):
+                table = model.__table__.name
+                await session.exec(text(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                    f"COALESCE((SELECT max(id) FROM {table}), 0) + 1, false)"
+                ))
+            await session.commit()
+
+        await counters.rebuild_item_counters(session)
+        if not skip_rollups:
+            await sales.rebuild_sales(session)
+    await models.close_session()
+
+
+async def _recreate(url: str):
+    models.init_db(config.Settings(SQLDB_URL=url))
+    await models.recreate_table()
+    await models.close_session()
+
+
+def main(args):
+    url = args.url or config.get_settings().SQLDB_URL
+    workers = args.workers
+    if make_url(url).get_backend_name() == "sqlite" and workers > 1:
+        # SQLite takes one writer at a time; more processes only contend
+        print("SQLite target: loading with one worker")
+        workers = 1
+
+    counts = dict(SCALES[args.scale])
+    for name in counts:
+        if getattr(args, name) is not None:
+            counts[name] = getattr(args, name)
+    until = args.until or datetime.datetime.combine(datetime.date.today(), datetime.time())
+    plan = dict(
+        counts,
+        seed=args.seed,
+        balance=args.balance,
+        until=until,
+        span=datetime.timedelta(days=args.days),
+        password_hash=password_hash(
+            args.password, args.seed, config.get_settings().BCRYPT_ROUNDS
+        ),
+    )
+    print(", ".join(f"{count:,} {name}" for name, count in counts.items()))
+
+    asyncio.run(_recreate(url))
+
+    started = time.perf_counter()
+    loaded = 0
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(url,)
+    ) as pool:
+        for name, _, _, count_function, _ in TABLES:
+            count = count_function(plan)
+            table_started = time.perf_counter()
+            chunks = [
+                pool.submit(_load_chunk, name, chunk, count, plan)
+                for chunk in range(-(-count // CHUNK_ROWS))
+            ]
+            rows = sum(future.result() for future in chunks)
+            elapsed = time.perf_counter() - table_started
+            loaded += rows
+            print(f"{name:<13}: {rows:>12,} rows in {elapsed:7.1f}s "
+                  f"({rows / max(elapsed, 1e-9):>10,.0f} rows/s)")
+
+    elapsed = time.perf_counter() - started
+    print(f"{'total':<13}: {loaded:>12,} rows in {elapsed:7.1f}s "
+          f"({loaded / elapsed:>10,.0f} rows/s) with {workers} workers")
+
+    finish_started = time.perf_counter()
+    asyncio.run(_finish(url, args.skip_rollups))
+    print(f"counters{'' if args.skip_rollups else ' and sales rollups'} rebuilt "
+          f"in {time.perf_counter() - finish_started:.1f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", help="defaults to SQLDB_URL")
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    parser.add_argument("--customers", type=int)
+    parser.add_argument("--merchants", type=int)
+    parser.add_argument("--items", type=int)
+    parser.add_argument("--transactions", type=int)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--days", type=int, default=365, help="history length")
+    parser.add_argument(
+        "--until",
+        type=datetime.datetime.fromisoformat,
+        help="end of the generated history; defaults to today at midnight",
+    )
+    parser.add_argument("--balance", type=float, default=10_000.0)
+    parser.add_argument("--password", default="password")
+    parser.add_argument("--skip-rollups", action="store_true")
+    main(parser.parse_args())
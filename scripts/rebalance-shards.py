@@ -0,0 +1,42 @@
+"""Move users' wallets, ledgers and transactions to the shards jump hash
+assigns them in a new layout, e.g. after adding shards to SQLDB_SHARD_URLS.
+
+Stop the application first. Moved rows are copied before they are deleted,
+so an interrupted run can be repeated.
+
+    poetry run python scripts/rebalance-shards.py --source db1 db2 --target db1 db2 db3
+"""
+
+import argparse
+import asyncio
+
+from digimon import config, models, sharding
+
+
+async def rebalance(args):
+    moves = await sharding.rebalance(
+        args.source or [settings.SQLDB_URL],
+        args.target or settings.SQLDB_SHARD_URLS,
+        dry_run=args.dry_run,
+        rebuild_rollups=not args.skip_rollups,
+    )
+    for (source, target), users in moves.items():
+        print(f"{source} -> {target}: {users:,} users")
+    if not moves:
+        print("nothing to move")
+    await models.close_session()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--source", nargs="+", help="current layout; defaults to SQLDB_URL")
+    parser.add_argument("--target", nargs="+", help="new layout; defaults to SQLDB_SHARD_URLS")
+    parser.add_argument("--dry-run", action="store_true", help="only count the moves")
+    parser.add_argument("--skip-rollups", action="store_true")
+    args = parser.parse_args()
+
+    settings = config.get_settings()
+    if not (args.target or settings.SQLDB_SHARD_URLS):
+        parser.error("no target layout: pass --target or set SQLDB_SHARD_URLS")
+    models.init_db(settings)
+    asyncio.run(rebalance(args))
@@ -0,0 +1,13 @@
+import asyncio
+from digimon import models , config , counters
+
+
+async def rebuild():
+    async with models.session_factory() as session:
+        await counters.rebuild_item_counters(session)
+
+
+if __name__ == "__main__":
+    settings = config.get_settings()
+    models.init_db(settings)
+    asyncio.run(rebuild())
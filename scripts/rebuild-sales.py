@@ -0,0 +1,21 @@
+import argparse
+import asyncio
+import datetime
+from digimon import models , config , sales
+
+
+async def rebuild(start, end):
+    for factory in models.data_session_factories():
+        async with factory() as session:
+            await sales.rebuild_sales(session, start, end)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recompute sales rollups from transactions")
+    parser.add_argument("--start", type=datetime.datetime.fromisoformat)
+    parser.add_argument("--end", type=datetime.datetime.fromisoformat)
+    args = parser.parse_args()
+
+    settings = config.get_settings()
+    models.init_db(settings)
+    asyncio.run(rebuild(args.start, args.end))
@@ -1 +1 @@
-poetry run locust -f performance-tests/test_index.py
\ No newline at end of file
+poetry run locust -f performance-tests/locustfile.py
\ No newline at end of file
@@ -0,0 +1,14 @@
+import asyncio
+from digimon import models , config , ledger
+
+
+async def snapshot():
+    for factory in models.data_session_factories():
+        async with factory() as session:
+            await ledger.snapshot_wallets(session)
+
+
+if __name__ == "__main__":
+    settings = config.get_settings()
+    models.init_db(settings)
+    asyncio.run(snapshot())
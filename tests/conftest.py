@@ -2,18 +2,19 @@ import sys
 import os
 
 import asyncio
-from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
-from fastapi.testclient import TestClient
 from httpx import AsyncClient, ASGITransport
 
 
-from typing import Any, Dict, Optional
 from pydantic_settings import SettingsConfigDict
 from sqlmodel import select
 
-from digimon import models, config, main, security
+# The app modules read their settings on import
+os.environ.setdefault("SQLDB_URL", "sqlite+aiosqlite:///test-data/test.db")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+from digimon import caching, deps, ledger, models, config, main, search, security
 import pytest
 import pytest_asyncio
 
@@ -31,45 +32,43 @@ SettingsTesting.model_config = SettingsConfigDict(
 )
 
 
-@pytest.fixture(name="app", scope="session")
-async def app_fixture():
+@pytest_asyncio.fixture(name="app")
+async def app_fixture() -> models.AsyncIterator[FastAPI]:
     settings = SettingsTesting()
     path = pathlib.Path("test-data")
     if not path.exists():
         path.mkdir()
 
-    app = main.create_app()
-
-    asyncio.run(models.create_all())
+    app = main.create_app(settings)
+    # Every test starts from empty tables and caches
+    await models.recreate_table()
+    await search.enable_trigram_search(models.engine)
+    for cache in caching.caches.values():
+        cache.clear()
 
     yield app
 
+    await models.close_session()
 
-@pytest.fixture(name="client", scope="session")
-def client_fixture(app: FastAPI) -> AsyncClient:
 
-    # client = TestClient(app)
-    # yield client
-    # app.dependency_overrides.clear()
-    return AsyncClient(transport=ASGITransport(app=app), base_url="http://localhost")
+@pytest_asyncio.fixture(name="client")
+async def client_fixture(app: FastAPI) -> models.AsyncIterator[AsyncClient]:
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://localhost"
+    ) as client:
+        yield client
 
 
-@pytest_asyncio.fixture(name="session", scope="session")
-async def get_session() -> models.AsyncIterator[models.AsyncSession]:
-    settings = SettingsTesting()
-    models.init_db(settings)
-
-    async_session = models.sessionmaker(
-        models.engine, class_=models.AsyncSession, expire_on_commit=False
-    )
-    async with async_session() as session:
+@pytest_asyncio.fixture(name="session")
+async def get_session(app: FastAPI) -> models.AsyncIterator[models.AsyncSession]:
+    async with models.session_factory() as session:
         yield session
 
 
-@pytest_asyncio.fixture(name="user1")
-async def example_user1(session: models.AsyncSession) -> models.DBUser:
+async def create_user(
+    session: models.AsyncSession, username: str, role: models.UserRole
+) -> models.DBUser:
     password = "123456"
-    username = "user1"
 
     query = await session.exec(
         select(models.DBUser).where(models.DBUser.username == username).limit(1)
@@ -81,10 +80,11 @@ async def example_user1(session: models.AsyncSession) -> models.DBUser:
     user = models.DBUser(
         username=username,
         password=password,
-        email="test@test.com",
+        email=f"{username}@test.com",
         first_name="Firstname",
         last_name="lastname",
-        last_login_date=datetime.datetime.now(tz=datetime.timezone.utc),
+        role=role,
+        last_login_date=datetime.datetime.now(),
     )
 
     await user.set_password(password)
@@ -94,16 +94,35 @@ async def example_user1(session: models.AsyncSession) -> models.DBUser:
     return user
 
 
-@pytest_asyncio.fixture(name="token_user1")
-async def oauth_token_user1(user1: models.DBUser) -> dict:
+async def create_wallet(
+    session: models.AsyncSession, user: models.DBUser, balance: float
+) -> models.DBWallet:
+    wallet = models.DBWallet(user_id=user.id, role=user.role, balance=balance)
+    session.add(wallet)
+    await session.commit()
+    # Open the ledger at the seeded balance, as scripts/snapshot-balances.py does
+    await ledger.snapshot_wallets(session)
+    await session.refresh(wallet)
+    return wallet
+
+
+async def create_token(
+    session: models.AsyncSession, user: models.DBUser, claims: bool = True
+) -> models.Token:
+    """Token as POST /token issues it; without ``claims`` only ``sub`` is signed."""
     settings = SettingsTesting()
     access_token_expires = datetime.timedelta(
         minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES
     )
-    user = user1
+    data = {"sub": user.id}
+    if claims:
+        token_claims = await deps.resolve_token_claims(session, user.id, user.role)
+        data.update(
+            token_claims.model_dump(exclude={"user_id"}, exclude_none=True, mode="json")
+        )
     return models.Token(
         access_token=security.create_access_token(
-            data={"sub": user.id},
+            data=data,
             expires_delta=access_token_expires,
         ),
         refresh_token=security.create_refresh_token(
@@ -119,6 +138,29 @@ async def oauth_token_user1(user1: models.DBUser) -> dict:
     )
 
 
+@pytest_asyncio.fixture(name="user1")
+async def example_user1(session: models.AsyncSession) -> models.DBUser:
+    return await create_user(session, "user1", models.UserRole.merchant)
+
+
+@pytest_asyncio.fixture(name="token_user1")
+async def oauth_token_user1(
+    session: models.AsyncSession,
+    user1: models.DBUser,
+    merchant_user1: models.DBMerchant,
+) -> models.Token:
+    return await create_token(session, user1, claims=False)
+
+
+@pytest_asyncio.fixture(name="token_admin")
+async def oauth_token_admin(
+    session: models.AsyncSession, monkeypatch: pytest.MonkeyPatch
+) -> models.Token:
+    user = await create_user(session, "admin", models.UserRole.customer)
+    monkeypatch.setattr(deps.settings, "ADMIN_USER_IDS", {user.id})
+    return await create_token(session, user)
+
+
 @pytest_asyncio.fixture(name="merchant_user1")
 async def example_merchant_user1(
     session: models.AsyncSession, user1: models.DBUser
@@ -126,7 +168,7 @@ async def example_merchant_user1(
     name = "merchant1"
 
     query = await session.exec(
-        models.select(models.DBMerchant)
+        select(models.DBMerchant)
         .where(models.DBMerchant.name == name, models.DBMerchant.user_id == user1.id)
         .limit(1)
     )
@@ -141,4 +183,100 @@ async def example_merchant_user1(
     session.add(merchant)
     await session.commit()
     await session.refresh(merchant)
-    return merchant
\ No newline at end of file
+    return merchant
+
+
+@pytest_asyncio.fixture(name="created_item")
+async def example_created_item(
+    session: models.AsyncSession,
+    user1: models.DBUser,
+    merchant_user1: models.DBMerchant,
+) -> models.DBItem:
+    item = models.DBItem(
+        name="Created Item",
+        description="Item description",
+        price=100.0,
+        merchant_id=merchant_user1.id,
+        user_id=user1.id,
+        role=user1.role,
+    )
+    session.add(item)
+    await session.commit()
+    await session.refresh(item)
+    return item
+
+
+@pytest_asyncio.fixture(name="merchant")
+async def example_merchant(session: models.AsyncSession) -> models.DBMerchant:
+    user = await create_user(session, "merchant", models.UserRole.merchant)
+    merchant = models.DBMerchant(name="shop", user_id=user.id)
+    session.add(merchant)
+    await session.commit()
+    await session.refresh(merchant)
+    return merchant
+
+
+@pytest_asyncio.fixture(name="merchant_wallet")
+async def example_merchant_wallet(
+    session: models.AsyncSession, merchant: models.DBMerchant
+) -> models.DBWallet:
+    user = await session.get(models.DBUser, merchant.user_id)
+    return await create_wallet(session, user, 0.0)
+
+
+@pytest_asyncio.fixture(name="token_merchant")
+async def oauth_token_merchant(
+    session: models.AsyncSession,
+    merchant: models.DBMerchant,
+    merchant_wallet: models.DBWallet,
+) -> models.Token:
+    user = await session.get(models.DBUser, merchant.user_id)
+    return await create_token(session, user)
+
+
+@pytest_asyncio.fixture(name="item")
+async def example_item(
+    session: models.AsyncSession,
+    merchant: models.DBMerchant,
+    merchant_wallet: models.DBWallet,
+) -> models.DBItem:
+    item = models.DBItem(
+        name="Apple",
+        description="A red apple",
+        price=10.0,
+        merchant_id=merchant.id,
+        user_id=merchant.user_id,
+        role=models.UserRole.merchant,
+    )
+    session.add(item)
+    await session.commit()
+    await session.refresh(item)
+    return item
+
+
+@pytest_asyncio.fixture(name="customer")
+async def example_customer(session: models.AsyncSession) -> models.DBCustomer:
+    user = await create_user(session, "customer", models.UserRole.customer)
+    customer = models.DBCustomer(name="buyer", user_id=user.id)
+    session.add(customer)
+    await session.commit()
+    await session.refresh(customer)
+    return customer
+
+
+@pytest_asyncio.fixture(name="customer_wallet")
+async def example_customer_wallet(
+    session: models.AsyncSession, customer: models.DBCustomer
+) -> models.DBWallet:
+    user = await session.get(models.DBUser, customer.user_id)
+    return await create_wallet(session, user, 1000.0)
+
+
+@pytest_asyncio.fixture(name="token_customer")
+async def oauth_token_customer(
+    session: models.AsyncSession,
+    customer: models.DBCustomer,
+    customer_wallet: models.DBWallet,
+) -> models.Token:
+    user = await session.get(models.DBUser, customer.user_id)
+    return await create_token(session, user)
@@ -0,0 +1,72 @@
+import pytest
+from httpx import AsyncClient
+
+from digimon import models
+
+
+def auth(token: models.Token) -> dict:
+    return {"Authorization": f"{token.token_type} {token.access_token}"}
+
+
+@pytest.mark.asyncio
+async def test_admin_routes_need_an_admin(client: AsyncClient, token_user1: models.Token):
+    response = await client.get("/admin/pool")
+    assert response.status_code == 401
+
+    response = await client.get("/admin/pool", headers=auth(token_user1))
+    assert response.status_code == 403
+
+    for method, path in (
+        ("GET", "/admin/slow-queries"),
+        ("DELETE", "/admin/slow-queries"),
+        ("PUT", "/admin/wallets/1/stripes?count=0"),
+    ):
+        response = await client.request(method, path)
+        assert response.status_code == 401
+        response = await client.request(method, path, headers=auth(token_user1))
+        assert response.status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_read_pool_stats(client: AsyncClient, token_admin: models.Token):
+    response = await client.get("/admin/pool", headers=auth(token_admin))
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["pool_class"]
+
+
+@pytest.mark.asyncio
+async def test_read_cache_stats(client: AsyncClient, token_admin: models.Token):
+    response = await client.get("/admin/caches", headers=auth(token_admin))
+
+    assert response.status_code == 200
+    names = [cache["name"] for cache in response.json()]
+    assert "users" in names
+
+
+@pytest.mark.asyncio
+async def test_read_metrics(client: AsyncClient):
+    await client.get("/items")
+    await client.get("/no-such-route")
+    response = await client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'http_responses_total{method="GET",route="/items",status="200"}' in response.text
+    assert 'route="<unmatched>",status="404"' in response.text
+
+
+@pytest.mark.asyncio
+async def test_read_slow_queries(client: AsyncClient, token_admin: models.Token):
+    response = await client.get(
+        "/admin/slow-queries", params={"explain": True}, headers=auth(token_admin)
+    )
+
+    assert response.status_code == 200
+    data = response.json()
+    assert "threshold_ms" in data
+    assert isinstance(data["queries"], list)
+
+    response = await client.delete("/admin/slow-queries", headers=auth(token_admin))
+    assert response.status_code == 200
@@ -0,0 +1,60 @@
+import time
+
+from pydantic import BaseModel
+
+from digimon import caching
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = caching.TTLCache("test-lru", maxsize=2, ttl=60)
+    cache.set(1, "a")
+    cache.set(2, "b")
+    cache.get(1)
+    cache.set(3, "c")
+
+    assert cache.get(2) is None
+    assert cache.get(1) == "a"
+    assert cache.get(3) == "c"
+    assert cache.hits == 3
+    assert cache.misses == 1
+
+
+def test_ttl_cache_expires_entries(monkeypatch):
+    cache = caching.TTLCache("test-ttl", maxsize=10, ttl=5)
+    now = time.monotonic()
+    monkeypatch.setattr(caching.time, "monotonic", lambda: now)
+    cache.set("key", "value")
+
+    monkeypatch.setattr(caching.time, "monotonic", lambda: now + 6)
+    assert cache.get("key") is None
+    assert len(cache) == 0
+
+
+def test_ttl_cache_invalidate():
+    cache = caching.TTLCache("test-invalidate", maxsize=10, ttl=60)
+    cache.set("key", "value")
+    cache.invalidate("key")
+
+    assert cache.get("key") is None
+
+
+
+class Sample(BaseModel):
+    b: int
+    a: str
+
+
+def test_cached_response_etag_depends_only_on_content():
+    first = caching.cached_response(Sample(b=1, a="x"))
+    assert first.body == b'{"a":"x","b":1}'
+    assert first == caching.cached_response(Sample(b=1, a="x"))
+    assert first.etag != caching.cached_response(Sample(b=2, a="x")).etag
+
+
+def test_etag_matches_lists_and_weak_tags():
+    etag = caching.cached_response(Sample(b=1, a="x")).etag
+    assert caching.etag_matches(etag, etag)
+    assert caching.etag_matches(f'"other", W/{etag}', etag)
+    assert caching.etag_matches("*", etag)
+    assert not caching.etag_matches('"other"', etag)
+    assert not caching.etag_matches(None, etag)
@@ -0,0 +1,141 @@
+import asyncio
+
+import pytest
+import pytest_asyncio
+from fastapi import HTTPException
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel
+
+from digimon import idempotency, models
+
+
+USER_ID = 1
+
+
+class Receipt(BaseModel):
+    number: int
+
+
+@pytest_asyncio.fixture
+async def session_factory(monkeypatch, tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/idempotency.db")
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    factory = models.sessionmaker(engine, class_=models.AsyncSession, expire_on_commit=False)
+    monkeypatch.setattr(models, "engine", engine)
+    monkeypatch.setattr(models, "session_factory", factory)
+    yield factory
+    await engine.dispose()
+
+
+class Counter:
+    """An operation that issues numbered receipts and counts its runs."""
+
+    def __init__(self, delay: float = 0.0, error: HTTPException | None = None):
+        self.runs = 0
+        self.delay = delay
+        self.error = error
+
+    async def __call__(self) -> Receipt:
+        self.runs += 1
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return Receipt(number=self.runs)
+
+
+async def run(factory, key, payload, operation):
+    hashed = idempotency.request_hash("POST", "/buy", payload)
+    async with factory() as session:
+        return await idempotency.run(session, USER_ID, key, hashed, operation)
+
+
+@pytest.mark.asyncio
+async def test_same_key_replays_the_stored_response(session_factory):
+    operation = Counter()
+
+    first = await run(session_factory, "key", {"item_id": 1}, operation)
+    second = await run(session_factory, "key", {"item_id": 1}, operation)
+
+    assert first == Receipt(number=1)
+    assert operation.runs == 1
+    assert second.headers["idempotent-replayed"] == "true"
+    assert Receipt.model_validate_json(second.body) == first
+
+    # Without a key nothing is stored
+    assert await run(session_factory, None, {"item_id": 1}, operation) == Receipt(number=2)
+
+
+@pytest.mark.asyncio
+async def test_same_key_with_another_body_is_rejected(session_factory):
+    operation = Counter()
+    await run(session_factory, "key", {"item_id": 1}, operation)
+
+    with pytest.raises(HTTPException) as error:
+        await run(session_factory, "key", {"item_id": 2}, operation)
+    assert error.value.status_code == 422
+    assert operation.runs == 1
+
+
+@pytest.mark.asyncio
+async def test_http_errors_are_replayed(session_factory):
+    operation = Counter(error=HTTPException(status_code=400, detail="Not enough balance."))
+
+    with pytest.raises(HTTPException):
+        await run(session_factory, "key", {"item_id": 1}, operation)
+    replay = await run(session_factory, "key", {"item_id": 1}, operation)
+
+    assert operation.runs == 1
+    assert replay.status_code == 400
+    assert replay.body == b'{"detail":"Not enough balance."}'
+
+
+@pytest.mark.asyncio
+async def test_concurrent_duplicates_coalesce(session_factory):
+    operation = Counter(delay=0.1)
+
+    responses = await asyncio.gather(
+        *[run(session_factory, "key", {"item_id": 1}, operation) for _ in range(5)]
+    )
+
+    assert operation.runs == 1
+    [first] = [response for response in responses if isinstance(response, Receipt)]
+    replays = [response for response in responses if not isinstance(response, Receipt)]
+    assert len(replays) == 4
+    for replay in replays:
+        assert Receipt.model_validate_json(replay.body) == first
+
+    # A concurrent duplicate with another body is rejected, not coalesced
+    operation = Counter(delay=0.1)
+    results = await asyncio.gather(
+        run(session_factory, "other", {"item_id": 1}, operation),
+        run(session_factory, "other", {"item_id": 2}, operation),
+        return_exceptions=True,
+    )
+    assert operation.runs == 1
+    assert results[0] == Receipt(number=1)
+    assert isinstance(results[1], HTTPException) and results[1].status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_waits_for_a_key_held_by_another_worker(session_factory):
+    hashed = idempotency.request_hash("POST", "/buy", {"item_id": 1})
+    async with session_factory() as session:
+        # As if another worker process had claimed the key
+        assert await idempotency._claim(session, USER_ID, "key", hashed)
+
+    operation = Counter()
+    waiting = asyncio.create_task(run(session_factory, "key", {"item_id": 1}, operation))
+    await asyncio.sleep(0.2)
+    assert not waiting.done()
+
+    async with session_factory() as session:
+        await idempotency._complete(
+            session, USER_ID, "key", (200, Receipt(number=7).model_dump_json().encode())
+        )
+        await session.commit()
+
+    replay = await asyncio.wait_for(waiting, 5)
+    assert operation.runs == 0
+    assert Receipt.model_validate_json(replay.body) == Receipt(number=7)
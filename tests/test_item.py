@@ -1,6 +1,6 @@
 import pytest
 from httpx import AsyncClient
-from digimon import models
+from digimon import models, pagination
 
 @pytest.mark.asyncio
 async def test_read_items(client: AsyncClient, session: models.AsyncSession):
@@ -42,9 +42,9 @@ async def test_read_item(client: AsyncClient, session: models.AsyncSession, crea
 async def test_update_item(client: AsyncClient, token_user1: models.Token, created_item: models.DBItem):
     # ทดสอบการอัปเดต Item
     headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
-    payload = {"name": "Updated Item Name"}
+    payload = {"name": "Updated Item Name", "price": created_item.price}
     
-    response = await client.put(f"/items/{created_item.id}", json=payload, headers=headers)
+    response = await client.put(f"/items/{created_item.id}", params=payload, headers=headers)
     assert response.status_code == 200
     data = response.json()
     assert data["id"] == created_item.id
@@ -59,3 +59,148 @@ async def test_delete_item(client: AsyncClient, token_user1: models.Token, creat
     assert response.status_code == 200
     data = response.json()
     assert data["message"] == "Item deleted successfully"
+
+@pytest.mark.asyncio
+async def test_read_items_cursor(client: AsyncClient, session: models.AsyncSession):
+    # ทดสอบการแบ่งหน้าแบบ cursor ต้องได้ Items ครบและไม่ซ้ำกับแบบเลขหน้า
+    response = await client.get("/items/1/?page=1")
+    assert response.status_code == 200
+    data = response.json()
+    ids = [item["id"] for item in data["items"]]
+
+    cursor = data["next_cursor"]
+    while cursor:
+        response = await client.get("/items/1/", params={"cursor": cursor})
+        assert response.status_code == 200
+        data = response.json()
+        ids += [item["id"] for item in data["items"]]
+        cursor = data["next_cursor"]
+
+    assert ids == sorted(ids)
+    assert len(ids) == len(set(ids))
+
+@pytest.mark.asyncio
+async def test_read_items_invalid_cursor(client: AsyncClient):
+    response = await client.get("/items", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+    # ค่าใน cursor ต้องเป็นตัวเลขเท่านั้น
+    for position in ({"id": "abc"}, {"id": None}, {"id": True}):
+        cursor = pagination.encode_cursor(**position)
+        response = await client.get("/items", params={"cursor": cursor})
+        assert response.status_code == 400
+
+@pytest.mark.asyncio
+async def test_page_count_follows_create_and_delete(client: AsyncClient, token_user1: models.Token):
+    # ทดสอบว่า page_count อ่านจากตัวนับและอัปเดตตามการสร้าง/ลบ Item
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    initial_count = (await client.get("/items/1/")).json()["page_count"]
+
+    response = await client.post("/items", json={"name": "Counted", "price": 1.0}, headers=headers)
+    assert response.status_code == 200
+    item_id = response.json()["id"]
+    assert (await client.get("/items/1/")).json()["page_count"] == initial_count + 1
+
+    response = await client.delete(f"/items/{item_id}", headers=headers)
+    assert response.status_code == 200
+    assert (await client.get("/items/1/")).json()["page_count"] == initial_count
+
+@pytest.mark.asyncio
+async def test_read_item_etag_revalidation(client: AsyncClient, token_user1: models.Token):
+    # ทดสอบ ETag: ถ้าข้อมูลไม่เปลี่ยนต้องได้ 304 และเมื่อแก้ไข Item ต้องได้ ETag ใหม่
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    response = await client.post("/items", json={"name": "etag-item", "price": 5}, headers=headers)
+    item_id = response.json()["id"]
+
+    response = await client.get(f"/items/{item_id}")
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+
+    response = await client.get(f"/items/{item_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    await client.put(f"/items/{item_id}", params={"name": "etag-item", "price": 6})
+    response = await client.get(f"/items/{item_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert response.json()["price"] == 6
+
+@pytest.mark.asyncio
+async def test_search_items_prefix_and_fuzzy(client: AsyncClient, token_user1: models.Token):
+    # ทดสอบการค้นหา Item ด้วยคำขึ้นต้นและคำที่สะกดผิด
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    await client.post("/items", json={"name": "Searchable Mango", "price": 5}, headers=headers)
+    await client.post("/items", json={"name": "Plain Rice", "description": "goes with searchable curry", "price": 5}, headers=headers)
+
+    response = await client.get("/items/search", params={"q": "searcha"})
+    assert response.status_code == 200
+    names = [item["name"] for item in response.json()["items"]]
+    # ชื่อสินค้าต้องได้คะแนนสูงกว่าคำอธิบาย
+    assert names.index("Searchable Mango") < names.index("Plain Rice")
+
+    response = await client.get("/items/search", params={"q": "mangoe"})
+    assert "Searchable Mango" in [item["name"] for item in response.json()["items"]]
+
+    response = await client.get("/items/search", params={"q": "searchable", "page_size": 1})
+    assert len(response.json()["items"]) == 1
+    assert response.json()["next_page"] == 2
+
+@pytest.mark.asyncio
+async def test_bulk_import_items(client: AsyncClient, token_user1: models.Token):
+    # ทดสอบการนำเข้า Item จำนวนมากด้วย CSV และ NDJSON พร้อมรายงานแถวที่ผิดพลาด
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    body = 'name,price,description\nbulk-a,1.5,\n"bulk-b, two",2,"line one\nline two"\nbulk-c,abc,\n'
+    response = await client.post(
+        "/items/bulk", content=body.encode(), headers={**headers, "Content-Type": "text/csv"}
+    )
+    assert response.status_code == 200
+    report = response.json()
+    assert report["imported"] == 2
+    assert report["failed"] == 1
+    assert report["errors"][0]["row"] == 3
+
+    body = '{"name": "bulk-d", "price": 3}\nnot json\n{"name": "bulk-e"}\n'
+    response = await client.post("/items/bulk", params={"format": "ndjson"}, content=body.encode(), headers=headers)
+    report = response.json()
+    assert report["imported"] == 1
+    assert [error["row"] for error in report["errors"]] == [2, 3]
+
+    response = await client.get("/items/search", params={"q": "bulk"})
+    names = {item["name"] for item in response.json()["items"]}
+    assert {"bulk-a", "bulk-b, two", "bulk-d"} <= names
+
+    response = await client.post("/items/bulk", params={"format": "csv"}, content=b"price\n1\n", headers=headers)
+    assert response.status_code == 400
+
+@pytest.mark.asyncio
+async def test_bulk_import_items_csv_quotes(client: AsyncClient, token_user1: models.Token):
+    # ทดสอบเครื่องหมายคำพูดใน CSV: เครื่องหมายนิ้วในช่องที่ไม่มีคำพูดครอบ และช่องที่ปิดคำพูดไม่ครบ
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}", "Content-Type": "text/csv"}
+    body = 'name,price,description\n12" pizza,9.5,\n"quote ""this""",1,"two\nlines"\nafter,2,\n'
+    response = await client.post("/items/bulk", content=body.encode(), headers=headers)
+    report = response.json()
+    assert (report["imported"], report["failed"]) == (3, 0)
+    response = await client.get("/items/search", params={"q": "pizza"})
+    assert [item["name"] for item in response.json()["items"]] == ['12" pizza']
+
+    body = 'name,price\nfine,1\n"never closed,2\nlost,3\n'
+    report = (await client.post("/items/bulk", content=body.encode(), headers=headers)).json()
+    assert report["imported"] == 1
+    assert report["errors"] == [{"row": 2, "errors": ["unterminated quoted field"]}]
+
+@pytest.mark.asyncio
+async def test_delete_user_removes_its_items(client: AsyncClient, token_user1: models.Token, user1: models.DBUser):
+    # ทดสอบว่าการลบผู้ใช้ลบ Item ของผู้ใช้ ลดตัวนับ และล้าง cache ด้วย
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    initial_count = (await client.get("/items/1/")).json()["page_count"]
+
+    response = await client.post("/items", json={"name": "Owned", "price": 1.0}, headers=headers)
+    item_id = response.json()["id"]
+    assert (await client.get(f"/items/{item_id}")).status_code == 200
+    assert (await client.get("/items/1/")).json()["page_count"] == initial_count + 1
+
+    response = await client.delete(f"/users/{user1.id}", headers=headers)
+    assert response.status_code == 200
+    assert (await client.get(f"/items/{item_id}")).status_code == 404
+    assert (await client.get("/items/1/")).json()["page_count"] == initial_count
@@ -2,6 +2,7 @@ from httpx import AsyncClient
 from digimon import models
 import pytest
 
+@pytest.mark.skip(reason="POST /register_merchant became the public /users/register_merchant")
 @pytest.mark.asyncio
 async def test_no_permission_create_merchants(
     client: AsyncClient, user1: models.DBUser
@@ -16,7 +17,18 @@ async def test_no_permission_create_merchants(
 async def test_create_merchants(client: AsyncClient, token_user1: models.Token):
     headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
     payload = {"name": "merchants",}
-    response = await client.post("/register_merchant", json=payload, headers=headers)
+    user_info = {
+        "email": "merchants@test.com",
+        "username": "merchants",
+        "first_name": "Firstname",
+        "last_name": "Lastname",
+        "password": "123456",
+    }
+    response = await client.post(
+        "/users/register_merchant",
+        json={"user_info": user_info, "merchant_info": payload},
+        headers=headers,
+    )
 
     data = response.json()
 
@@ -26,7 +38,7 @@ async def test_create_merchants(client: AsyncClient, token_user1: models.Token):
 
 @pytest.mark.asyncio
 async def test_merchants(client: AsyncClient, merchant_user1: models.DBMerchant):
-    response = await client.get("/register_merchant")
+    response = await client.get("/merchants")
 
     data = response.json()
     assert response.status_code == 200
@@ -38,4 +50,36 @@ async def test_merchants(client: AsyncClient, merchant_user1: models.DBMerchant)
             check_merchant = merchant
             break
 
-    assert check_merchant["name"] == merchant_user1.name
\ No newline at end of file
+    assert check_merchant["name"] == merchant_user1.name
+
+@pytest.mark.asyncio
+async def test_merchant_sales_rollup(
+    client: AsyncClient,
+    token_customer: models.Token,
+    token_merchant: models.Token,
+    item: models.DBItem,
+    customer_wallet: models.DBWallet
+):
+    # ยอดขายรายวันของร้านต้องเพิ่มขึ้นตามการซื้อ โดยอ่านจากตาราง rollup
+    customer_headers = {"Authorization": f"{token_customer.token_type} {token_customer.access_token}"}
+    merchant_headers = {"Authorization": f"{token_merchant.token_type} {token_merchant.access_token}"}
+
+    response = await client.get(f"/merchants/{item.merchant_id}/sales", headers=merchant_headers)
+    assert response.status_code == 200
+    before = response.json()["total"]
+
+    payload = {"items": [{"item_id": item.id, "quantity": 2}]}
+    response = await client.post("/buy/cart", json=payload, headers=customer_headers)
+    assert response.status_code == 200
+
+    response = await client.get(f"/merchants/{item.merchant_id}/sales", headers=merchant_headers)
+    after = response.json()["total"]
+    assert after["revenue"] == before["revenue"] + item.price * 2
+    assert after["orders"] == before["orders"] + 1
+    assert after["quantity"] == before["quantity"] + 2
+
+    response = await client.get(f"/merchants/{item.merchant_id}/sales/items", headers=merchant_headers)
+    assert item.id in [row["item_id"] for row in response.json()["items"]]
+
+    response = await client.get(f"/merchants/{item.merchant_id}/sales", headers=customer_headers)
+    assert response.status_code == 403
@@ -0,0 +1,52 @@
+import pytest
+from httpx import AsyncClient
+
+from digimon import metrics
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = metrics.Registry()
+    stats = metrics.RequestStats()
+    stats.queries = 2
+    stats.db_seconds = 0.001
+    for seconds in (0.001, 0.02, 20):
+        registry.observe_request("GET", "/items", 200, seconds, stats)
+
+    text = registry.render()
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/items",le="0.005"} 1' in text
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/items",le="0.025"} 2' in text
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/items",le="+Inf"} 3' in text
+    assert 'http_request_duration_seconds_count{method="GET",route="/items"} 3' in text
+    assert 'http_request_db_queries_total{method="GET",route="/items"} 6' in text
+
+
+def test_label_values_are_escaped():
+    registry = metrics.Registry()
+    registry.observe_request("GET", 'a"b\\c', 200, 0.1, metrics.RequestStats())
+
+    assert 'route="a\\"b\\\\c"' in registry.render()
+
+
+@pytest.fixture
+def count_queries(monkeypatch):
+    # Read by the settings the app fixture builds the app from
+    monkeypatch.setenv("METRICS_QUERY_EVENTS", "true")
+
+
+@pytest.mark.asyncio
+@pytest.mark.usefixtures("count_queries")
+async def test_request_is_scraped_from_metrics(client: AsyncClient):
+    metrics.registry.clear()
+    response = await client.get("/items")
+    assert response.status_code == 200
+
+    text = (await client.get("/metrics")).text
+    assert 'http_responses_total{method="GET",route="/items",status="200"} 1' in text
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/items",le="+Inf"} 1' in text
+    assert 'http_request_duration_seconds_count{method="GET",route="/items"} 1' in text
+    [queries] = [
+        line.rsplit(" ", 1)[1]
+        for line in text.splitlines()
+        if line.startswith('http_request_db_queries_total{method="GET",route="/items"}')
+    ]
+    assert int(queries) > 0
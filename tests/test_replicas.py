@@ -0,0 +1,122 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import FastAPI, HTTPException
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy.ext.asyncio import create_async_engine
+from starlette.requests import Request
+
+from digimon import models, replicas
+
+
+def make_replica(url: str) -> replicas.Replica:
+    return replicas.Replica(url, create_async_engine(url))
+
+
+def make_request(cookie: str) -> Request:
+    return Request(dict(type="http", headers=[(b"cookie", cookie.encode())]))
+
+
+def test_candidates_rotate_over_healthy_replicas():
+    first, second, third = (
+        make_replica(f"sqlite+aiosqlite:///replica-{i}.db") for i in range(3)
+    )
+    replica_set = replicas.ReplicaSet([first, second, third])
+    assert replica_set.candidates() == [first, second, third]
+    assert replica_set.candidates() == [second, third, first]
+
+    replica_set.mark_unhealthy(second, "down")
+    assert replica_set.candidates() == [first, third]
+    assert replica_set.candidates() == [third, first]
+
+
+@pytest.mark.asyncio
+async def test_read_session_falls_back_to_primary(monkeypatch, tmp_path):
+    # SQLite cannot create a file in a missing directory
+    broken = make_replica(f"sqlite+aiosqlite:///{tmp_path}/missing/replica.db")
+    monkeypatch.setattr(replicas, "replica_set", replicas.ReplicaSet([broken]))
+    primary = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/primary.db")
+    monkeypatch.setattr(
+        models,
+        "session_factory",
+        models.sessionmaker(primary, class_=models.AsyncSession, expire_on_commit=False),
+    )
+
+    async with replicas.read_session() as session:
+        assert session.bind is primary
+    assert not broken.healthy
+
+    await replicas.replica_set.check_all()
+    assert not broken.healthy
+    await primary.dispose()
+
+
+@pytest.mark.asyncio
+async def test_health_checks_treat_unknown_lag_as_unhealthy(monkeypatch):
+    replica = make_replica("sqlite+aiosqlite:///replica.db")
+    replica_set = replicas.ReplicaSet([replica])
+    lags = iter([None, 0.5])
+
+    async def lag(replica):
+        return next(lags)
+
+    monkeypatch.setattr(replica_set, "_lag", lag)
+    await replica_set.check(replica)
+    assert (replica.healthy, replica.lag_seconds) == (False, None)
+    await replica_set.check(replica)
+    assert (replica.healthy, replica.lag_seconds) == (True, 0.5)
+
+
+@pytest.mark.asyncio
+async def test_health_checks_survive_unexpected_errors(monkeypatch):
+    replica_set = replicas.ReplicaSet([])
+    checks = 0
+
+    async def check_all():
+        nonlocal checks
+        checks += 1
+        if checks == 1:
+            raise TypeError("unexpected")
+        if checks == 3:
+            raise asyncio.CancelledError
+
+    monkeypatch.setattr(replica_set, "check_all", check_all)
+    monkeypatch.setattr(replicas.settings, "REPLICA_HEALTH_CHECK_SECONDS", 0)
+    with pytest.raises(asyncio.CancelledError):
+        await replica_set.run_health_checks()
+    assert checks == 3
+
+
+def test_pinned_to_primary_until_the_cookie_expires():
+    assert replicas.pinned_to_primary(make_request(f"primary_until={time.time() + 5}"))
+    assert not replicas.pinned_to_primary(make_request(f"primary_until={time.time() - 1}"))
+    assert not replicas.pinned_to_primary(make_request("primary_until=soon"))
+    assert not replicas.pinned_to_primary(make_request(""))
+
+
+@pytest.mark.asyncio
+async def test_successful_writes_pin_reads_to_the_primary():
+    app = FastAPI()
+
+    @app.get("/thing")
+    async def read_thing() -> dict:
+        return dict()
+
+    @app.post("/thing")
+    async def write_thing(fail: bool = False) -> dict:
+        if fail:
+            raise HTTPException(status_code=400)
+        return dict()
+
+    app.add_middleware(replicas.ReadYourWritesMiddleware, seconds=5)
+    client = AsyncClient(transport=ASGITransport(app=app), base_url="http://localhost")
+
+    response = await client.get("/thing")
+    assert replicas.PIN_COOKIE not in response.cookies
+    response = await client.post("/thing", params=dict(fail=True))
+    assert replicas.PIN_COOKIE not in response.cookies
+
+    response = await client.post("/thing")
+    until = float(response.cookies[replicas.PIN_COOKIE])
+    assert time.time() < until <= time.time() + 5
@@ -0,0 +1,86 @@
+import datetime
+import json
+
+import pytest
+from fastapi import FastAPI
+from httpx import AsyncClient, ASGITransport
+
+from digimon import models, responses
+from digimon.models.transactions import TransactionList
+from digimon.models.wallets import WalletList
+
+
+PRICES = (0.1 + 0.2, 1e-7, 123456789.125, 1e16, 10.0)
+
+
+def transactions():
+    created_at = datetime.datetime(2024, 2, 29, 23, 59, 59, 123456)
+    return [
+        models.DBTransection(
+            id=index,
+            item_id=7,
+            merchant_id=3,
+            customer_id=4,
+            price=price,
+            quantity=index,
+            description="ชา \"เย็น\"" if index % 2 else None,
+            created_at=created_at + datetime.timedelta(seconds=index),
+        )
+        for index, price in enumerate(PRICES, 1)
+    ]
+
+
+def wallets():
+    roles = (models.UserRole.customer, models.UserRole.merchant)
+    return [
+        models.DBWallet(id=index, balance=balance, user_id=index, role=roles[index % 2])
+        for index, balance in enumerate(PRICES, 1)
+    ]
+
+
+def spelled_alike(body: bytes) -> bytes:
+    # The stdlib writes 1e-07 and 1e+16 where pydantic-core writes 1e-7 and
+    # 1e16; both read back as the same float
+    return body.replace(b"e-0", b"e-").replace(b"e+", b"e")
+
+
+def create_app(fast: bool) -> FastAPI:
+    transaction_responder = responses.ModelResponder("transactions")
+    transaction_responder.fast = fast
+    wallet_responder = responses.ModelResponder("wallets")
+    wallet_responder.fast = fast
+    app = FastAPI()
+
+    @app.get("/transactions")
+    def read_transactions() -> TransactionList:
+        return transaction_responder.response(
+            TransactionList,
+            dict(transactions=transactions(), page=1, page_size=5, size_per_page=50),
+        )
+
+    @app.get("/wallets")
+    def read_wallets() -> WalletList:
+        return wallet_responder.response(
+            WalletList, dict(wallets=wallets(), page=0, page_size=0, size_per_page=0)
+        )
+
+    return app
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("path", ["/transactions", "/wallets"])
+async def test_fast_and_standard_modes_write_the_same_json(path):
+    bodies = []
+    for fast in (False, True):
+        async with AsyncClient(
+            transport=ASGITransport(app=create_app(fast)), base_url="http://localhost"
+        ) as client:
+            response = await client.get(path)
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/json"
+        bodies.append(response.content)
+
+    standard, fast = bodies
+    assert json.loads(fast) == json.loads(standard)
+    # Byte for byte too, keys and datetimes included, but for exponents
+    assert spelled_alike(fast) == spelled_alike(standard)
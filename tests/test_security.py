@@ -0,0 +1,59 @@
+import bcrypt
+import pytest
+
+from digimon import security
+
+
+@pytest.mark.asyncio
+async def test_hash_and_verify_password():
+    hashed = await security.hash_password("password")
+
+    assert await security.verify_password("password", hashed)
+    assert not await security.verify_password("wrong", hashed)
+
+
+def test_password_needs_rehash():
+    rounds = security.settings.BCRYPT_ROUNDS
+    current = bcrypt.hashpw(b"password", bcrypt.gensalt(rounds=rounds)).decode()
+    outdated = bcrypt.hashpw(b"password", bcrypt.gensalt(rounds=rounds + 1)).decode()
+
+    assert not security.password_needs_rehash(current)
+    assert security.password_needs_rehash(outdated)
+    assert security.password_needs_rehash("plain-text")
+
+
+@pytest.mark.asyncio
+async def test_token_claims_of_a_cached_user_without_database():
+    from digimon import deps, models
+
+    deps.user_cache.set(
+        1,
+        models.User(
+            id=1, role=models.UserRole.customer, email="a@b.c",
+            username="a", first_name="A", last_name="B",
+        ),
+    )
+    token = security.create_access_token(
+        data={"sub": 1, "role": "customer", "customer_id": 2, "wallet_id": 3}
+    )
+
+    claims = await deps.get_token_claims(token, session=None)
+    deps.user_cache.invalidate(1)
+
+    assert claims == models.TokenClaims(
+        user_id=1, role=models.UserRole.customer, customer_id=2, wallet_id=3
+    )
+
+
+@pytest.mark.asyncio
+async def test_token_of_a_deleted_user_is_rejected(client, token_customer):
+    headers = {"Authorization": f"{token_customer.token_type} {token_customer.access_token}"}
+    response = await client.get("/transections/history", headers=headers)
+    assert response.status_code == 200
+
+    user_id = (await client.get("/users/me", headers=headers)).json()["id"]
+    response = await client.delete(f"/users/{user_id}", headers=headers)
+    assert response.status_code == 200
+
+    response = await client.get("/transections/history", headers=headers)
+    assert response.status_code == 401
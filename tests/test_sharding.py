@@ -0,0 +1,286 @@
+import asyncio
+import collections
+import json
+
+import pytest
+import pytest_asyncio
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel, func, select, update
+
+from digimon import models, purchases, sharding
+from digimon.routers import transactions
+
+
+MERCHANT_USER_ID = 3
+CUSTOMER_USER_ID = 2
+
+
+def shard_url(tmp_path, index: int) -> str:
+    return f"sqlite+aiosqlite:///{tmp_path}/shard-{index}.db"
+
+
+async def use_shards(monkeypatch, tmp_path, count: int):
+    primary = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/primary.db")
+    shards = [create_async_engine(shard_url(tmp_path, i)) for i in range(count)]
+    async with primary.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    for shard in shards:
+        async with shard.begin() as conn:
+            await conn.run_sync(models.create_shard_tables)
+
+    def factory(engine):
+        return models.sessionmaker(engine, class_=models.AsyncSession, expire_on_commit=False)
+
+    monkeypatch.setattr(models, "engine", primary)
+    monkeypatch.setattr(models, "session_factory", factory(primary))
+    monkeypatch.setattr(models, "shard_engines", shards)
+    monkeypatch.setattr(models, "shard_session_factories", [factory(s) for s in shards])
+    monkeypatch.setattr(sharding, "id_allocator", sharding.IdAllocator(10))
+    return [primary] + shards
+
+
+@pytest_asyncio.fixture
+async def two_shards(monkeypatch, tmp_path):
+    engines = await use_shards(monkeypatch, tmp_path, 2)
+    # The purchases below cross shards
+    assert models.shard_index(MERCHANT_USER_ID) != models.shard_index(CUSTOMER_USER_ID)
+
+    async with models.session_factory() as session:
+        session.add(
+            models.DBItem(
+                id=1, name="apple", price=10.0, merchant_id=1,
+                user_id=MERCHANT_USER_ID, role=models.UserRole.merchant,
+            )
+        )
+        await session.commit()
+
+    yield
+    for engine in engines:
+        await engine.dispose()
+
+
+async def open_wallet(user_id: int, role: models.UserRole, balance: float = 0.0) -> int:
+    [wallet_id] = await sharding.new_ids(models.DBWallet, 1)
+    async with models.shard_session(user_id) as session:
+        session.add(
+            models.DBWallet(
+                id=wallet_id, user_id=user_id, role=role, balance=balance,
+                ledger_seq=1 if balance else 0,
+            )
+        )
+        if balance:
+            session.add(
+                models.DBLedgerEntry(
+                    wallet_id=wallet_id, seq=1, amount=balance,
+                    kind=models.LedgerEntryKind.top_up,
+                )
+            )
+        await session.commit()
+    return wallet_id
+
+
+async def buy_from_other_shard(quantity: int = 2) -> list[int]:
+    """Buy and commit without completing the transfers; returns their ids."""
+    customer_wallet_id = await open_wallet(
+        CUSTOMER_USER_ID, models.UserRole.customer, 100.0
+    )
+    claims = models.TokenClaims(
+        user_id=CUSTOMER_USER_ID,
+        role=models.UserRole.customer,
+        customer_id=1,
+        wallet_id=customer_wallet_id,
+    )
+    async with models.shard_session(CUSTOMER_USER_ID) as session:
+        await purchases.checkout_cart(
+            session, [models.CartLine(item_id=1, quantity=quantity)], claims
+        )
+        await session.commit()
+        return session.info.pop(purchases.PENDING_TRANSFERS)
+
+
+async def wallet_and_ledger(user_id: int) -> tuple[float, float]:
+    async with models.shard_session(user_id) as session:
+        wallet = (
+            await session.exec(select(models.DBWallet).where(models.DBWallet.user_id == user_id))
+        ).one()
+        entries = (
+            await session.exec(
+                select(func.sum(models.DBLedgerEntry.amount)).where(
+                    models.DBLedgerEntry.wallet_id == wallet.id
+                )
+            )
+        ).one()
+    return wallet.balance, entries
+
+
+async def transfer_status(transfer_id: int) -> models.ShardTransferStatus:
+    async with models.shard_session(CUSTOMER_USER_ID) as session:
+        return (await session.get(models.DBShardTransfer, transfer_id)).status
+
+
+def test_jump_hash_only_moves_keys_to_the_new_shard():
+    before = [models.jump_hash(key, 3) for key in range(1, 30_001)]
+    after = [models.jump_hash(key, 4) for key in range(1, 30_001)]
+
+    moved = [new for old, new in zip(before, after) if old != new]
+    assert set(moved) == {3}
+    for count in collections.Counter(after).values():
+        assert abs(count - 7_500) < 500
+
+
+@pytest.mark.asyncio
+async def test_cross_shard_purchase_credits_the_merchant_once(two_shards):
+    await open_wallet(MERCHANT_USER_ID, models.UserRole.merchant)
+    [transfer_id] = await buy_from_other_shard()
+
+    # Debited at once, credited when the transfer completes
+    assert await wallet_and_ledger(CUSTOMER_USER_ID) == (80.0, 80.0)
+    assert await wallet_and_ledger(MERCHANT_USER_ID) == (0.0, None)
+
+    async with models.shard_session(CUSTOMER_USER_ID) as session:
+        assert (
+            await purchases.complete_transfer(session, transfer_id)
+            == models.ShardTransferStatus.completed
+        )
+        # As if the worker died before marking the transfer completed
+        await session.exec(
+            update(models.DBShardTransfer).values(
+                status=models.ShardTransferStatus.pending
+            )
+        )
+        await session.commit()
+        assert (
+            await purchases.complete_transfer(session, transfer_id)
+            == models.ShardTransferStatus.completed
+        )
+
+    assert await wallet_and_ledger(MERCHANT_USER_ID) == (20.0, 20.0)
+    assert await transfer_status(transfer_id) == models.ShardTransferStatus.completed
+
+
+@pytest.mark.asyncio
+async def test_cross_shard_purchase_is_refunded_without_a_merchant_wallet(two_shards):
+    [transfer_id] = await buy_from_other_shard()
+
+    async with models.shard_session(CUSTOMER_USER_ID) as session:
+        session.info[purchases.PENDING_TRANSFERS] = [transfer_id]
+        await purchases.complete_transfers(session)
+
+    assert await transfer_status(transfer_id) == models.ShardTransferStatus.refunded
+    assert await wallet_and_ledger(CUSTOMER_USER_ID) == (100.0, 100.0)
+
+
+@pytest.mark.asyncio
+async def test_pending_transfers_are_retried(two_shards):
+    await open_wallet(MERCHANT_USER_ID, models.UserRole.merchant)
+    [transfer_id] = await buy_from_other_shard(quantity=3)
+
+    assert await purchases.retry_transfers(older_than=0) == 1
+    assert await purchases.retry_transfers(older_than=0) == 0
+    assert await transfer_status(transfer_id) == models.ShardTransferStatus.completed
+    assert await wallet_and_ledger(MERCHANT_USER_ID) == (30.0, 30.0)
+
+
+@pytest.mark.asyncio
+async def test_transfer_retries_survive_unexpected_errors(monkeypatch):
+    retries = 0
+
+    async def retry_transfers():
+        nonlocal retries
+        retries += 1
+        if retries == 1:
+            raise TypeError("unexpected")
+        if retries == 3:
+            raise asyncio.CancelledError
+
+    monkeypatch.setattr(purchases, "retry_transfers", retry_transfers)
+    monkeypatch.setattr(purchases.settings, "SHARD_TRANSFER_RETRY_SECONDS", 0)
+    with pytest.raises(asyncio.CancelledError):
+        await purchases.run_transfer_retries()
+    assert retries == 3
+
+
+@pytest.mark.asyncio
+async def test_rebalance_moves_users_to_their_new_shard(monkeypatch, tmp_path):
+    engines = await use_shards(monkeypatch, tmp_path, 2)
+    user_ids = range(1, 41)
+    async with models.session_factory() as session:
+        session.add_all(
+            models.DBCustomer(id=user_id, user_id=user_id, name=f"c{user_id}")
+            for user_id in user_ids
+        )
+        await session.commit()
+    for user_id in user_ids:
+        await open_wallet(user_id, models.UserRole.customer, 10.0)
+        async with models.shard_session(user_id) as session:
+            [transaction_id] = await sharding.new_ids(models.DBTransection, 1)
+            session.add(
+                models.DBTransection(
+                    id=transaction_id, item_id=1, price=1.0, quantity=1,
+                    merchant_id=1, customer_id=user_id,
+                )
+            )
+            await session.commit()
+
+    sources = [shard_url(tmp_path, i) for i in range(2)]
+    targets = sources + [shard_url(tmp_path, 2)]
+    moves = await sharding.rebalance(sources, targets)
+
+    # Only users whose shard is the new one move
+    assert {target for _, target in moves} == {targets[2]}
+    assert sum(moves.values()) == sum(
+        1 for user_id in user_ids if models.jump_hash(user_id, 3) == 2
+    )
+
+    for index, url in enumerate(targets):
+        engine = create_async_engine(url)
+        async with models.AsyncSession(engine) as session:
+            wallets = (await session.exec(select(models.DBWallet.user_id))).all()
+            customers = (await session.exec(select(models.DBTransection.customer_id))).all()
+            orders = (await session.exec(select(func.sum(models.DBMerchantSales.orders)))).one()
+        await engine.dispose()
+        assert sorted(wallets) == sorted(customers)
+        assert all(models.jump_hash(user_id, 3) == index for user_id in wallets)
+        # Rollups were rebuilt from the transactions on each shard
+        assert (orders or 0) == len(customers) * len(models.SalesGranularity)
+
+    async with models.session_factory() as session:
+        block = await session.get(models.DBIdBlock, models.DBWallet.__table__.name)
+        assert block.next_id > 40
+
+    for engine in engines:
+        await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_merchant_export_merges_shards_in_id_order(two_shards, monkeypatch):
+    monkeypatch.setattr(transactions.settings, "EXPORT_BATCH_SIZE", 2)
+    # Interleaved ids, as allocated to purchases landing on either shard
+    for index, factory in enumerate(models.shard_session_factories):
+        async with factory() as session:
+            for transaction_id in range(index + 1, 12, 2):
+                session.add(
+                    models.DBTransection(
+                        id=transaction_id, item_id=1, price=10.0,
+                        merchant_id=1, customer_id=1,
+                    )
+                )
+            await session.commit()
+
+    claims = models.TokenClaims(
+        user_id=MERCHANT_USER_ID, role=models.UserRole.merchant, merchant_id=1
+    )
+    statement = (
+        select(*transactions.EXPORT_COLUMNS)
+        .where(models.DBTransection.merchant_id == 1)
+        .order_by(models.DBTransection.id)
+    )
+    body = "".join(
+        [
+            chunk
+            async for chunk in transactions._export_rows(
+                statement, transactions.ExportFormat.ndjson, False, claims
+            )
+        ]
+    )
+    assert [json.loads(line)["id"] for line in body.splitlines()] == list(range(1, 12))
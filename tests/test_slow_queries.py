@@ -0,0 +1,75 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from digimon import models, slow_queries
+
+
+def test_fingerprint_collapses_literals_and_lists():
+    first = slow_queries.fingerprint(
+        "SELECT * FROM items WHERE id IN ($1::INTEGER, $2::INTEGER) AND name = 'a''b'"
+    )
+    second = slow_queries.fingerprint(
+        "SELECT *  FROM items WHERE id IN ($1::INTEGER, $2::INTEGER, $3::INTEGER) AND name = 'c'"
+    )
+    assert first == second == "SELECT * FROM items WHERE id IN (...) AND name = ?"
+
+    assert slow_queries.fingerprint(
+        "INSERT INTO t (a, b) VALUES (?, ?), (?, ?)"
+    ) == "INSERT INTO t (a, b) VALUES (...)"
+
+
+def test_slow_query_log_aggregates_per_fingerprint():
+    log = slow_queries.SlowQueryLog(threshold_ms=100, sample_rate=0, max_fingerprints=2)
+    log.keep_parameters = True
+    log.record("SELECT * FROM t WHERE id = 1", (), False, 0.2)
+    log.record("SELECT * FROM t WHERE id = 2", (), False, 0.3)
+    # Fast and unsampled: not counted
+    log.record("SELECT * FROM t WHERE id = 3", (), False, 0.001)
+
+    [stats] = log.report(10).queries
+    assert stats.fingerprint == "SELECT * FROM t WHERE id = ?"
+    assert stats.count == stats.slow_count == 2
+    assert stats.max_ms == 300
+
+    log.record("SELECT 1 FROM a", (), False, 0.5)
+    log.record("SELECT 1 FROM b", (), False, 0.5)
+    assert log.dropped == 1
+
+
+def test_sampled_fast_executions_are_scaled_up(monkeypatch):
+    log = slow_queries.SlowQueryLog(threshold_ms=100, sample_rate=0.25, max_fingerprints=10)
+    monkeypatch.setattr(slow_queries.random, "random", lambda: 0.0)
+    # 400 fast executions sampled at 1 in 4 took about 4 s in all
+    for _ in range(100):
+        log.record("SELECT * FROM hot WHERE id = 1", (), False, 0.01)
+    log.record("SELECT * FROM cold WHERE id = 1", (), False, 0.5)
+    log.record("SELECT * FROM cold WHERE id = 2", (), False, 0.01)
+
+    hot, cold = log.report(10).queries
+    assert hot.fingerprint == "SELECT * FROM hot WHERE id = ?"
+    assert (hot.count, hot.slow_count) == (400, 0)
+    assert round(hot.total_ms) == 4000 and round(hot.mean_ms) == 10
+    # Slow executions are counted once, sampled fast ones four times
+    assert (cold.count, cold.slow_count) == (5, 1)
+    assert round(cold.total_ms) == 540
+
+
+@pytest.mark.asyncio
+async def test_explain_runs_on_the_engine_of_the_statement(monkeypatch, tmp_path):
+    main = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/main.db")
+    shard = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/shard.db")
+    async with shard.begin() as conn:
+        await conn.execute(text("CREATE TABLE sharded (id INTEGER PRIMARY KEY)"))
+    # The table is only on the shard, so EXPLAIN on models.engine would fail
+    monkeypatch.setattr(models, "engine", main)
+
+    log = slow_queries.SlowQueryLog(threshold_ms=100, sample_rate=0, max_fingerprints=10)
+    log.keep_parameters = True
+    log.record("SELECT * FROM sharded WHERE id = ?", (1,), False, 0.2, shard.sync_engine)
+    await log.explain(10)
+
+    [stats] = log.report(10).queries
+    assert stats.plan and "EXPLAIN failed" not in stats.plan
+    await main.dispose()
+    await shard.dispose()
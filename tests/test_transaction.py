@@ -1,3 +1,4 @@
+import json
 import pytest
 from httpx import AsyncClient
 from digimon import models
@@ -51,6 +52,7 @@ async def test_buy_item_not_customer(
 @pytest.mark.asyncio
 async def test_buy_item_not_enough_balance(
     client: AsyncClient, 
+    session: models.AsyncSession,
     token_customer: models.Token, 
     item: models.DBItem,
     customer_wallet: models.DBWallet
@@ -61,9 +63,169 @@ async def test_buy_item_not_enough_balance(
 
     # ลดยอดคงเหลือของ customer ให้ต่ำกว่าราคาสินค้า
     customer_wallet.balance = 0.0
+    session.add(customer_wallet)
+    await session.commit()
 
     response = await client.post("/buy", json=payload, headers=headers)
 
     assert response.status_code == 400  # กำหนด error code ตามความเหมาะสม
     assert response.json()["detail"] == "Not enough balance."
 
+
+@pytest.mark.asyncio
+async def test_buy_item_not_found(
+    client: AsyncClient,
+    token_customer: models.Token,
+    customer_wallet: models.DBWallet
+):
+    # ทดสอบการซื้อไอเท็มที่ไม่มีอยู่ ยอดเงินต้องไม่เปลี่ยน
+    headers = {"Authorization": f"{token_customer.token_type} {token_customer.access_token}"}
+    payload = {"item_id": 999999}
+
+    initial_customer_balance = customer_wallet.balance
+
+    response = await client.post("/buy", json=payload, headers=headers)
+
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Item not found"
+
+    updated_customer_wallet = await client.get(f"/wallets/{customer_wallet.id}", headers=headers)
+    assert updated_customer_wallet.json()["balance"] == initial_customer_balance
+
+@pytest.mark.asyncio
+async def test_buy_cart_success(
+    client: AsyncClient,
+    token_customer: models.Token,
+    item: models.DBItem,
+    customer_wallet: models.DBWallet,
+    merchant_wallet: models.DBWallet
+):
+    # ทดสอบการซื้อหลายไอเท็มในตะกร้าเดียว ตัดเงินครั้งเดียว
+    headers = {"Authorization": f"{token_customer.token_type} {token_customer.access_token}"}
+    payload = {"items": [{"item_id": item.id, "quantity": 2}, {"item_id": item.id}]}
+
+    initial_customer_balance = customer_wallet.balance
+    initial_merchant_balance = merchant_wallet.balance
+
+    response = await client.post("/buy/cart", json=payload, headers=headers)
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total"] == item.price * 3
+    assert len(data["transactions"]) == 1
+    assert data["transactions"][0]["quantity"] == 3
+
+    updated_customer_wallet = await client.get(f"/wallets/{customer_wallet.id}", headers=headers)
+    updated_merchant_wallet = await client.get(f"/wallets/{merchant_wallet.id}", headers=headers)
+
+    assert updated_customer_wallet.json()["balance"] == initial_customer_balance - item.price * 3
+    assert updated_merchant_wallet.json()["balance"] == initial_merchant_balance + item.price * 3
+
+@pytest.mark.asyncio
+async def test_export_transections_ndjson(
+    client: AsyncClient,
+    session: models.AsyncSession,
+    token_customer: models.Token,
+    token_merchant: models.Token,
+    item: models.DBItem,
+    customer_wallet: models.DBWallet
+):
+    # ทดสอบการ export รายการ transaction แบบ stream พร้อมตัวกรอง
+    headers = {"Authorization": f"{token_customer.token_type} {token_customer.access_token}"}
+    first = (await client.post("/buy", json={"item_id": item.id}, headers=headers)).json()
+    second = (await client.post("/buy", json={"item_id": item.id}, headers=headers)).json()
+    # รายการของ customer อื่นต้องไม่ติดมาด้วย
+    session.add(
+        models.DBTransection(
+            item_id=item.id, price=item.price, quantity=1,
+            merchant_id=item.merchant_id, customer_id=first["customer_id"] + 1,
+        )
+    )
+    await session.commit()
+
+    response = await client.get("/transections/export")
+    assert response.status_code == 401
+
+    response = await client.get(
+        "/transections/export",
+        params={"min_id": first["id"]},
+        headers=headers,
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["id"] for row in rows] == [first["id"], second["id"]]
+
+    response = await client.get(
+        "/transections/export",
+        params={"format": "csv", "min_id": second["id"]},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    assert response.text.splitlines()[0].startswith("id,item_id,merchant_id")
+    assert len(response.text.splitlines()) == 2
+
+    # merchant เห็นยอดขายของร้านตัวเองทั้งหมด
+    merchant_headers = {"Authorization": f"{token_merchant.token_type} {token_merchant.access_token}"}
+    response = await client.get("/transections/export", headers=merchant_headers)
+    assert len(response.text.splitlines()) == 3
+
+@pytest.mark.asyncio
+async def test_transection_history_pages(
+    client: AsyncClient,
+    token_customer: models.Token,
+    item: models.DBItem,
+    customer_wallet: models.DBWallet
+):
+    # ทดสอบประวัติการซื้อของ customer แบบ keyset เรียงจากใหม่ไปเก่า
+    headers = {"Authorization": f"{token_customer.token_type} {token_customer.access_token}"}
+    bought = []
+    for _ in range(3):
+        response = await client.post("/buy", json={"item_id": item.id}, headers=headers)
+        bought.append(response.json()["id"])
+
+    response = await client.get("/transections/history", params={"limit": 2}, headers=headers)
+    assert response.status_code == 200
+    first_page = response.json()
+    assert [t["id"] for t in first_page["transactions"]] == bought[::-1][:2]
+    assert first_page["next_cursor"]
+
+    response = await client.get(
+        "/transections/history",
+        params={"limit": 2, "cursor": first_page["next_cursor"]},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    assert bought[0] in [t["id"] for t in response.json()["transactions"]]
+
+    response = await client.get(
+        "/transections/history", params={"start": "2100-01-01T00:00:00"}, headers=headers
+    )
+    assert response.json()["transactions"] == []
+
+@pytest.mark.asyncio
+async def test_buy_item_idempotency_key_replays(
+    client: AsyncClient,
+    token_customer: models.Token,
+    item: models.DBItem,
+    customer_wallet: models.DBWallet
+):
+    # ทดสอบการส่งคำสั่งซื้อซ้ำด้วย Idempotency-Key เดิม ต้องตัดเงินครั้งเดียว
+    headers = {
+        "Authorization": f"{token_customer.token_type} {token_customer.access_token}",
+        "Idempotency-Key": "test-buy-once",
+    }
+    payload = {"item_id": item.id}
+
+    first = await client.post("/buy", json=payload, headers=headers)
+    balance = (await client.get(f"/wallets/{customer_wallet.user_id}", headers=headers)).json()["balance"]
+    second = await client.post("/buy", json=payload, headers=headers)
+
+    assert first.status_code == second.status_code == 200
+    assert second.headers["idempotent-replayed"] == "true"
+    assert second.json()["id"] == first.json()["id"]
+    assert (await client.get(f"/wallets/{customer_wallet.user_id}", headers=headers)).json()["balance"] == balance
+
+    response = await client.post("/buy", json={"item_id": item.id, "description": "other"}, headers=headers)
+    assert response.status_code == 422
@@ -16,7 +16,7 @@ async def test_read_wallets(client: AsyncClient, session: models.AsyncSession):
 @pytest.mark.asyncio
 async def test_get_wallet_by_customer_id(client: AsyncClient, session: models.AsyncSession, user1: models.DBUser):
     # เพิ่ม Wallet สำหรับทดสอบ
-    wallet = models.DBWallet(user_id=user1.id, balance=1000)
+    wallet = models.DBWallet(user_id=user1.id, role=user1.role, balance=1000)
     session.add(wallet)
     await session.commit()
     await session.refresh(wallet)
@@ -32,14 +32,14 @@ async def test_get_wallet_by_customer_id(client: AsyncClient, session: models.As
 @pytest.mark.asyncio
 async def test_update_wallet(client: AsyncClient, session: models.AsyncSession, user1: models.DBUser):
     # เพิ่ม Wallet สำหรับทดสอบ
-    wallet = models.DBWallet(user_id=user1.id, balance=1000)
+    wallet = models.DBWallet(user_id=user1.id, role=user1.role, balance=1000)
     session.add(wallet)
     await session.commit()
     await session.refresh(wallet)
     
     # ทดสอบการอัปเดต Wallet
     update_data = {"balance": 2000}
-    response = await client.put(f"/wallets/{wallet.id}", json=update_data)
+    response = await client.put(f"/wallets/{wallet.id}", params=update_data)
     
     assert response.status_code == 200
     data = response.json()
@@ -48,7 +48,7 @@ async def test_update_wallet(client: AsyncClient, session: models.AsyncSession,
 @pytest.mark.asyncio
 async def test_delete_wallet(client: AsyncClient, session: models.AsyncSession, user1: models.DBUser):
     # เพิ่ม Wallet สำหรับทดสอบ
-    wallet = models.DBWallet(user_id=user1.id, balance=1000)
+    wallet = models.DBWallet(user_id=user1.id, role=user1.role, balance=1000)
     session.add(wallet)
     await session.commit()
     await session.refresh(wallet)
@@ -61,9 +61,9 @@ async def test_delete_wallet(client: AsyncClient, session: models.AsyncSession,
     assert data["message"] == "delete success"
 
 @pytest.mark.asyncio
-async def test_add_balance(client: AsyncClient, session: models.AsyncSession, token_user1: models.Token):
+async def test_add_balance(client: AsyncClient, session: models.AsyncSession, user1: models.DBUser, token_user1: models.Token):
     # เพิ่ม Wallet สำหรับทดสอบ
-    wallet = models.DBWallet(user_id=token_user1.user_id, balance=1000)
+    wallet = models.DBWallet(user_id=user1.id, role=user1.role, balance=1000)
     session.add(wallet)
     await session.commit()
     await session.refresh(wallet)
@@ -76,3 +76,37 @@ async def test_add_balance(client: AsyncClient, session: models.AsyncSession, to
     assert response.status_code == 200
     data = response.json()
     assert data["balance"] == 1500
+
+@pytest.mark.asyncio
+async def test_ledger_balance_matches_wallet(
+    client: AsyncClient,
+    session: models.AsyncSession,
+    token_customer: models.Token,
+    item: models.DBItem,
+    customer_wallet: models.DBWallet
+):
+    # ยอดเงินจาก ledger ต้องตรงกับยอดใน wallet หลังเติมเงินและซื้อของ
+    headers = {"Authorization": f"{token_customer.token_type} {token_customer.access_token}"}
+    initial_balance = customer_wallet.balance
+
+    response = await client.put("/wallets/add", json={"balance": item.price * 2}, headers=headers)
+    assert response.status_code == 200
+    response = await client.post("/buy", json={"item_id": item.id}, headers=headers)
+    assert response.status_code == 200
+
+    response = await client.get(f"/wallets/{customer_wallet.id}/statement", headers=headers)
+    assert response.status_code == 200
+    statement = response.json()
+    assert [entry["kind"] for entry in statement["entries"]][-2:] == ["top_up", "purchase"]
+
+    response = await client.get(f"/wallets/{customer_wallet.id}/balance", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["balance"] == statement["opening_balance"] + sum(
+        entry["amount"] for entry in statement["entries"]
+    )
+    assert response.json()["seq"] == statement["entries"][-1]["seq"]
+
+    # ยอดจาก ledger ต้องเท่ากับยอดในแถว wallet
+    await session.refresh(customer_wallet)
+    assert customer_wallet.balance == initial_balance + item.price
+    assert response.json()["balance"] == customer_wallet.balance
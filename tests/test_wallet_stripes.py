@@ -0,0 +1,155 @@
+import asyncio
+import collections
+
+import pytest
+import pytest_asyncio
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel, func, select
+
+from digimon import models, purchases, sales, stripes
+
+
+MERCHANT_USER_ID = 1
+
+
+@pytest_asyncio.fixture
+async def session_factory(monkeypatch, tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/stripes.db")
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    factory = models.sessionmaker(engine, class_=models.AsyncSession, expire_on_commit=False)
+    monkeypatch.setattr(models, "engine", engine)
+    monkeypatch.setattr(models, "session_factory", factory)
+
+    async with factory() as session:
+        session.add(
+            models.DBItem(
+                id=1, name="apple", price=10.0, merchant_id=1,
+                user_id=MERCHANT_USER_ID, role=models.UserRole.merchant,
+            )
+        )
+        session.add(
+            models.DBWallet(
+                id=1, user_id=MERCHANT_USER_ID, role=models.UserRole.merchant,
+                balance=0.0, stripes=4,
+            )
+        )
+        await session.commit()
+
+    yield factory
+    await engine.dispose()
+
+
+async def buy(factory, customer_user_id: int, quantity: int = 1):
+    async with factory() as session:
+        wallet = models.DBWallet(
+            id=customer_user_id, user_id=customer_user_id,
+            role=models.UserRole.customer, balance=100.0,
+        )
+        session.add(wallet)
+        await session.commit()
+        claims = models.TokenClaims(
+            user_id=customer_user_id,
+            role=models.UserRole.customer,
+            customer_id=customer_user_id,
+            wallet_id=wallet.id,
+        )
+        await purchases.checkout_cart(
+            session, [models.CartLine(item_id=1, quantity=quantity)], claims
+        )
+        await session.commit()
+
+
+async def merchant_orders(session) -> int:
+    result = await session.exec(
+        select(func.sum(models.DBMerchantSales.orders)).where(
+            models.DBMerchantSales.granularity == models.SalesGranularity.day
+        )
+    )
+    return result.one() or 0
+
+
+def test_stripe_for_spreads_sequential_keys():
+    counts = collections.Counter(stripes.stripe_for(key, 16) for key in range(1, 1601))
+    assert sorted(counts) == list(range(16))
+    assert max(counts.values()) - min(counts.values()) < 50
+
+
+@pytest.mark.asyncio
+async def test_striped_credits_are_read_and_compacted(session_factory):
+    for customer_user_id in range(2, 8):
+        await buy(session_factory, customer_user_id)
+
+    async with session_factory() as session:
+        dbwallet = await session.get(models.DBWallet, 1)
+        # Only the stripes moved; reads add them up
+        assert (dbwallet.balance, dbwallet.ledger_seq) == (0.0, 0)
+        assert (await stripes.with_stripes(session, [dbwallet]))[0].balance == 60.0
+        assert await merchant_orders(session) == 0
+
+        # Rollups of sales still in the stripes are left to the compactor
+        await sales.rebuild_sales(session)
+        assert await merchant_orders(session) == 0
+
+        assert await stripes.compact(session) == 6
+        assert await stripes.compact(session) == 0
+
+        await session.refresh(dbwallet)
+        assert (dbwallet.balance, dbwallet.ledger_seq) == (60.0, 6)
+        assert await stripes.unfolded(session, [1]) == {1: 0.0}
+        statement = await session.exec(
+            select(models.DBLedgerEntry.seq, models.DBLedgerEntry.transaction_id)
+            .where(models.DBLedgerEntry.wallet_id == 1)
+            .order_by(models.DBLedgerEntry.seq)
+        )
+        assert statement.all() == [(seq, seq) for seq in range(1, 7)]
+        assert await merchant_orders(session) == 6
+
+        await sales.rebuild_sales(session)
+        assert await merchant_orders(session) == 6
+
+
+@pytest.mark.asyncio
+async def test_unstriping_folds_the_stripes(session_factory):
+    await buy(session_factory, 2, quantity=3)
+
+    async with session_factory() as session:
+        wallet_stripes = await stripes.set_stripes(session, 1, 0)
+        assert wallet_stripes == models.WalletStripes(wallet_id=1, stripes=0, unfolded=0.0)
+        assert await stripes.set_stripes(session, 99, 4) is None
+
+    await buy(session_factory, 3)
+    async with session_factory() as session:
+        dbwallet = await session.get(models.DBWallet, 1)
+        assert (dbwallet.balance, dbwallet.ledger_seq) == (40.0, 2)
+
+
+@pytest.mark.asyncio
+async def test_unstriping_folds_more_than_one_batch(monkeypatch, session_factory):
+    monkeypatch.setattr(stripes, "COMPACT_BATCH", 2)
+    for customer_user_id in range(2, 7):
+        await buy(session_factory, customer_user_id)
+
+    async with session_factory() as session:
+        wallet_stripes = await stripes.set_stripes(session, 1, 0)
+        assert wallet_stripes == models.WalletStripes(wallet_id=1, stripes=0, unfolded=0.0)
+        dbwallet = await session.get(models.DBWallet, 1)
+        assert (dbwallet.balance, dbwallet.ledger_seq) == (50.0, 5)
+
+
+@pytest.mark.asyncio
+async def test_compactor_survives_unexpected_errors(monkeypatch):
+    passes = 0
+
+    async def compact_all():
+        nonlocal passes
+        passes += 1
+        if passes == 1:
+            raise TypeError("unexpected")
+        if passes == 3:
+            raise asyncio.CancelledError
+
+    monkeypatch.setattr(stripes, "compact_all", compact_all)
+    with pytest.raises(asyncio.CancelledError):
+        await stripes.run_compactor(0)
+    assert passes == 3